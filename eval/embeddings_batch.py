@@ -0,0 +1,60 @@
+"""
+Throughput of masking an embeddings `input` batch in parallel (as /gateway/v1/embeddings does)
+vs masking the inputs one by one.
+
+By default the local model of promptmask.config.user.toml is used; set `[backend] replay = "replay"`
+there to benchmark recorded responses offline. `--simulate SECONDS` instead uses a fake model with a
+fixed latency, which isolates the pipeline's own overhead and concurrency.
+
+    python embeddings_batch.py [--batch 64] [--concurrency 8] [--simulate 0.2]
+"""
+import argparse
+import asyncio
+import time
+
+from promptmask import PromptMask
+from promptmask.backends import FakeBackend
+
+from token_cost import load_samples
+
+CONFIG_PATH = "promptmask.config.user.toml"
+
+async def one_by_one(pm, inputs):
+    return [await pm.async_mask_str(text, priority="batch") for text in inputs]
+
+async def run(pm, inputs, concurrency):
+    rows = []
+    for name, job in (("one by one", lambda: one_by_one(pm, inputs)),
+                      (f"parallel x{concurrency}", lambda: pm.amask_batch(inputs, concurrency))):
+        start = time.perf_counter()
+        await job()
+        elapsed = time.perf_counter() - start
+        rows.append((name, elapsed, len(inputs) / elapsed))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=64, help="inputs per embeddings request")
+    parser.add_argument("--concurrency", type=int, default=8, help="web.embeddings_mask_concurrency")
+    parser.add_argument("--simulate", type=float, default=0.0, help="fake model latency in seconds (0 = use the configured model)")
+    args = parser.parse_args()
+
+    samples, source = load_samples()
+    texts = [text for text, _ in samples]
+    # distinct inputs, so deduplication does not flatter the parallel run
+    inputs = [f"{texts[i % len(texts)]} (chunk {i})" for i in range(args.batch)]
+    if args.simulate:
+        backend = FakeBackend({value: label for _, entities in samples for label, value in entities}, delay=args.simulate)
+        pm = PromptMask(config={"llm_api": {"model": "fake", "key": "fake"}}, backend=backend)
+    else:
+        pm = PromptMask(config_file=CONFIG_PATH)
+
+    rows = asyncio.run(run(pm, inputs, args.concurrency))
+    print(f"{len(inputs)} inputs from {source}; scheduler.max_concurrency = {pm.config['scheduler'].get('max_concurrency')}")
+    print("|mode|seconds|inputs/s|")
+    print("|---|---|---|")
+    for name, elapsed, rate in rows:
+        print(f"|{name}|{elapsed:.2f}|{rate:.1f}|")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Latency and recall of the few-shot example profiles (`prompt.example_profile`).
+
+Masks the same samples under each profile with the local model of promptmask.config.user.toml and
+reports the mean prompt size, the mean and p95 masking latency, and the recall of ground-truth values
+(share of values that no longer appear in the masked text). Writes example_profiles.md next to this script.
+
+    python example_profiles.py [--limit 50] [--top-k 2]
+"""
+import argparse
+import os
+import statistics
+import time
+
+from promptmask import PromptMask
+from promptmask.backends import build_mask_prompt
+
+from token_cost import load_samples, load_counter
+
+CONFIG_PATH = "promptmask.config.user.toml"
+REPORT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "example_profiles.md")
+PROFILES = ("all", "similar", "zero_shot")
+
+def run_profile(profile, top_k, samples, count):
+    pm = PromptMask(config={"prompt": {"example_profile": profile, "example_top_k": top_k}}, config_file=CONFIG_PATH)
+    prompt_chars, prompt_tokens, latencies, found, total, errors = [], [], [], 0, 0, 0
+    for text, entities in samples:
+        prompt = "".join(m["content"] for m in build_mask_prompt(text, pm.config))
+        prompt_chars.append(len(prompt))
+        if count:
+            prompt_tokens.append(count(prompt))
+        start = time.perf_counter()
+        masked, mask_map = pm.mask_str(text)
+        latencies.append(time.perf_counter() - start)
+        errors += "err" in mask_map
+        values = {value for _, value in entities if value in text}
+        total += len(values)
+        found += sum(value not in masked for value in values)
+    return {
+        "prompt_chars": statistics.mean(prompt_chars),
+        "prompt_tokens": statistics.mean(prompt_tokens) if prompt_tokens else None,
+        "latency_mean": statistics.mean(latencies),
+        "latency_p95": sorted(latencies)[int(0.95 * (len(latencies) - 1))],
+        "recall": found / total if total else 0.0,
+        "errors": errors,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=50, help="number of samples to mask per profile")
+    parser.add_argument("--top-k", type=int, default=2, help="prompt.example_top_k for the 'similar' profile")
+    args = parser.parse_args()
+
+    samples, source = load_samples()
+    samples = samples[:args.limit]
+    encoding, count = load_counter()
+    results = {profile: run_profile(profile, args.top_k, samples, count) for profile in PROFILES}
+
+    model = PromptMask(config_file=CONFIG_PATH).config["llm_api"]["model"]
+    lines = [
+        "# Few-shot Example Profiles",
+        "",
+        f"Model: `{model}`. Samples: {source}, {len(samples)} texts. `similar` uses top_k={args.top_k}. "
+        "Generated by `eval/example_profiles.py`.",
+        "",
+        "|profile|prompt chars|" + (f"prompt tokens ({encoding})|" if count else "") + "latency mean (s)|latency p95 (s)|recall|errors|",
+        "|---|---|" + ("---|" if count else "") + "---|---|---|---|",
+    ]
+    for profile, r in results.items():
+        tokens = f"{r['prompt_tokens']:.0f}|" if count else ""
+        lines.append(f"|{profile}|{r['prompt_chars']:.0f}|{tokens}{r['latency_mean']:.2f}|{r['latency_p95']:.2f}|{r['recall']:.1%}|{r['errors']}|")
+    with open(REPORT_PATH, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    print("\n".join(lines))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Event loop lag while the gateway unmasks one very large (non-streamed) response, with the work inline
+vs offloaded to a thread or process pool. The lag is what every other in-flight stream waits.
+
+    python offload_lag.py [--mb 8] [--masks 2000]
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from promptmask.metrics import metrics
+from promptmask.web import offload
+from promptmask.web.offload import Offloader, monitor_loop_lag
+
+async def run(mode, data, mask_map):
+    offloader = Offloader()
+    web_cfg = {"offload": {"mode": mode, "threshold_bytes": 0}}
+    await offloader.run(web_cfg, 1, len, b"") # start the pool outside the measurement
+    metrics.reset()
+    monitor = asyncio.create_task(monitor_loop_lag(0.005))
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    await offloader.run(web_cfg, len(data), offload.unmask_completion, data, mask_map)
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0.05)
+    monitor.cancel()
+    offloader.shutdown()
+    lag = metrics.snapshot()["summaries"]["event_loop_lag_seconds"]
+    return elapsed, lag["max"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=8, help="response size")
+    parser.add_argument("--masks", type=int, default=2000, help="distinct masks in the mask map")
+    args = parser.parse_args()
+
+    mask_map = {f"Person {i}": f"${{USER_NAME_{i}}}" for i in range(args.masks)}
+    masks = list(mask_map.values())
+    words = [masks[i % len(masks)] if i % 10 == 0 else "lorem" for i in range(int(args.mb * 1e6 / 8))]
+    data = json.dumps({"choices": [{"message": {"role": "assistant", "content": " ".join(words)}}]}).encode()
+
+    print(f"{len(data) / 1e6:.1f} MB response, {len(mask_map)} masks")
+    print("|mode|unmask seconds|max loop lag seconds|")
+    print("|---|---|---|")
+    for mode in ("off", "thread", "process"):
+        elapsed, lag = asyncio.run(run(mode, data, mask_map))
+        print(f"|{mode}|{elapsed:.3f}|{lag:.3f}|")
+
+if __name__ == "__main__":
+    main()
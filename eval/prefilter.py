@@ -0,0 +1,78 @@
+"""
+Skip rate and recall loss of the `[prefilter]` gate, without calling any model.
+
+Every sentence of the eval dataset is checked: a sentence holding a ground-truth value that the gate
+lets skip the model is a recall loss (its values would go out unmasked). Clean dataset sentences,
+the built-in chat turns below, and optionally your own traffic (`--traffic`, one message per line)
+measure how often the model is skipped.
+
+    python prefilter.py [--max-chars 64] [--max-words 12] [--allow-capitalized] [--traffic messages.txt]
+"""
+import argparse
+import re
+
+from promptmask.prefilter import is_benign
+
+from token_cost import load_samples
+
+# typical follow-up turns that come back from the model with an empty mask map
+CHAT_TURNS = [
+    "How are you?", "continue", "Continue.", "thanks, now summarize", "Thanks!", "ok", "yes please",
+    "Can you make it shorter?", "What do you mean?", "Explain that again, more simply.", "go on",
+    "Now translate it to French.", "That's wrong, try again.", "Make it more formal.", "Sounds good.",
+    "Write it as a bullet list.", "Why?", "and then?", "Please fix the grammar.", "I don't understand.",
+]
+
+def sentences(text):
+    return [s for s in re.split(r"(?<=[.!?])\s+|\n+", text) if s.strip()]
+
+def rate(n, total):
+    return f"{n}/{total} ({n / total:.1%})" if total else "0/0"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-chars", type=int, default=64)
+    parser.add_argument("--max-words", type=int, default=12)
+    parser.add_argument("--allow-capitalized", action="store_true")
+    parser.add_argument("--traffic", help="a file of real messages, one per line")
+    args = parser.parse_args()
+    benign = lambda text: is_benign(text, args.max_chars, args.max_words, args.allow_capitalized)
+
+    samples, source = load_samples()
+    sensitive, clean, lost_values, total_values = 0, 0, [], 0
+    skipped_sensitive, skipped_clean = 0, 0
+    for text, entities in samples:
+        for sentence in sentences(text):
+            values = [value for _, value in entities if value in sentence]
+            skipped = benign(sentence)
+            if values:
+                sensitive += 1
+                total_values += len(values)
+                if skipped:
+                    skipped_sensitive += 1
+                    lost_values += values
+            else:
+                clean += 1
+                skipped_clean += skipped
+
+    rows = [
+        (f"dataset sentences with sensitive values ({source})", rate(skipped_sensitive, sensitive)),
+        ("dataset sentences without sensitive values", rate(skipped_clean, clean)),
+        ("built-in chat turns", rate(sum(map(benign, CHAT_TURNS)), len(CHAT_TURNS))),
+    ]
+    if args.traffic:
+        with open(args.traffic) as f:
+            traffic = [line.rstrip("\n") for line in f if line.strip()]
+        rows.append((f"traffic ({args.traffic})", rate(sum(map(benign, traffic)), len(traffic))))
+
+    print(f"max_chars = {args.max_chars}, max_words = {args.max_words}, allow_capitalized = {args.allow_capitalized}")
+    print("|texts|skipped the model|")
+    print("|---|---|")
+    for name, value in rows:
+        print(f"|{name}|{value}|")
+    print(f"\nrecall loss: {rate(len(lost_values), total_values)} ground-truth values in skipped sentences")
+    for value in lost_values[:20]:
+        print(f"  missed: {value!r}")
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,6 @@ from promptmask import PromptMask
 
 import os.path
 import json
-from concurrent.futures import ThreadPoolExecutor
 
 import httpx
 from icecream import ic
@@ -11,7 +10,7 @@ from tqdm import tqdm
 from util import tomllib, mkdirp, prepare_dataset, fpath_sanitize, fn_timer, TOTAL_LINES, RAW_RESULT_DIR, DATASET_DIR
 
 CONFIG_PATH = "promptmask.config.batch-ollama.toml"
-BATCH_SIZE = 1
+BATCH_SIZE = 1 # masking calls in flight at once
 
 prepare_pm = lambda model="": PromptMask(config={"llm_api":{"model":model}}, config_file=CONFIG_PATH)
 def get_model_list():
@@ -43,19 +42,10 @@ def main():
         with open(eval_result_path, 'a+') as f, tqdm(total=TOTAL_LINES, initial=eval_result_len, desc=f"Masking for {model}") as pbar:
             for i in range(eval_result_len, TOTAL_LINES, BATCH_SIZE):
                 batch_texts = src_txts[i : i + BATCH_SIZE]
-                
-                num_workers = min(BATCH_SIZE, len(batch_texts))
-                
-                results = []
-                with ThreadPoolExecutor(max_workers=num_workers) as executor:
-                    futures = [executor.submit(pm.mask_str, text) for text in batch_texts]
-                    
-                    for future in futures:
-                        masked_text, mask_map = future.result()
-                        results.append({"masked_text": masked_text, "mask_map": mask_map})
+                results = pm.mask_batch(batch_texts, concurrency=BATCH_SIZE)
 
-                for res in results:
-                    json.dump(res, f)
+                for masked_text, mask_map in results:
+                    json.dump({"masked_text": masked_text, "mask_map": mask_map}, f)
                     f.write('\n')
                 
                 pbar.update(len(results))
@@ -1,4 +1,5 @@
 from promptmask import PromptMask
+from promptmask.metrics import metrics
 
 import os.path
 import json
@@ -31,5 +32,9 @@ def main():
             json.dump({"masked_text":masked_text, "mask_map":mask_map},f)
             f.write('\n')
 
+    counters = metrics.snapshot()["counters"]
+    if counters.get("prefilter_checked_total"): # [prefilter] enabled: s2_eval_result.py then scores its recall loss
+        print(f"prefilter skipped the model for {counters.get('prefilter_skipped_total', 0):.0f} of {counters['prefilter_checked_total']:.0f} texts")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
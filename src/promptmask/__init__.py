@@ -4,6 +4,7 @@
 A local-first privacy layer for Large Language Model users.
 """
 from .core import PromptMask
+from .maskmap import MaskMap
 from .adapter.openai import OpenAIMasked
 
-__all__ = ["PromptMask", "OpenAIMasked"]
\ No newline at end of file
+__all__ = ["PromptMask", "MaskMap", "OpenAIMasked"]
\ No newline at end of file
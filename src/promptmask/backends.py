@@ -0,0 +1,426 @@
+# src/promptmask/backends.py
+
+import asyncio
+import json
+import os
+import string
+import threading
+import time
+from typing import Dict, List, Mapping, NamedTuple, Optional, Protocol, Tuple
+
+from openai import APITimeoutError, BadRequestError, UnprocessableEntityError
+
+from .examples import select_examples
+from .metrics import metrics
+from .pool import Endpoint, EndpointPool, HedgePolicy
+from .utils import _btwn, logger, is_dict_str_str, flatten_dict
+
+class Entity(NamedTuple):
+    """A piece of sensitive data found in a text, and the name of its mask (without the mask wrapper)."""
+    value: str
+    label: str
+
+class DetectionError(Exception):
+    """The backend ran but produced no usable result; masking reports it as `{"err": reason}`."""
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+class DetectionTimeout(DetectionError):
+    """The backend did not answer in time."""
+
+class MaskBackend(Protocol):
+    """
+    Finds the sensitive data in a text. Selected by `backend.name` in the config.
+    `signature` identifies the model behind the backend: latency statistics and warm-up
+    are kept across config reloads as long as it is unchanged.
+    """
+    signature: Tuple
+
+    def detect(self, text: str) -> List[Entity]: ...
+
+    async def adetect(self, text: str) -> List[Entity]: ...
+
+    async def warm_up(self) -> None: ...
+
+# --- Prompting, shared by the LLM backends ---
+
+STRUCTURED_OUTPUT_MODES = ("off", "json_schema", "grammar")
+
+# What the masking model must answer: a flat JSON object of mask name -> original value
+MASK_MAP_SCHEMA = {"type": "object", "additionalProperties": {"type": "string"}}
+
+# The same as a llama.cpp GBNF grammar. Whitespace is limited so the model cannot pad forever.
+MASK_MAP_GBNF = r"""
+root   ::= "{" ws ( pair ( "," ws pair )* )? ws "}"
+pair   ::= string ws ":" ws string
+string ::= "\"" char* "\""
+char   ::= [^"\\\x00-\x1f] | "\\" ( ["\\/bfnrt] | "u" hex hex hex hex )
+hex    ::= [0-9a-fA-F]
+ws     ::= [ \n]?
+"""
+
+class CompiledPrompt(NamedTuple):
+    """The parts of the masking prompt that only depend on the config, rendered once per config."""
+    system: Dict[str, str]
+    examples: List[Dict[str, str]]
+    user_template: string.Template
+
+# id(config) -> (config, compiled): a config (or profile) is compiled once while it is published
+_compiled_prompts: Dict[int, Tuple[dict, CompiledPrompt]] = {}
+_COMPILED_PROMPTS_MAX = 64
+_compiled_prompts_lock = threading.Lock()
+
+def compile_prompt(cfg: dict) -> CompiledPrompt:
+    """Renders the system prompt and few-shot examples of `cfg`, cached for as long as the same config dict is used."""
+    cached = _compiled_prompts.get(id(cfg))
+    if cached is not None and cached[0] is cfg:
+        return cached[1]
+    wrapper = {"mask_left": cfg["mask_wrapper"]["left"], "mask_right": cfg["mask_wrapper"]["right"]}
+    sys_inst = string.Template(cfg["prompt"]["system_template"]).safe_substitute(
+        sensitive_include=cfg["sensitive"]["include"],
+        sensitive_exclude=cfg["sensitive"]["exclude"],
+        **wrapper,
+    )
+    compiled = CompiledPrompt(
+        {"role": "system", "content": sys_inst},
+        [{"role": ex["role"], "content": string.Template(ex["content"]).safe_substitute(**wrapper)}
+         for ex in cfg["prompt"]["examples"]],
+        string.Template(cfg["prompt"]["user_template"]),
+    )
+    with _compiled_prompts_lock:
+        if len(_compiled_prompts) >= _COMPILED_PROMPTS_MAX: # old configs after many reloads
+            _compiled_prompts.pop(next(iter(_compiled_prompts)))
+        _compiled_prompts[id(cfg)] = (cfg, compiled)
+    return compiled
+
+def build_mask_prompt(text: str, cfg: dict) -> List[Dict[str, str]]:
+    """
+    Constructs the full prompt for the local masking LLM.
+    Few-shot examples follow `prompt.example_profile` (see `examples.select_examples`).
+    Model-specific tweaks are applied per model by `for_model` at dispatch time.
+    The system and example messages are shared between calls: treat them as read-only.
+    """
+    compiled = compile_prompt(cfg)
+    messages = [compiled.system]
+    messages.extend(select_examples(text, compiled.examples,
+                                    cfg["prompt"].get("example_profile", "all"), cfg["prompt"].get("example_top_k", 2)))
+    messages.append({"role": "user", "content": compiled.user_template.safe_substitute(text_to_mask=text)})
+    return messages
+
+def for_model(messages: List[Dict[str, str]], model: str, cfg: dict) -> List[Dict[str, str]]:
+    """Applies model-specific prompt tweaks (e.g. disabling thinking on dual-mode models)."""
+    if not any(k in model.lower() for k in cfg["model_specific"]["dual_models"]):
+        return messages
+    system = {**messages[0], "content": cfg["model_specific"]["dual_metaprompt"] + messages[0]["content"]}
+    return [system] + messages[1:]
+
+def parse_mask_response(response_content: str, cfg: dict) -> List[Entity]:
+    """Parses the local LLM response (a JSON object of mask -> value) into entities."""
+    try:
+        json_str = _btwn(response_content, "{", "}")
+        logger.debug(f"json_str:: {json_str}")
+        reversed_map = flatten_dict(json.loads(json_str))
+        if not is_dict_str_str(reversed_map):
+            raise TypeError("Mask map should be a dictionary mapping strings to strings.")
+    except (ValueError, json.JSONDecodeError, TypeError) as e:
+        logger.error(f"Failed to parse mask response: {e}\nResponse: {response_content}")
+        raise DetectionError(type(e).__name__) from e
+
+    left, right = cfg["mask_wrapper"]["left"], cfg["mask_wrapper"]["right"]
+    entities = []
+    for mask, value in reversed_map.items():
+        if len(value) <= 3: # too short to be meaningful, and would corrupt unrelated words
+            continue
+        if mask.startswith(left) and mask.endswith(right) and len(mask) > len(left) + len(right):
+            mask = mask[len(left):len(mask) - len(right)]
+        entities.append(Entity(value, mask))
+    return entities
+
+# --- Backends ---
+
+class OpenAIBackend:
+    """
+    The default backend: prompts the local LLM(s) over the OpenAI-compatible chat completions API,
+    balanced over an endpoint pool, with optional hedging (see `promptmask.pool`).
+    """
+    def __init__(self, config: dict, pool: EndpointPool, hedge: HedgePolicy):
+        self.config, self.pool, self.hedge = config, pool, hedge
+        self.signature = tuple((ep.base, ep.model) for ep in pool.endpoints)
+
+    def detect(self, text: str) -> List[Entity]:
+        return parse_mask_response(self.chat(build_mask_prompt(text, self.config)), self.config)
+
+    async def adetect(self, text: str) -> List[Entity]:
+        return parse_mask_response(await self.achat(build_mask_prompt(text, self.config)), self.config)
+
+    # the raw prompt -> response step of the LLM backends (see `promptmask.replay`)
+    def complete(self, messages: List[Dict[str, str]]) -> str:
+        return self.chat(messages)
+
+    async def acomplete(self, messages: List[Dict[str, str]]) -> str:
+        return await self.achat(messages)
+
+    def _structured(self, ep: Endpoint) -> Dict:
+        """Request options that constrain the answer to a mask map (`backend.structured_output`), unless `ep` rejected them."""
+        mode = self.config["backend"].get("structured_output", "off")
+        if mode == "off" or mode in ep.unsupported:
+            return {}
+        if mode == "json_schema":
+            return {"response_format": {"type": "json_schema", "json_schema": {"name": "mask_mapping", "schema": MASK_MAP_SCHEMA}}}
+        return {"extra_body": {"grammar": MASK_MAP_GBNF}} # llama.cpp server; other servers ignore it
+
+    @staticmethod
+    def _names_structured(e: Exception) -> bool:
+        """True if the error message blames the structured output options themselves."""
+        text = f"{e} {getattr(e, 'body', '')}".lower()
+        return any(word in text for word in ("response_format", "json_schema", "grammar"))
+
+    def _unsupported(self, ep: Endpoint, e: Exception):
+        mode = self.config["backend"].get("structured_output", "off")
+        logger.warning(f"{ep.base} rejected structured output ({mode}), falling back to free-form answers: {e}")
+        metrics.inc("structured_output_fallback_total", labels={"endpoint": ep.base, "mode": mode})
+        ep.unsupported.add(mode)
+
+    def chat(self, messages: List[Dict[str, str]]) -> str:
+        try:
+            with self.pool.track(self.pool.pick()) as ep:
+                create = lambda **options: ep.client.chat.completions.create(
+                    model=ep.model,
+                    messages=for_model(messages, ep.model, self.config),
+                    temperature=0.0,
+                    **options,
+                )
+                options = self._structured(ep)
+                try:
+                    completion = create(**options)
+                except (BadRequestError, UnprocessableEntityError) as e:
+                    if not options:
+                        raise
+                    # an unrelated 400 (context length, unknown model) fails again without the options:
+                    # only turn them off if the error names them or the retry without them succeeds
+                    named = self._names_structured(e)
+                    if named:
+                        self._unsupported(ep, e)
+                    completion = create()
+                    if not named:
+                        self._unsupported(ep, e)
+            return completion.choices[0].message.content
+        except APITimeoutError as e:
+            raise DetectionTimeout(type(e).__name__) from e
+
+    async def achat(self, messages: List[Dict[str, str]]) -> str:
+        try:
+            if self.config["llm_api"].get("hedge") and len(self.pool.endpoints) > 1:
+                return await self._hedged_chat(messages)
+            return await self.chat_on(self.pool.pick(), messages)
+        except APITimeoutError as e:
+            raise DetectionTimeout(type(e).__name__) from e
+
+    async def chat_on(self, ep: Endpoint, messages: List[Dict[str, str]]) -> str:
+        with self.pool.track(ep):
+            create = lambda **options: ep.async_client.chat.completions.create(
+                model=ep.model,
+                messages=for_model(messages, ep.model, self.config),
+                temperature=0.0,
+                **options,
+            )
+            options = self._structured(ep)
+            try:
+                completion = await create(**options)
+            except (BadRequestError, UnprocessableEntityError) as e:
+                if not options:
+                    raise
+                named = self._names_structured(e)
+                if named:
+                    self._unsupported(ep, e)
+                completion = await create()
+                if not named:
+                    self._unsupported(ep, e)
+        return completion.choices[0].message.content
+
+    async def _hedged_chat(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Sends the call to one endpoint and, if it has not finished within the hedge delay,
+        a duplicate to another endpoint. The first success wins; the other call is cancelled.
+        """
+        start = time.perf_counter()
+        self.hedge.on_request()
+        primary = self.pool.pick()
+        tasks = [asyncio.ensure_future(self.chat_on(primary, messages))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge.delay())
+            if not done and self.hedge.try_acquire():
+                backup = self.pool.pick(exclude=[primary])
+                metrics.inc("hedge_sent_total")
+                logger.debug(f"Hedging slow masking call on {primary.base} to {backup.base}")
+                tasks.append(asyncio.ensure_future(self.chat_on(backup, messages)))
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in done if not t.cancelled() and t.exception() is None), None)
+                if winner is not None:
+                    if winner is not tasks[0]:
+                        metrics.inc("hedge_won_total")
+                    self.hedge.observe(time.perf_counter() - start)
+                    return winner.result()
+            return tasks[0].result() # every attempt failed: surface the primary's error
+        finally:
+            for t in tasks:
+                if not t.done():
+                    t.cancel() # the loser's HTTP request is aborted with it
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def warm_up(self):
+        """
+        Sends the static prompt prefix (system prompt and few-shot examples) to every available endpoint,
+        so the model is loaded and the server's prompt/KV cache is primed. Raises if no endpoint responds.
+        """
+        messages = build_mask_prompt("", self.config)
+        timeout = self.config["llm_api"].get("warmup_timeout", 120.0)
+
+        async def warm(ep: Endpoint):
+            # bypasses `track`: a cold first call must not count against the endpoint's latency
+            await ep.async_client.with_options(timeout=timeout).chat.completions.create(
+                model=ep.model,
+                messages=for_model(messages, ep.model, self.config),
+                temperature=0.0,
+                max_tokens=1,
+            )
+
+        endpoints = [ep for ep in self.pool.endpoints if ep.available] or list(self.pool.endpoints)
+        results = await asyncio.gather(*(warm(ep) for ep in endpoints), return_exceptions=True)
+        for ep, result in zip(endpoints, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Warm-up of {ep.model} at {ep.base} failed: {result}")
+        if all(isinstance(result, Exception) for result in results):
+            raise results[0]
+
+class LlamaCppBackend:
+    """
+    In-process backend: runs a GGUF model with llama-cpp-python (`pip install "promptmask[llama]"`),
+    with no inference server, HTTP round trip or response models in between.
+    The model is loaded on first use (or by the warm-up) and kept across config reloads while
+    `backend.model_path` and the context settings are unchanged. Calls are serialized because a
+    llama.cpp context evaluates one sequence at a time; async calls run in a worker thread.
+    """
+    def __init__(self, config: dict, prev: Optional["LlamaCppBackend"] = None):
+        self.config = config
+        backend_cfg = config["backend"]
+        self.model_path = backend_cfg.get("model_path", "")
+        if not self.model_path:
+            raise ValueError("backend.model_path must point to a GGUF model file for the llama_cpp backend.")
+        self.signature = ("llama_cpp", self.model_path, backend_cfg.get("n_ctx", 8192),
+                          backend_cfg.get("n_threads", 0), backend_cfg.get("n_gpu_layers", 0))
+        reuse = prev if isinstance(prev, LlamaCppBackend) and prev.signature == self.signature else None
+        self._llm = reuse._llm if reuse else None
+        self._lock = reuse._lock if reuse else threading.Lock()
+        self._grammar = reuse._grammar if reuse else None
+
+    def _model(self):
+        if self._llm is None:
+            try:
+                from llama_cpp import Llama
+            except ImportError as e:
+                raise ImportError("The llama_cpp backend requires llama-cpp-python: pip install \"promptmask[llama]\"") from e
+            _, path, n_ctx, n_threads, n_gpu_layers = self.signature
+            logger.info(f"Loading in-process masking model {path}...")
+            self._llm = Llama(model_path=path, n_ctx=n_ctx, n_threads=n_threads or None,
+                              n_gpu_layers=n_gpu_layers, verbose=False)
+        return self._llm
+
+    def _structured(self) -> Dict:
+        """Constrains sampling to a mask map (`backend.structured_output`); llama-cpp-python supports both modes."""
+        mode = self.config["backend"].get("structured_output", "off")
+        if mode == "json_schema":
+            return {"response_format": {"type": "json_object", "schema": MASK_MAP_SCHEMA}}
+        if mode == "grammar":
+            if self._grammar is None:
+                from llama_cpp import LlamaGrammar
+                self._grammar = LlamaGrammar.from_string(MASK_MAP_GBNF, verbose=False)
+            return {"grammar": self._grammar}
+        return {}
+
+    def complete(self, messages: List[Dict[str, str]], max_tokens: Optional[int] = None) -> str:
+        model_name = os.path.basename(self.model_path)
+        with self._lock:
+            completion = self._model().create_chat_completion(
+                messages=for_model(messages, model_name, self.config),
+                temperature=0.0,
+                max_tokens=max_tokens,
+                **(self._structured() if max_tokens is None else {}), # not for the warm-up's single token
+            )
+        return completion["choices"][0]["message"]["content"]
+
+    async def acomplete(self, messages: List[Dict[str, str]]) -> str:
+        return await asyncio.get_running_loop().run_in_executor(None, self.complete, messages)
+
+    def detect(self, text: str) -> List[Entity]:
+        return parse_mask_response(self.complete(build_mask_prompt(text, self.config)), self.config)
+
+    async def adetect(self, text: str) -> List[Entity]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.detect, text)
+
+    async def warm_up(self):
+        """Loads the model and evaluates the static prompt prefix, which llama.cpp reuses for the next call."""
+        messages = build_mask_prompt("", self.config)
+        await asyncio.get_running_loop().run_in_executor(None, self.complete, messages, 1)
+
+class FakeBackend:
+    """
+    A deterministic backend for tests: reports every known value (`entities`: value -> label) found in the text.
+    `delay` simulates model latency, `error` makes every detection fail with that reason,
+    and `calls` records the texts it was asked about.
+    """
+    signature = ("fake",)
+
+    def __init__(self, entities: Optional[Mapping[str, str]] = None, delay: float = 0.0, error: Optional[str] = None):
+        self.entities = dict(entities or {})
+        self.delay, self.error = delay, error
+        self.calls: List[str] = []
+
+    def _find(self, text: str) -> List[Entity]:
+        if self.error:
+            raise DetectionError(self.error)
+        return [Entity(value, label) for value, label in self.entities.items() if value in text]
+
+    def detect(self, text: str) -> List[Entity]:
+        self.calls.append(text)
+        if self.delay:
+            time.sleep(self.delay)
+        return self._find(text)
+
+    async def adetect(self, text: str) -> List[Entity]:
+        self.calls.append(text)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self._find(text)
+
+    async def warm_up(self):
+        pass
+
+def create_backend(config: dict, pool: EndpointPool, hedge: HedgePolicy, prev: Optional[MaskBackend] = None) -> MaskBackend:
+    """
+    Builds the backend named by `backend.name` ("openai" or "llama_cpp"),
+    wrapped for recording or replaying its responses when `backend.replay` is set.
+    """
+    backend_cfg = config.get("backend", {})
+    if backend_cfg.get("structured_output", "off") not in STRUCTURED_OUTPUT_MODES:
+        raise ValueError(f"Unknown backend.structured_output {backend_cfg['structured_output']!r}, expected one of {STRUCTURED_OUTPUT_MODES}.")
+    replay = backend_cfg.get("replay", "off")
+    if replay == "off":
+        return _create_model_backend(config, pool, hedge, prev)
+    from .replay import MODES, ReplayBackend # imports this module
+    if replay not in MODES:
+        raise ValueError(f"Unknown backend.replay mode {replay!r}, expected one of {MODES}.")
+    inner = None if replay == "replay" else _create_model_backend(config, pool, hedge, getattr(prev, "inner", prev))
+    return ReplayBackend(config, inner, prev)
+
+def _create_model_backend(config: dict, pool: EndpointPool, hedge: HedgePolicy, prev: Optional[MaskBackend]) -> MaskBackend:
+    name = config.get("backend", {}).get("name", "openai")
+    if name == "openai":
+        return OpenAIBackend(config, pool, hedge)
+    if name == "llama_cpp":
+        return LlamaCppBackend(config, prev)
+    raise ValueError(f"Unknown masking backend {name!r}, expected 'openai' or 'llama_cpp'.")
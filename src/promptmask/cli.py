@@ -0,0 +1,229 @@
+# src/promptmask/cli.py
+
+"""
+Command line interface.
+
+    promptmask mask-file logs.jsonl -o logs.masked.jsonl --field '$.message'
+
+Input is streamed through a bounded async pipeline: at most `--concurrency` masking calls run at once
+and at most a few windows of lines are held in memory, so memory use does not grow with the file size.
+Output lines (and one sidecar mask-map line per input line) are written in input order.
+Lines that cannot be parsed are left out of the output (never written unmasked) and reported, with
+their line number, in the log and the sidecar map.
+A checkpoint file records how far the output got, so an interrupted run continues with `--resume`.
+"""
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+from pathlib import Path
+from typing import Any, BinaryIO, Iterator, List, Optional, Tuple, Union
+
+from .core import PromptMask, BATCH_RETRY_DELAY, BATCH_RETRY_MAX_DELAY
+from .scheduler import QueueFullError
+from .utils import logger
+
+CHECKPOINT_EVERY = 100 # lines
+
+def parse_json_path(path: str) -> List[Union[str, int]]:
+    """Parses `$.a.b[0].c` or `a.b.0.c` into ["a", "b", 0, "c"]."""
+    path = path.strip()
+    if path.startswith("$"):
+        path = path[1:]
+    keys: List[Union[str, int]] = []
+    for token in re.findall(r"\[(\d+)\]|\[['\"]([^'\"]+)['\"]\]|([^.\[\]]+)", path):
+        index, quoted, name = token
+        if index:
+            keys.append(int(index))
+        elif quoted:
+            keys.append(quoted)
+        else:
+            keys.append(int(name) if name.isdigit() else name)
+    return keys
+
+def _get_path(obj: Any, keys: List[Union[str, int]]) -> Any:
+    for key in keys:
+        obj = obj[key]
+    return obj
+
+def _set_path(obj: Any, keys: List[Union[str, int]], value: Any):
+    _get_path(obj, keys[:-1])[keys[-1]] = value
+
+def _iter_lines(f: BinaryIO, offset: int) -> Iterator[Tuple[bytes, int]]:
+    """Yields (line, offset after the line); offsets let a checkpoint resume reading mid-file."""
+    for line in f:
+        offset += len(line)
+        yield line, offset
+
+class InvalidLine(ValueError):
+    """A line that cannot be decoded or parsed; it is skipped instead of ending the run."""
+
+def _write_checkpoint(path: Path, state: dict):
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(state))
+    os.replace(tmp, path) # atomic, so a crash never leaves a torn checkpoint
+
+async def mask_file(prompt_masker: PromptMask, input_path: str, output_path: str, map_path: Optional[str] = None,
+                    fmt: str = "auto", field: str = "", concurrency: int = 4, resume: bool = False) -> dict:
+    """
+    Masks a JSONL/NDJSON or plain-text file line by line. Returns run statistics.
+    For JSONL, only the string at `field` (a JSON path) is masked; lines without it pass through.
+    """
+    if fmt == "auto":
+        fmt = "jsonl" if input_path.endswith((".jsonl", ".ndjson")) else "text"
+    keys = parse_json_path(field) if fmt == "jsonl" else []
+    if fmt == "jsonl" and not keys:
+        raise ValueError("--field is required for JSONL input, e.g. --field '$.text'")
+    use_stdin, use_stdout = input_path == "-", output_path == "-"
+    map_path = map_path or (None if use_stdout else output_path + ".map.jsonl")
+    ckpt_path = None if use_stdout else Path(output_path + ".ckpt")
+
+    state = {"lines": 0, "input_offset": 0, "output_offset": 0, "map_offset": 0}
+    if resume:
+        if use_stdin or not ckpt_path:
+            raise ValueError("--resume needs file input and output.")
+        if ckpt_path.exists():
+            state = json.loads(ckpt_path.read_text())
+            logger.info(f"Resuming after line {state['lines']}.")
+
+    fin = sys.stdin.buffer if use_stdin else open(input_path, "rb")
+    fout = sys.stdout.buffer if use_stdout else open(output_path, "r+b" if resume and state["lines"] else "wb")
+    fmap = open(map_path, "r+b" if resume and state["lines"] else "wb") if map_path else None
+    if state["lines"]: # drop anything written after the last checkpoint
+        fin.seek(state["input_offset"])
+        fout.seek(state["output_offset"]); fout.truncate()
+        if fmap:
+            fmap.seek(state["map_offset"]); fmap.truncate()
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, concurrency) * 4) # bounds lines held in memory
+    stats = {"lines": state["lines"], "masked": 0, "fallback": 0, "skipped": 0, "invalid": 0}
+
+    async def mask_line(raw: bytes) -> Tuple[bytes, dict, Optional[str]]:
+        try:
+            line = raw.decode("utf-8").rstrip("\r\n")
+        except UnicodeDecodeError as e:
+            raise InvalidLine(f"not UTF-8 ({e})")
+        if fmt == "jsonl":
+            if not line.strip():
+                return raw, {}, None
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise InvalidLine(f"invalid JSON ({e})")
+            try:
+                text = _get_path(record, keys)
+            except (KeyError, IndexError, TypeError):
+                text = None
+            if not isinstance(text, str):
+                stats["skipped"] += 1
+                return raw, {}, None
+        else:
+            text = line
+        async with semaphore:
+            delay = BATCH_RETRY_DELAY
+            while True:
+                try:
+                    masked_text, mask_map = await prompt_masker.async_mask_str(text, priority="batch")
+                    break
+                except QueueFullError: # the local LLM is saturated: wait rather than end the run
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, BATCH_RETRY_MAX_DELAY)
+        fallback = None
+        if "err" in mask_map: # never write the unmasked value; degrade to regex redaction
+            masked_text, mask_map = prompt_masker.rule_mask_str(text)
+            fallback = "rules"
+        if fmt == "jsonl":
+            _set_path(record, keys, masked_text)
+            masked_text = json.dumps(record, ensure_ascii=False)
+        return (masked_text + "\n").encode("utf-8"), mask_map, fallback
+
+    async def reader():
+        try:
+            for raw, end_offset in _iter_lines(fin, state["input_offset"]):
+                await queue.put((asyncio.ensure_future(mask_line(raw)), end_offset))
+        finally:
+            await queue.put(None)
+
+    reader_task = asyncio.ensure_future(reader())
+    started = time.perf_counter()
+    try:
+        while (item := await queue.get()) is not None:
+            task, end_offset = item
+            try:
+                out, mask_map, fallback = await task
+            except InvalidLine as e:
+                logger.warning(f"Line {stats['lines'] + 1}: {e}; left out of the output.")
+                mask_map, fallback = {}, None
+                stats["invalid"] += 1
+                error = str(e)
+            else:
+                fout.write(out)
+                error = None
+            if fmap:
+                entry = {"line": stats["lines"] + 1, "mask_map": mask_map}
+                if fallback:
+                    entry["fallback"] = fallback
+                if error:
+                    entry["error"] = error
+                fmap.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+            stats["lines"] += 1
+            stats["masked"] += bool(mask_map)
+            stats["fallback"] += bool(fallback)
+            if ckpt_path and stats["lines"] % CHECKPOINT_EVERY == 0:
+                fout.flush()
+                if fmap:
+                    fmap.flush()
+                _write_checkpoint(ckpt_path, {"lines": stats["lines"], "input_offset": end_offset,
+                                              "output_offset": fout.tell(), "map_offset": fmap.tell() if fmap else 0})
+                logger.info(f"{stats['lines']} lines masked ({stats['lines'] / (time.perf_counter() - started):.1f} lines/s)")
+        await reader_task
+        if ckpt_path and ckpt_path.exists():
+            ckpt_path.unlink() # finished: nothing to resume
+    finally:
+        if not reader_task.done():
+            reader_task.cancel()
+        while not queue.empty(): # cancel masking of lines that will not be written
+            item = queue.get_nowait()
+            if item:
+                item[0].cancel()
+        fout.flush()
+        for f in (fin, fout, fmap):
+            if f and f not in (sys.stdin.buffer, sys.stdout.buffer):
+                f.close()
+    return stats
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="promptmask", description="PromptMask command line tools.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    mf = sub.add_parser("mask-file", help="Mask a JSONL/NDJSON or line-delimited text file, streaming.")
+    mf.add_argument("input", help="Input file, or '-' for stdin.")
+    mf.add_argument("-o", "--output", default="-", help="Output file (default: stdout).")
+    mf.add_argument("--map-file", help="Sidecar mask map JSONL (default: <output>.map.jsonl).")
+    mf.add_argument("--format", choices=["auto", "jsonl", "text"], default="auto", help="Input format (default: by file extension).")
+    mf.add_argument("--field", default="", help="JSON path of the string to mask in each JSONL record, e.g. '$.messages[0].content'.")
+    mf.add_argument("-c", "--concurrency", type=int, default=4, help="Masking calls in flight (default: 4).")
+    mf.add_argument("--resume", action="store_true", help="Continue an interrupted run from its checkpoint.")
+    mf.add_argument("--config", default="", help="PromptMask TOML config file.")
+    return parser
+
+def main(argv: Optional[List[str]] = None):
+    """Entry point of the `promptmask` console script."""
+    args = _build_parser().parse_args(argv)
+    if args.command == "mask-file":
+        prompt_masker = PromptMask(config_file=args.config)
+        try:
+            stats = asyncio.run(mask_file(
+                prompt_masker, args.input, args.output, args.map_file,
+                args.format, args.field, args.concurrency, args.resume,
+            ))
+        finally:
+            prompt_masker.close()
+        logger.info(f"Done: {stats}")
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
 # src/promptmask/config.py
 
 import os
+import copy
 import string
+import threading
+from functools import lru_cache
 from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from .utils import tomllib, merge_configs, logger
 
 import importlib.resources as pkg_resources
@@ -13,6 +17,49 @@ PKG_NAME = "promptmask"
 
 _is_verbose  = lambda config:config.get("general", {}).get("verbose")
 
+# path -> ((mtime_ns, size), parsed toml)
+_toml_cache: Dict[str, Tuple[Tuple[int, int], dict]] = {}
+_toml_cache_lock = threading.Lock()
+
+@lru_cache(maxsize=1)
+def _load_default_config() -> dict:
+    """Parses the packaged default config once per process."""
+    try: #py3.9+
+        config_path = pkg_resources.files(PKG_NAME).joinpath(DEFAULT_CONFIG_FILENAME)
+        config_text = config_path.read_text(encoding='utf-8')
+    except AttributeError: #py38
+        with pkg_resources.open_text(PKG_NAME, DEFAULT_CONFIG_FILENAME, encoding='utf-8') as f:
+            config_text = f.read()
+    return tomllib.loads(config_text)
+
+def _file_signature(path: Path) -> Tuple[int, int]:
+    st = path.stat()
+    return st.st_mtime_ns, st.st_size
+
+def _load_toml_file(path: Path) -> dict:
+    """
+    Loads a TOML file, re-parsing it only when its mtime or size has changed.
+    A deep copy is returned because `merge_configs` mutates its base in place.
+    """
+    key = str(path.resolve())
+    signature = _file_signature(path)
+    with _toml_cache_lock:
+        cached = _toml_cache.get(key)
+        if cached and cached[0] == signature:
+            return copy.deepcopy(cached[1])
+    with open(path, "rb") as f:
+        parsed = tomllib.load(f)
+    with _toml_cache_lock:
+        _toml_cache[key] = (signature, parsed)
+    return copy.deepcopy(parsed)
+
+def config_source_paths(config_file: str = "") -> List[Path]:
+    """Returns the on-disk config files `load_config` reads, in merge order."""
+    paths = [Path.cwd() / USER_CONFIG_FILENAME]
+    if config_file:
+        paths.append(Path(config_file))
+    return paths
+
 def load_config(config_override = {}, config_file: str = "") -> dict:
     """
     Loads configuration with a clear priority order.
@@ -23,52 +70,168 @@ def load_config(config_override = {}, config_file: str = "") -> dict:
     4. Default config file packaged with the library.
     """
     # priority 4
-    # default_config_path = Path(__file__).parent / DEFAULT_CONFIG_FILENAME
-    try: #py3.9+
-        config_path = pkg_resources.files(PKG_NAME).joinpath(DEFAULT_CONFIG_FILENAME)
-        config_text = config_path.read_text(encoding='utf-8')
-    except AttributeError: #py38
-        with pkg_resources.open_text(PKG_NAME, DEFAULT_CONFIG_FILENAME, encoding='utf-8') as f:
-            config_text = f.read()
-    config = tomllib.loads(config_text)
+    config = copy.deepcopy(_load_default_config())
     if _is_verbose(config):
-        logger.info(f"Loaded default config from {default_config_path}")
+        logger.info(f"Loaded default config from package {PKG_NAME}/{DEFAULT_CONFIG_FILENAME}")
 
     # 3. Load user config if it exists
     user_config_path = Path.cwd() / USER_CONFIG_FILENAME
     if user_config_path.exists():
-        with open(user_config_path, "rb") as f:
-            user_config = tomllib.load(f)
-            config = merge_configs(config, user_config)
-            if _is_verbose(config):
-                logger.info(f"Loaded and merged user config from {user_config_path}")
+        config = merge_configs(config, _load_toml_file(user_config_path))
+        if _is_verbose(config):
+            logger.info(f"Loaded and merged user config from {user_config_path}")
 
     # 2. Load specified config file if provided
     if config_file:
         path = Path(config_file)
         if path.exists():
-            with open(path, "rb") as f:
-                file_config = tomllib.load(f)
-                config = merge_configs(config, file_config)
-                if _is_verbose(config):
-                    logger.info(f"Loaded and merged specified config from {path}")
+            config = merge_configs(config, _load_toml_file(path))
+            if _is_verbose(config):
+                logger.info(f"Loaded and merged specified config from {path}")
         else:
             logger.warning(f"Specified config file not found: {config_file}")
 
     # 1. Apply direct override
     if config_override:
-        config = merge_configs(config, config_override)
+        config = merge_configs(config, copy.deepcopy(config_override))
         if _is_verbose(config):
             logger.info("Applied direct config override dictionary.")
 
     # Apply environment variables
     config["llm_api"]["base"] = os.getenv("LOCALAI_API_BASE", config["llm_api"]["base"])
     config["llm_api"]["key"] = os.getenv("LOCALAI_API_KEY", config["llm_api"]["key"])
+    config["mask_token"]["key"] = os.getenv("PROMPTMASK_TOKEN_KEY", config["mask_token"]["key"])
+    config["web"]["debug"]["token"] = os.getenv("PROMPTMASK_DEBUG_TOKEN", config["web"]["debug"]["token"])
 
-    # Apply variables -> see core._build_mask_prompt
+    # Apply variables -> see backends.build_mask_prompt
 
     if _is_verbose(config):
         logger.setLevel("DEBUG")
     logger.debug(f"Final loaded config:\n{config}")
     
-    return config
\ No newline at end of file
+    return config
+
+
+# Secrets by config path, with the environment variable that may supply them. They are never returned
+# by the web API's GET /v1/config, and values that came from the environment are never saved to a file.
+SECRETS: Dict[Tuple[str, ...], str] = {
+    ("mask_token", "key"): "PROMPTMASK_TOKEN_KEY", # decrypts every encrypted mask
+    ("web", "debug", "token"): "PROMPTMASK_DEBUG_TOKEN",
+}
+REDACTED = "<redacted>"
+
+def _secret_paths(config: dict) -> Iterator[Tuple[str, ...]]:
+    """Every secret path of `config`, including the ones profiles may set."""
+    yield from SECRETS
+    for name, overrides in config.get("profiles", {}).items():
+        for path in SECRETS:
+            if path[0] in overrides:
+                yield ("profiles", name) + path
+
+def _get_path(config: dict, path: Tuple[str, ...]) -> Optional[object]:
+    for key in path:
+        if not isinstance(config, dict) or key not in config:
+            return None
+        config = config[key]
+    return config
+
+def _set_path(config: dict, path: Tuple[str, ...], value: Optional[object]):
+    """Sets `path` to `value`, or removes it for None."""
+    for key in path[:-1]:
+        config = config.setdefault(key, {})
+    if value is None:
+        config.pop(path[-1], None)
+    else:
+        config[path[-1]] = value
+
+def redact_secrets(config: dict) -> dict:
+    """A copy of `config` with every non-empty secret replaced by REDACTED."""
+    config = copy.deepcopy(config)
+    for path in list(_secret_paths(config)):
+        if _get_path(config, path):
+            _set_path(config, path, REDACTED)
+    return config
+
+def restore_secrets(config: dict, saved: dict) -> dict:
+    """
+    Prepares a config posted by a client (which got it redacted) for saving over the `saved` one:
+    REDACTED secrets, and secrets that merely echo their environment variable, keep the saved file's
+    value, or are left out if the file had none.
+    """
+    config = copy.deepcopy(config)
+    for path in list(_secret_paths(config)):
+        value = _get_path(config, path)
+        env = os.getenv(SECRETS[path], "") if path in SECRETS else "" # profiles never read the environment
+        if value == REDACTED or (env and value == env):
+            _set_path(config, path, _get_path(saved, path))
+    return config
+
+# What a profile may override: everything that shapes the masking prompt and its masks.
+# Connections, backend, scheduling and web settings stay shared by all profiles.
+PROFILE_SECTIONS = ("sensitive", "mask_wrapper", "prompt", "mask_token", "model_specific")
+
+def profile_configs(config: dict) -> Dict[str, dict]:
+    """
+    The full config of each named profile (`[profiles.<name>]`): the base config with the profile's
+    sections merged over it. Sections the profile does not set are the base config's own dicts, shared.
+    Raises ValueError if a profile overrides a shared section.
+    """
+    profiles = {}
+    base = {k: v for k, v in config.items() if k != "profiles"}
+    for name, overrides in config.get("profiles", {}).items():
+        shared = sorted(set(overrides) - set(PROFILE_SECTIONS))
+        if shared:
+            raise ValueError(f"Profile '{name}' overrides {shared}; profiles may only set {PROFILE_SECTIONS}.")
+        profiles[name] = {**base, **{
+            section: merge_configs(copy.deepcopy(base.get(section, {})), copy.deepcopy(values))
+            for section, values in overrides.items()
+        }}
+    return profiles
+
+class ConfigWatcher:
+    """
+    Polls config files for changes in a daemon thread and invokes `on_change`.
+    Polling keeps the core library free of extra dependencies and works on network mounts
+    and in containers with bind-mounted config files.
+    """
+    def __init__(self, paths: List[Path], on_change: Callable[[], None], interval: float = 2.0):
+        self.paths = [Path(p) for p in paths]
+        self.on_change = on_change
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._signatures = self._scan()
+
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        signatures = {}
+        for path in self.paths:
+            try:
+                signatures[path] = _file_signature(path)
+            except OSError:
+                signatures[path] = None # missing file is also a state
+        return signatures
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            signatures = self._scan()
+            if signatures == self._signatures:
+                continue
+            self._signatures = signatures
+            logger.info("Config file change detected. Hot-reloading...")
+            try:
+                self.on_change()
+            except Exception as e:
+                logger.error(f"Failed to hot-reload config, keeping the previous one: {e}", exc_info=True)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="promptmask-config-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
@@ -1,59 +1,238 @@
 # src/promptmask/core.py
 
+import copy
 import json
-import string
+import random
+import time
 import asyncio
-from typing import List, Dict, Tuple, AsyncGenerator, Generator, Optional
-from openai import OpenAI, AsyncOpenAI, APITimeoutError
+import threading
+from typing import List, Dict, Tuple, AsyncGenerator, Generator, Optional, NamedTuple, Iterable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from openai import OpenAI, AsyncOpenAI
 from openai.types.chat.chat_completion_chunk import ChoiceDelta
 from types import SimpleNamespace
 
-from .config import load_config
-from .utils import _btwn, logger, is_dict_str_str,  flatten_dict
+from .backends import MaskBackend, OpenAIBackend, Entity, DetectionError, DetectionTimeout, create_backend, build_mask_prompt
+from .examples import PROFILES as EXAMPLE_PROFILES
+from .gazetteer import Gazetteer
+from .config import load_config, config_source_paths, profile_configs, ConfigWatcher
+from .metrics import metrics
+from .pool import EndpointPool, HedgePolicy
+from .scheduler import MaskScheduler, QueueFullError
+from .maskmap import MaskMap, StreamUnmasker
+from .prefilter import is_benign
+from .rules import rule_based_mask_map
+from .tokens import MaskTokenCipher, MAX_TOKEN_LEN
+from .utils import logger
+
+BATCH_RETRY_DELAY, BATCH_RETRY_MAX_DELAY = 0.05, 2.0 # seconds; backoff for batch items the scheduler rejected
 
 if not hasattr(ChoiceDelta, 'original_content'): # Static monkey patch
     ChoiceDelta.original_content: Optional[str] = None
     # ChoiceDelta.model_rebuild(force=True)
     # setattr(ChoiceDelta, 'original_content', None)
 
+class ConfigSnapshot(NamedTuple):
+    """
+    One fully-applied configuration together with the masking backend and local LLM endpoints built from it.
+    Snapshots are published by swapping a single reference, so a request that grabs
+    a snapshot at its start sees a consistent config for its whole lifetime.
+    The `config` dict must be treated as read-only once published.
+    """
+    config: dict
+    pool: EndpointPool
+    backend: MaskBackend
+    tokens: Optional[MaskTokenCipher] = None # set when `mask_token.mode` is "encrypted"
+    profiles: Dict[str, "ConfigSnapshot"] = {} # named profiles (`[profiles.<name>]`) sharing `pool`; read-only
+
 class PromptMask:
-    def __init__(self, config: dict = {}, config_file: str =  ""):
+    def __init__(self, config: dict = {}, config_file: str =  "", backend: Optional[MaskBackend] = None):
         """
         Initializes the PromptMask instance.
 
         Args:
             config (dict, optional): A dictionary to override default settings.
             config_file (str, optional): Path to a custom TOML config file.
+            backend (MaskBackend, optional): A masking backend to use instead of the one selected by `backend.name`.
         """
         self._init_config_override = config
         self._init_config_file = config_file
+        self._backend_override = backend
         self._lock = asyncio.Lock()
+        self._reload_lock = threading.Lock()
+        self._snapshot: Optional[ConfigSnapshot] = None
+        self._watcher: Optional[ConfigWatcher] = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._warmup_task: Optional[asyncio.Task] = None
+        self._warm_key: Optional[tuple] = None # what the last successful warm-up primed, see `ready`
+        self._scheduler = MaskScheduler(timeout_errors=(DetectionTimeout, asyncio.TimeoutError))
+        self._hedge = HedgePolicy()
+        self._gazetteer = Gazetteer()
+        self._profile: Optional[str] = None # set on views returned by `profile()`
         self._initialize_clients()
+        if self.config["general"].get("watch_config"):
+            self.watch_config()
+
+    @property
+    def config(self) -> dict:
+        """The currently published configuration (read-only)."""
+        return self._snapshot.config
+
+    @property
+    def client(self) -> OpenAI:
+        """Sync client of the primary (first) local LLM endpoint."""
+        return self._snapshot.pool.primary.client
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """Async client of the primary (first) local LLM endpoint."""
+        return self._snapshot.pool.primary.async_client
 
     def _initialize_clients(self):
         """
-        Loads configuration and initializes API clients.
+        Loads configuration and initializes API clients, then atomically publishes them as a new snapshot.
+        Endpoint clients (and their connection pools) are reused when their connection settings are unchanged.
         This method can be called to re-initialize the instance.
         """
-        logger.info("Initializing or reloading PromptMask configuration...")
-        self.config = load_config(self._init_config_override, self._init_config_file)
-        
-        self.client = OpenAI(base_url=self.config["llm_api"]["base"], api_key=self.config["llm_api"]["key"], timeout=self.config["llm_api"]["timeout"])
-        self.async_client = AsyncOpenAI(base_url=self.config["llm_api"]["base"], api_key=self.config["llm_api"]["key"], timeout=self.config["llm_api"]["timeout"])
-
-        # Auto-detect model if not specified
-        if not self.config["llm_api"].get("model"):
-            try:
-                models = self.client.models.list()
-                if not models.data:
-                    raise ValueError("No models found at the local LLM API endpoint.")
-                self.config["llm_api"]["model"] = models.data[0].id
-                logger.info(f"Auto-selected local model: {self.config['llm_api']['model']}")
-            except Exception as e:
-                logger.error(f"Failed to auto-detect a model from {self.config['llm_api']['base']}. Please specify a model in your config. Error: {e}")
-                raise
+        with self._reload_lock:
+            logger.info("Initializing or reloading PromptMask configuration...")
+            config = load_config(self._init_config_override, self._init_config_file)
+            llm_api = config["llm_api"]
+            prev = self._snapshot
+            pool = EndpointPool.from_config(llm_api, prev.pool if prev else None)
+            uses_llm_api = (self._backend_override is None and config["backend"].get("name", "openai") == "openai"
+                            and config["backend"].get("replay", "off") != "replay")
+
+            # Auto-detect model if not specified (on a copy: the endpoint may still serve the current snapshot)
+            for i, ep in enumerate(pool.endpoints):
+                if ep.model or not uses_llm_api:
+                    continue
+                try:
+                    models = ep.client.models.list()
+                    if not models.data:
+                        raise ValueError("No models found at the local LLM API endpoint.")
+                    pool.endpoints[i] = ep.reconfigured(models.data[0].id, ep.configured_model, ep.weight)
+                    logger.info(f"Auto-selected local model: {models.data[0].id} at {ep.base}")
+                except Exception as e:
+                    logger.error(f"Failed to auto-detect a model from {ep.base}. Please specify a model in your config. Error: {e}")
+                    raise
+            llm_api["model"] = pool.primary.model
+            backend = self._backend_override or create_backend(config, pool, self._hedge, prev.backend if prev else None)
+            tokens = MaskTokenCipher.from_config(config)
+            profiles = {}
+            for name, profile_config in profile_configs(config).items():
+                # same endpoints and model: the profile's backend only differs in its prompt
+                profile_backend = self._backend_override or create_backend(profile_config, pool, self._hedge, backend)
+                profiles[name] = ConfigSnapshot(profile_config, pool, profile_backend, MaskTokenCipher.from_config(profile_config))
+            for cfg in [config] + [p.config for p in profiles.values()]:
+                if cfg["prompt"].get("example_profile", "all") not in EXAMPLE_PROFILES:
+                    raise ValueError(f"Unknown prompt.example_profile '{cfg['prompt']['example_profile']}', expected one of {EXAMPLE_PROFILES}.")
+
+            self._snapshot = ConfigSnapshot(config, pool, backend, tokens, profiles)
+            sched_cfg = config.get("scheduler", {})
+            self._scheduler.configure(
+                sched_cfg.get("max_concurrency", 0), sched_cfg.get("max_queue", 0), sched_cfg.get("max_queue_wait", 0),
+                sched_cfg.get("adaptive", False), sched_cfg.get("min_concurrency", 1), sched_cfg.get("latency_tolerance", 2.0),
+            )
+            self._hedge.configure(llm_api.get("hedge_percentile", 0.95), llm_api.get("hedge_budget", 0.1))
+            gaz_cfg = config.get("gazetteer", {})
+            self._gazetteer.configure(gaz_cfg.get("ttl", 3600.0), gaz_cfg.get("max_entries", 10000), gaz_cfg.get("max_scopes", 1000))
+            if prev and prev.backend.signature != backend.signature:
+                self._scheduler.reset() # a different server or model has a different latency profile
         logger.info("PromptMask configuration loaded successfully.")
 
+    async def start(self):
+        """
+        Starts async background work: periodic health probes of the local LLM endpoints
+        (`llm_api.health_check_interval`) and the model warm-up (`llm_api.warmup`, see `ready`).
+        Call from within the running event loop.
+        """
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_check_loop())
+        if self._warmup_task is None or self._warmup_task.done():
+            self._warmup_task = asyncio.create_task(self._warmup_loop())
+
+    async def _health_check_loop(self):
+        while True:
+            snap = self._snapshot # always the current pool, across reloads
+            interval = snap.config["llm_api"].get("health_check_interval", 0)
+            backend = getattr(snap.backend, "inner", snap.backend) # unwrapped when recording
+            if interval > 0 and isinstance(backend, OpenAIBackend): # other backends do not use the pool
+                await snap.pool.probe()
+            await asyncio.sleep(interval if interval > 0 else 5.0)
+
+    def _warmup_key(self, snap: ConfigSnapshot) -> tuple:
+        """Backend model(s) and static prompt prefix: a warm-up stays valid until one of them changes."""
+        prefix = build_mask_prompt("", snap.config)[:-1]
+        return snap.backend.signature, json.dumps(prefix, sort_keys=True)
+
+    @property
+    def ready(self) -> bool:
+        """
+        False until the local model(s) of the current config are warmed up (`llm_api.warmup`).
+        Goes back to False after a reload that changes the endpoints, models or prompt, until re-warmed.
+        """
+        snap = self._snapshot
+        return not snap.config["llm_api"].get("warmup") or self._warm_key == self._warmup_key(snap)
+
+    async def warm_up(self, snap: Optional[ConfigSnapshot] = None) -> float:
+        """
+        Warms up the masking backend: loads the model and primes its prompt/KV cache with the static
+        prompt prefix (system prompt and few-shot examples) before real traffic arrives.
+        Raises if the model does not respond. Returns the elapsed seconds.
+        """
+        snap = snap or self._snapshot
+        key = self._warmup_key(snap)
+        start = time.perf_counter()
+        await snap.backend.warm_up()
+        elapsed = time.perf_counter() - start
+        metrics.observe("warmup_seconds", elapsed)
+        self._warm_key = key
+        return elapsed
+
+    async def _warmup_loop(self):
+        retry = 1.0
+        while True:
+            if not self.ready:
+                try:
+                    elapsed = await self.warm_up()
+                    logger.info(f"Local model warmed up in {elapsed:.1f}s.")
+                    retry = 1.0
+                except Exception as e:
+                    logger.warning(f"Local model warm-up failed, retrying in {retry:.0f}s: {e}")
+                    await asyncio.sleep(retry)
+                    retry = min(retry * 2, 30.0)
+                    continue
+            metrics.set_gauge("warmup_ready", int(self.ready))
+            await asyncio.sleep(1.0) # picks up reloads, including those from the config watcher thread
+
+    async def aclose(self):
+        """Async counterpart of `close()` that also stops the background tasks started by `start()`."""
+        for task in (self._health_task, self._warmup_task):
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._health_task = self._warmup_task = None
+        self.close()
+
+    def watch_config(self, interval: Optional[float] = None):
+        """
+        Starts a background watcher that hot-reloads the config whenever the user
+        config file (or the `config_file` passed at init) changes on disk.
+        """
+        if self._watcher:
+            return
+        interval = interval or self.config["general"].get("watch_interval", 2.0)
+        self._watcher = ConfigWatcher(config_source_paths(self._init_config_file), self._initialize_clients, interval)
+        self._watcher.start()
+        logger.info(f"Watching config files for changes every {interval}s.")
+
+    def close(self):
+        """Stops background work started by this instance (e.g. the config watcher)."""
+        if self._watcher:
+            self._watcher.stop()
+            self._watcher = None
+
     async def reload_config(self):
         """
         Asynchronously reloads the configuration from the disk and re-initializes clients.
@@ -63,139 +242,189 @@ class PromptMask:
             loop = asyncio.get_running_loop()
             await loop.run_in_executor(None, self._initialize_clients)
         logger.info("Configuration reloaded successfully.")
-    def _build_mask_prompt(self, text: str) -> List[Dict[str, str]]:
-        """Constructs the full prompt for the local masking LLM."""
-        cfg = self.config
-        user_content = string.Template(cfg["prompt"]["user_template"]).safe_substitute(text_to_mask=text)
-        
-        sys_inst = string.Template(cfg["prompt"]["system_template"]).safe_substitute(
-            sensitive_include=cfg["sensitive"]["include"],
-            sensitive_exclude=cfg["sensitive"]["exclude"],
-            mask_left=cfg["mask_wrapper"]["left"],
-            mask_right=cfg["mask_wrapper"]["right"],
-        )
-        model = cfg["llm_api"]["model"].lower()
-        if any(k in model for k in cfg["model_specific"]["dual_models"]):
-            sys_inst = cfg["model_specific"]["dual_metaprompt"] + sys_inst
-        
-        messages = [{"role": "system", "content": sys_inst}]
-        messages.extend([{"role": ex["role"],
-            "content": string.Template(ex["content"]).safe_substitute(
-            mask_left=cfg["mask_wrapper"]["left"],
-            mask_right=cfg["mask_wrapper"]["right"], 
-        )} for ex in cfg["prompt"]["examples"]])
-        messages.append({"role": "user", "content": user_content})
-        
-        return messages
-
-    def _parse_mask_response(self, response_content: str) -> Dict[str, str]:
-        """Parses the local LLM response to extract the mask map."""
-        try:
-            json_str = _btwn(response_content, "{", "}")
-            logger.debug(f"json_str:: {json_str}")
-            reversed_map = json.loads(json_str)
-            reversed_map = flatten_dict(reversed_map)
-            if not is_dict_str_str(reversed_map):
-                raise TypeError("Mask map should be a dictionary mapping strings to strings.")
-            # Ensure 1:1 mapping by reversing the map to check for duplicate masks
-            mask_map = {v: k for k, v in reversed_map.items() if len(v)>3} #raise TypeError if v is unhashable
-            if len(reversed_map) != len(mask_map):
-                logger.warning("Duplicate masks detected in LLM response. The result might be inconsistent.")
-            
-            #wrap mask w/ self.config["mask_wrapper"]
-            mask_wrapper = self.config.get("mask_wrapper", {})
-            mask_left, mask_right = mask_wrapper.get("left", ""), mask_wrapper.get("right", "")
-            wrapped_mask_map = {
-                val: (
-                    mask_key.upper()
-                    if mask_key.startswith(mask_left) and mask_key.endswith(mask_right)
-                    else f"{mask_left}{mask_key.upper()}{mask_right}"
-                )
-                for val, mask_key in mask_map.items()
-            }
-            
-            return wrapped_mask_map
-        except (ValueError, json.JSONDecodeError, TypeError) as e:
-            logger.error(f"Failed to parse mask response: {e}\nResponse: {response_content}")
-            return {"err":type(e).__name__}
 
-    def _oai_chat_comp(self, messages:str) -> str:
-        try:
-            completion = self.client.chat.completions.create(
-                model=self.config["llm_api"]["model"],
-                messages=messages,
-                temperature=0.0
-        )
-            return completion.choices[0].message.content
-        except APITimeoutError as e:
-            return json.dumps({"err":type(e).__name__})
-
-    async def _async_oai_chat_comp(self, messages: List[Dict[str, str]]) -> str:
-        """Asynchronous chat completion call."""
-        try:
-            completion = await self.async_client.chat.completions.create(
-                model=self.config["llm_api"]["model"],
-                messages=messages,
-                temperature=0.0,
-            )
-            return completion.choices[0].message.content
-        except APITimeoutError as e:
-            return json.dumps({"err":type(e).__name__})
+    def profile(self, name: Optional[str]) -> "PromptMask":
+        """
+        A view of this instance that masks with the named profile (`[profiles.<name>]`) of the current config:
+        its own prompt, mask wrapper, encrypted-token key and gazetteer namespace, while sharing the local LLM
+        clients, scheduler and hedging. Views are cheap per-request objects pinned to the current config;
+        starting, reloading and closing stay with this instance. Returns self for no name.
+        Raises KeyError for an unknown profile.
+        """
+        if not name:
+            return self
+        snap = self._snapshot.profiles.get(name)
+        if snap is None:
+            raise KeyError(name)
+        view = copy.copy(self)
+        view._snapshot, view._profile = snap, name
+        return view
+
+    def _scope_key(self, scope: Optional[str]) -> str:
+        """Gazetteer scope, namespaced by profile: profiles never share learned values."""
+        return f"{self._profile}\x00{scope or ''}" if self._profile else scope or ""
+
+    @staticmethod
+    def _seal(mask_map: MaskMap, snap: ConfigSnapshot) -> MaskMap:
+        """Turns masks into self-contained encrypted ones when `mask_token.mode` is "encrypted"."""
+        if snap.tokens is None or "err" in mask_map:
+            return mask_map
+        return snap.tokens.seal(mask_map)
+
+    @staticmethod
+    def _to_mask_map(entities: List[Entity], cfg: dict) -> MaskMap:
+        """Wraps entity labels into masks; a label reused for a different value gets a numeric suffix."""
+        left, right = cfg["mask_wrapper"]["left"], cfg["mask_wrapper"]["right"]
+        mask_map: Dict[str, str] = {}
+        used = set()
+        for value, label in entities:
+            if not value or value in mask_map:
+                continue
+            name, n = label.upper(), 1
+            mask = f"{left}{name}{right}"
+            while mask in used:
+                n += 1
+                mask = f"{left}{name}_{n}{right}"
+            used.add(mask)
+            mask_map[value] = mask
+        return MaskMap(mask_map)
+
+    def _recall(self, text: str, snap: ConfigSnapshot, scope: Optional[str]) -> Tuple[List[Entity], Optional[str]]:
+        """
+        Looks up values the backend detected before in this scope (`gazetteer.enabled`).
+        Returns the known entities and the text left for the backend, with known values replaced by their
+        masks, or None if nothing but known values and punctuation is left.
+        """
+        if not snap.config["gazetteer"].get("enabled"):
+            return [], text
+        known = self._gazetteer.find(self._scope_key(scope), text)
+        if not known:
+            return [], text
+        known_map = self._to_mask_map(known, snap.config)
+        remaining = known_map.mask(text)
+        rest = remaining
+        for mask in known_map.values():
+            rest = rest.replace(mask, "")
+        if not any(ch.isalnum() for ch in rest):
+            metrics.inc("gazetteer_backend_skipped_total")
+            return known, None
+        return known, remaining
+
+    def _prefiltered(self, text: str, snap: ConfigSnapshot) -> bool:
+        """Whether `prefilter` judges `text` clearly clean, so the backend can be skipped."""
+        cfg = snap.config["prefilter"]
+        if not cfg.get("enabled"):
+            return False
+        metrics.inc("prefilter_checked_total")
+        if is_benign(text, cfg.get("max_chars", 64), cfg.get("max_words", 12), cfg.get("allow_capitalized", False)):
+            metrics.inc("prefilter_skipped_total")
+            return True
+        return False
+
+    def _combine(self, known: List[Entity], detected: List[Entity], snap: ConfigSnapshot, scope: Optional[str]) -> MaskMap:
+        """Merges known and newly detected entities (known ones keep their mask names) and learns the new ones."""
+        if known:
+            known_values = {e.value for e in known}
+            known_masks = list(self._to_mask_map(known, snap.config).values())
+            # the backend saw the known masks in place of their values; never mask those again
+            detected = [e for e in detected if e.value not in known_values and not any(m in e.value for m in known_masks)]
+        if detected and snap.config["gazetteer"].get("enabled"):
+            self._gazetteer.learn(self._scope_key(scope), detected)
+        return self._seal(self._to_mask_map(known + detected, snap.config), snap)
+
+    def _detect(self, text: str, snap: ConfigSnapshot, scope: Optional[str] = None) -> MaskMap:
+        known, remaining = self._recall(text, snap, scope)
+        if remaining is not None and self._prefiltered(text, snap):
+            remaining = None
+        detected: List[Entity] = []
+        if remaining is not None:
+            try:
+                detected = snap.backend.detect(remaining)
+            except DetectionError as e:
+                return MaskMap({"err": e.reason})
+        return self._combine(known, detected, snap, scope)
+
+    async def _adetect(self, text: str, snap: ConfigSnapshot, priority: str, scope: Optional[str] = None) -> MaskMap:
+        """Detects through the scheduler; raises `QueueFullError` if the backend is saturated."""
+        known, remaining = self._recall(text, snap, scope)
+        if remaining is not None and self._prefiltered(text, snap):
+            remaining = None
+        detected: List[Entity] = []
+        if remaining is not None:
+            try:
+                async with self._scheduler.slot(priority):
+                    detected = await snap.backend.adetect(remaining)
+            except DetectionError as e:
+                return MaskMap({"err": e.reason})
+        return self._combine(known, detected, snap, scope)
 
     # --- Synchronous Methods ---
 
-    def mask_str(self, text: str) -> Tuple[str, Dict[str, str]]:
-        """Masks a single string."""
+    def mask_str(self, text: str, scope: Optional[str] = None) -> Tuple[str, MaskMap]:
+        """
+        Masks a single string.
+        `scope` (e.g. a tenant or session id) selects which learned values the gazetteer may reuse, if enabled.
+        """
         if not text:
-            return "", {}
-            
-        messages = self._build_mask_prompt(text)
-        logger.debug(f"Message sending to local LLM: {messages}")
+            return "", MaskMap()
 
-        response_content = self._oai_chat_comp(messages)
-        logger.debug(f"Mask mapping by local LLM (length: {len(response_content)}): {response_content}")
-
-        mask_map = self._parse_mask_response(response_content)
-        sorted_mask_items = sorted(mask_map.items(), key=lambda item: len(item[0]), reverse=True)
-        
-        masked_text = text
-        for original, mask in sorted_mask_items:
-            masked_text = masked_text.replace(original, mask)
-        
-        return masked_text, mask_map
+        mask_map = self._detect(text, self._snapshot, scope)
+        return mask_map.mask(text), mask_map
 
-    def mask_messages(self, messages: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], Dict[str, str]]:
+    def mask_messages(self, messages: List[Dict[str, str]], scope: Optional[str] = None) -> Tuple[List[Dict[str, str]], MaskMap]:
         """Masks 'content' in a list of chat messages."""
         # We only mask 'user' and 'assistant' roles to avoid corrupting system prompts.
         text_to_mask = "\n".join([m["content"] for m in messages if m.get("role") not in ["system"] and m.get("content")])
         
         if not text_to_mask.strip():
-            return messages, {}
+            return messages, MaskMap()
             
-        _, mask_map = self.mask_str(text_to_mask)
-        sorted_mask_items = sorted(mask_map.items(), key=lambda item: len(item[0]), reverse=True)
+        _, mask_map = self.mask_str(text_to_mask, scope)
+        return self._replace_in_messages(messages, mask_map), mask_map
+
+    def _replace_in_messages(self, messages: List[Dict[str, str]], mask_map: Dict[str, str]) -> List[Dict[str, str]]:
+        """Applies a mask map to the 'content' of non-system messages."""
+        mask_map = MaskMap.coerce(mask_map)
         
         masked_messages = []
         for msg in messages:
             new_msg = msg.copy()
             if new_msg.get("content") and new_msg.get("role") not in ["system"]:
-                content = new_msg["content"]
-                for original, mask in sorted_mask_items:
-                    content = content.replace(original, mask)
-                new_msg["content"] = content
+                new_msg["content"] = mask_map.mask(new_msg["content"])
             masked_messages.append(new_msg)
             
-        return masked_messages, mask_map
+        return masked_messages
+
+    def rule_mask_str(self, text: str) -> Tuple[str, MaskMap]:
+        """
+        Masks a string with regex rules only (see `promptmask.rules`), without calling the local LLM.
+        Less thorough, but instant; used as a degraded fallback when the LLM is too slow or failing.
+        """
+        snap = self._snapshot
+        mask_wrapper = snap.config["mask_wrapper"]
+        mask_map = self._seal(MaskMap(rule_based_mask_map(text, mask_wrapper["left"], mask_wrapper["right"])), snap)
+        return mask_map.mask(text), mask_map
 
-    def unmask_str(self, text: str, mask_map: Dict[str, str]) -> str:
-        """Unmasks a single string using the provided map."""
-        unmasked_text = text
-        for original, mask in mask_map.items():
-            unmasked_text = unmasked_text.replace(mask, original)
-        return unmasked_text
+    def rule_mask_messages(self, messages: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], MaskMap]:
+        """Masks messages with regex rules only. See `rule_mask_str`."""
+        text_to_mask = "\n".join([m["content"] for m in messages if m.get("role") not in ["system"] and m.get("content")])
+        snap = self._snapshot
+        mask_wrapper = snap.config["mask_wrapper"]
+        mask_map = self._seal(MaskMap(rule_based_mask_map(text_to_mask, mask_wrapper["left"], mask_wrapper["right"])), snap)
+        return self._replace_in_messages(messages, mask_map), mask_map
 
-    def unmask_messages(self, messages: List[Dict[str, str]], mask_map: Dict[str, str]) -> List[Dict[str, str]]:
+    def unmask_str(self, text: str, mask_map: Optional[Dict[str, str]] = None) -> str:
+        """
+        Unmasks a single string using the provided map (a MaskMap or a plain dict).
+        Self-contained encrypted masks (`mask_token.mode = "encrypted"`) are unmasked even without the map.
+        """
+        text = MaskMap.coerce(mask_map).unmask(text)
+        tokens = self._snapshot.tokens
+        return tokens.unmask(text) if tokens else text
+
+    def unmask_messages(self, messages: List[Dict[str, str]], mask_map: Optional[Dict[str, str]] = None) -> List[Dict[str, str]]:
         """Unmasks 'content' in a list of chat messages."""
+        mask_map = MaskMap.coerce(mask_map)
         unmasked_messages = []
         for msg in messages:
             new_msg = msg.copy()
@@ -204,15 +433,23 @@ class PromptMask:
             unmasked_messages.append(new_msg)
         return unmasked_messages
 
+    def _stream_unmasker(self, mask_map: Optional[Dict[str, str]]) -> StreamUnmasker:
+        snap = self._snapshot
+        mask_wrapper = snap.config["mask_wrapper"]
+        if snap.tokens is None:
+            return StreamUnmasker(mask_map, mask_wrapper["left"], mask_wrapper["right"])
+        return StreamUnmasker(mask_map, mask_wrapper["left"], mask_wrapper["right"], resolve=snap.tokens.decrypt, max_hold=MAX_TOKEN_LEN)
+
     def unmask_stream(self, stream: Generator, mask_map: Dict[str, str]) -> Generator:
         """Wraps a streaming response to unmask content on-the-fly with proper buffering."""
-        content_buffer = ""
-        inverted_map = {mask: original for original, mask in mask_map.items()}
-        left_wrapper = self.config["mask_wrapper"]["left"]
-        right_wrapper = self.config["mask_wrapper"]["right"]
+        unmasker = self._stream_unmasker(mask_map)
 
+        last_chunk = None
         for chunk in stream:
+            last_chunk = chunk
             if not (chunk.choices and (delta := chunk.choices[0].delta) and (original_content := delta.content)):
+                if chunk.choices and chunk.choices[0].finish_reason and (rest := unmasker.flush()):
+                    chunk.choices[0].delta.content = rest # release text held back as a possible mask
                 yield chunk
                 continue
             
@@ -220,113 +457,146 @@ class PromptMask:
             # setattr(delta, 'original_content', original_content)
             new_delta = SimpleNamespace(**delta.model_dump())
             new_delta.original_content = original_content or ""
-            
-            content_buffer += original_content
-            output_content_this_chunk = ""
-
-            while True:
-                start_pos = content_buffer.find(left_wrapper)
-                if start_pos == -1:
-                    output_content_this_chunk += content_buffer
-                    content_buffer = ""
-                    break
-                
-                end_pos = content_buffer.find(right_wrapper, start_pos+len(left_wrapper))
-                if end_pos == -1:
-                    output_content_this_chunk += content_buffer[:start_pos]
-                    content_buffer = content_buffer[start_pos:]
-                    break
-
-                text_before_mask = content_buffer[:start_pos]
-                full_mask = content_buffer[start_pos : end_pos + len(right_wrapper)]
-                unmasked_value = inverted_map.get(full_mask, full_mask)
-                
-                output_content_this_chunk += text_before_mask + unmasked_value
-                content_buffer = content_buffer[end_pos + len(right_wrapper):]
-
-            new_delta.content = output_content_this_chunk
+            new_delta.content = unmasker.feed(original_content)
+            if chunk.choices[0].finish_reason: # last content arrives with the finish_reason
+                new_delta.content += unmasker.flush()
             chunk.choices[0].delta = new_delta
             yield chunk
+        if rest := unmasker.flush(): # the stream ended without a finish_reason
+            yield self._tail_chunk(last_chunk, rest)
+
+    @staticmethod
+    def _tail_chunk(last_chunk, rest: str) -> SimpleNamespace:
+        """A chunk carrying text the unmasker still held back when the stream ended."""
+        delta = SimpleNamespace(role=None, content=rest, original_content="")
+        return SimpleNamespace(id=getattr(last_chunk, "id", None), model=getattr(last_chunk, "model", None),
+                               choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)])
 
     # --- Asynchronous Methods ---
 
-    async def async_mask_str(self, text: str) -> Tuple[str, Dict[str, str]]:
-        """Async version of mask_str."""
+    async def async_detect(self, text: str, priority: str = "interactive", scope: Optional[str] = None) -> MaskMap:
+        """
+        The mask map for `text`, without applying it. Lets callers run the replacement elsewhere,
+        e.g. off the event loop for very large texts.
+        `priority` ("interactive" or "batch") decides queue order when the local LLM is saturated.
+        """
         if not text:
-            return "", {}
-            
-        messages = self._build_mask_prompt(text)
-            
-        response_content = await self._async_oai_chat_comp(messages)
+            return MaskMap()
+        return await self._adetect(text, self._snapshot, priority, scope)
 
-        mask_map = self._parse_mask_response(response_content)
-        sorted_mask_items = sorted(mask_map.items(), key=lambda item: len(item[0]), reverse=True)
+    async def async_detect_messages(self, messages: List[Dict[str, str]], priority: str = "interactive", scope: Optional[str] = None) -> MaskMap:
+        """The mask map for the 'content' of non-system chat messages, without applying it."""
+        text_to_mask = "\n".join([m["content"] for m in messages if m.get("role") not in ["system"] and m.get("content")])
+        if not text_to_mask.strip():
+            return MaskMap()
+        return await self.async_detect(text_to_mask, priority, scope)
 
-        masked_text = text
-        for original, mask in sorted_mask_items:
-            masked_text = masked_text.replace(original, mask)
-            
-        return masked_text, mask_map
+    async def async_mask_str(self, text: str, priority: str = "interactive", scope: Optional[str] = None) -> Tuple[str, MaskMap]:
+        """Async version of mask_str. See `async_detect` for `priority`."""
+        mask_map = await self.async_detect(text, priority, scope)
+        return mask_map.mask(text), mask_map
 
-    async def async_mask_messages(self, messages: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], Dict[str, str]]:
+    async def async_mask_messages(self, messages: List[Dict[str, str]], priority: str = "interactive", scope: Optional[str] = None) -> Tuple[List[Dict[str, str]], MaskMap]:
         """Async version of mask_messages."""
-        text_to_mask = "\n".join([m["content"] for m in messages if m.get("role") not in ["system"] and m.get("content")])
-        
-        if not text_to_mask.strip():
-            return messages, {}
-            
-        _, mask_map = await self.async_mask_str(text_to_mask)
-        sorted_mask_items = sorted(mask_map.items(), key=lambda item: len(item[0]), reverse=True)
-        
-        masked_messages = []
-        for msg in messages:
-            new_msg = msg.copy()
-            if new_msg.get("content") and new_msg.get("role") not in ["system"]:
-                content = new_msg["content"]
-                for original, mask in sorted_mask_items:
-                    content = content.replace(original, mask)
-                new_msg["content"] = content
-            masked_messages.append(new_msg)
-            
-        return masked_messages, mask_map
+        mask_map = await self.async_detect_messages(messages, priority, scope)
+        if not mask_map:
+            return messages, mask_map
+        return self._replace_in_messages(messages, mask_map), mask_map
 
     async def async_unmask_stream(self, stream: AsyncGenerator, mask_map: Dict[str, str]) -> AsyncGenerator:
         """Async wrapper for unmasking a stream with proper buffering."""
-        content_buffer = ""
-        inverted_map = {mask: original for original, mask in mask_map.items()}
-        left_wrapper = self.config["mask_wrapper"]["left"]
-        right_wrapper = self.config["mask_wrapper"]["right"]
+        unmasker = self._stream_unmasker(mask_map)
 
+        last_chunk = None
         async for chunk in stream:
+            last_chunk = chunk
             if not (chunk.choices and (delta := chunk.choices[0].delta) and (original_content := delta.content)):
+                if chunk.choices and chunk.choices[0].finish_reason and (rest := unmasker.flush()):
+                    chunk.choices[0].delta.content = rest # release text held back as a possible mask
                 yield chunk
                 continue
 
             setattr(delta, 'original_content', original_content)
-            
-            content_buffer += original_content
-            output_content_this_chunk = ""
-
-            while True:
-                start_pos = content_buffer.find(left_wrapper)
-                if start_pos == -1:
-                    output_content_this_chunk += content_buffer
-                    content_buffer = ""
-                    break
-                
-                end_pos = content_buffer.find(right_wrapper, start_pos + len(left_wrapper))
-                if end_pos == -1:
-                    output_content_this_chunk += content_buffer[:start_pos]
-                    content_buffer = content_buffer[start_pos:]
-                    break
-
-                text_before_mask = content_buffer[:start_pos]
-                # Adjust end position to capture the full wrapper in the slice
-                full_mask = content_buffer[start_pos : end_pos + len(right_wrapper)]
-                unmasked_value = inverted_map.get(full_mask, full_mask)
-                
-                output_content_this_chunk += text_before_mask + unmasked_value
-                content_buffer = content_buffer[end_pos + len(right_wrapper):]
-
-            delta.content = output_content_this_chunk
-            yield chunk
\ No newline at end of file
+            delta.content = unmasker.feed(original_content)
+            if chunk.choices[0].finish_reason: # last content arrives with the finish_reason
+                delta.content += unmasker.flush()
+            yield chunk
+        if rest := unmasker.flush(): # the stream ended without a finish_reason
+            yield self._tail_chunk(last_chunk, rest)
+
+    # --- Batch Methods ---
+
+    @staticmethod
+    def _dedupe(texts: Iterable[str]) -> Dict[str, List[int]]:
+        """Groups input positions by text, so duplicate texts cost a single masking call."""
+        positions: Dict[str, List[int]] = {}
+        for i, text in enumerate(texts):
+            positions.setdefault(text, []).append(i)
+        return positions
+
+    def mask_batch_as_completed(self, texts: Iterable[str], concurrency: int = 4, priority: str = "batch",
+                                scope: Optional[str] = None) -> Generator[Tuple[int, Tuple[str, MaskMap]], None, None]:
+        """
+        Masks many strings with at most `concurrency` calls in flight, yielding `(index, (masked_text, mask_map))`
+        as soon as each finishes. Duplicate texts are masked once and yielded for every index.
+        `priority` mirrors `amask_batch_as_completed`; synchronous calls do not queue in the async scheduler.
+        """
+        positions = self._dedupe(texts)
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = {executor.submit(self.mask_str, text, scope): text for text in positions}
+            for future in as_completed(futures):
+                masked_text, mask_map = future.result()
+                for i in positions[futures[future]]:
+                    yield i, (masked_text, mask_map.copy())
+
+    def mask_batch(self, texts: Iterable[str], concurrency: int = 4, priority: str = "batch",
+                   scope: Optional[str] = None) -> List[Tuple[str, MaskMap]]:
+        """Masks many strings concurrently; results are returned in input order."""
+        texts = list(texts)
+        results: List[Optional[Tuple[str, MaskMap]]] = [None] * len(texts)
+        for i, result in self.mask_batch_as_completed(texts, concurrency, priority, scope):
+            results[i] = result
+        return results
+
+    async def amask_batch_as_completed(self, texts: Iterable[str], concurrency: int = 4, priority: str = "batch",
+                                       scope: Optional[str] = None) -> AsyncGenerator[Tuple[int, Tuple[str, MaskMap]], None]:
+        """
+        Async version of mask_batch_as_completed.
+        With "batch" priority, items the scheduler rejects (`QueueFullError`) wait and retry with backoff
+        instead of failing the batch; "interactive" callers get the error.
+        """
+        positions = self._dedupe(texts)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def mask_one(text: str):
+            async with semaphore:
+                delay = BATCH_RETRY_DELAY
+                while True:
+                    try:
+                        return text, await self.async_mask_str(text, priority, scope)
+                    except QueueFullError:
+                        if priority != "batch":
+                            raise
+                    metrics.inc("batch_queue_retries_total")
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.0)) # jitter: rejected items do not retry in lockstep
+                    delay = min(delay * 2, BATCH_RETRY_MAX_DELAY)
+
+        tasks = [asyncio.ensure_future(mask_one(text)) for text in positions]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                text, (masked_text, mask_map) = await next_done
+                for i in positions[text]:
+                    yield i, (masked_text, mask_map.copy())
+        finally:
+            for t in tasks:
+                t.cancel() # no-op for finished tasks; stops the rest if the consumer bails out
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def amask_batch(self, texts: Iterable[str], concurrency: int = 4, priority: str = "batch",
+                          scope: Optional[str] = None) -> List[Tuple[str, MaskMap]]:
+        """Async version of mask_batch; results are returned in input order."""
+        texts = list(texts)
+        results: List[Optional[Tuple[str, MaskMap]]] = [None] * len(texts)
+        async for i, result in self.amask_batch_as_completed(texts, concurrency, priority, scope):
+            results[i] = result
+        return results
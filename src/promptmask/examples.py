@@ -0,0 +1,62 @@
+# src/promptmask/examples.py
+
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List
+
+PROFILES = ("all", "zero_shot", "similar")
+
+_TOKEN_RE = re.compile(r"[^\W\d_]+|\d+|[^\w\s]")
+
+def lexical_features(text: str) -> Dict[str, float]:
+    """
+    A cheap, L2-normalized bag of lexical features: lowercased words, a digit marker, and punctuation,
+    weighted 1 + log(count) so that a long example full of quotes does not win every comparison.
+    Punctuation and keywords separate the kinds of input the examples cover (code, JSON, prose)
+    well enough to pick the closest examples without a model.
+    """
+    counts = Counter("0" if tok.isdigit() else tok.lower() for tok in _TOKEN_RE.findall(text))
+    weights = {tok: 1.0 + math.log(c) for tok, c in counts.items()}
+    norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+    return {tok: w / norm for tok, w in weights.items()}
+
+# examples are few and fixed; user texts are never cached (they hold the sensitive data)
+_example_features = lru_cache(maxsize=64)(lexical_features)
+
+def similarity(features: Dict[str, float], other: Dict[str, float]) -> float:
+    """Cosine similarity of two (normalized) feature bags."""
+    if len(features) > len(other):
+        features, other = other, features
+    return sum(v * other.get(tok, 0.0) for tok, v in features.items())
+
+def example_pairs(examples: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+    """Groups few-shot messages into exchanges, each starting at a user message."""
+    pairs: List[List[Dict[str, str]]] = []
+    for ex in examples:
+        if ex["role"] == "user" or not pairs:
+            pairs.append([])
+        pairs[-1].append(ex)
+    return pairs
+
+def select_examples(text: str, examples: List[Dict[str, str]], profile: str = "all", top_k: int = 2) -> List[Dict[str, str]]:
+    """
+    The few-shot messages to send with `text` under an example-budget profile:
+    "all" = every example, "zero_shot" = none (for capable models),
+    "similar" = the `top_k` exchanges lexically closest to `text`, kept in their configured order.
+    """
+    if profile == "all":
+        return list(examples)
+    if profile == "zero_shot" or top_k <= 0:
+        return []
+    if profile != "similar":
+        raise ValueError(f"Unknown prompt.example_profile '{profile}', expected one of {PROFILES}.")
+    pairs = example_pairs(examples)
+    if text and len(pairs) > top_k:
+        features = lexical_features(text)
+        scores = [similarity(features, _example_features(pair[0]["content"])) for pair in pairs]
+        keep = sorted(sorted(range(len(pairs)), key=lambda i: -scores[i])[:top_k])
+    else: # nothing to compare (e.g. the warm-up prefix): the first ones
+        keep = range(min(top_k, len(pairs)))
+    return [ex for i in keep for ex in pairs[i]]
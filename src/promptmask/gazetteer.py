@@ -0,0 +1,133 @@
+# src/promptmask/gazetteer.py
+
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .backends import Entity
+from .metrics import metrics
+
+MAX_VALUE_LEN = 256 # longer values are not worth a trie branch; the model still finds them
+
+def trie_regex(words: Iterable[str]) -> Optional["re.Pattern[str]"]:
+    """
+    Compiles literal words into one regex shaped like a trie (shared prefixes are matched once),
+    which scans a text in a single pass however many words there are, and prefers the longest word.
+    Matches must not start or end inside a word.
+    """
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {} # end of a word
+    if not trie:
+        return None
+
+    def build(node: dict) -> str:
+        out = []
+        while len(node) == 1 and "" not in node: # a chain of single children: no group needed
+            (ch, node), = node.items()
+            out.append(re.escape(ch))
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if branches:
+            alternation = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+            # greedy: try the longer words first, fall back to the word ending here
+            out.append(f"(?:{alternation})?" if "" in node else alternation)
+        return "".join(out)
+
+    return re.compile(r"(?<!\w)(?:" + build(trie) + r")(?!\w)")
+
+class _Scope:
+    __slots__ = ("entries", "pattern")
+
+    def __init__(self):
+        self.entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict() # value -> (label, expires), LRU first
+        self.pattern: Optional["re.Pattern[str]"] = None # rebuilt lazily after changes
+
+class Gazetteer:
+    """
+    Remembers sensitive values the masking model has detected, per scope (e.g. a tenant or session),
+    and finds them again in later texts without the model, under the same mask name.
+    Entries expire `ttl` seconds after they were last seen; each scope keeps at most `max_entries`
+    (least recently seen evicted first), and at most `max_scopes` scopes are kept.
+    """
+    def __init__(self, ttl: float = 3600.0, max_entries: int = 10000, max_scopes: int = 1000):
+        self.ttl, self.max_entries, self.max_scopes = ttl, max_entries, max_scopes
+        self._scopes: "OrderedDict[str, _Scope]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, ttl: float, max_entries: int, max_scopes: int):
+        with self._lock:
+            self.ttl, self.max_entries, self.max_scopes = ttl, max_entries, max_scopes
+
+    def learn(self, scope: str, entities: Iterable[Entity]):
+        """Adds (or refreshes) detected values in `scope`."""
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            s = self._scopes.get(scope)
+            if s is None:
+                s = self._scopes[scope] = _Scope()
+                while len(self._scopes) > self.max_scopes:
+                    self._scopes.popitem(last=False)
+            self._scopes.move_to_end(scope)
+            for value, label in entities:
+                if not value or len(value) > MAX_VALUE_LEN:
+                    continue
+                if s.entries.get(value, ("",))[0] != label:
+                    s.pattern = None
+                s.entries[value] = (label, expires)
+                s.entries.move_to_end(value)
+            while len(s.entries) > self.max_entries:
+                s.entries.popitem(last=False)
+                s.pattern = None
+            metrics.set_gauge("gazetteer_entries", sum(len(x.entries) for x in self._scopes.values()))
+
+    def find(self, scope: str, text: str) -> List[Entity]:
+        """Known values of `scope` that occur in `text`, in order of first occurrence. Refreshes their TTL."""
+        now = time.monotonic()
+        with self._lock:
+            s = self._scopes.get(scope)
+            if s is None or not text:
+                return []
+            self._expire(s, now)
+            if s.pattern is None:
+                s.pattern = trie_regex(s.entries)
+            pattern = s.pattern
+            if pattern is None:
+                return []
+            found: Dict[str, str] = {}
+            for m in pattern.finditer(text):
+                value = m.group()
+                if value not in found and value in s.entries:
+                    label, expires = s.entries[value]
+                    if expires <= now: # after a TTL change, expiry no longer follows last-seen order
+                        del s.entries[value]
+                        s.pattern = None
+                        continue
+                    found[value] = label
+                    s.entries[value] = (label, now + self.ttl)
+                    s.entries.move_to_end(value)
+        if found:
+            metrics.inc("gazetteer_hits_total", len(found))
+        return [Entity(value, label) for value, label in found.items()]
+
+    @staticmethod
+    def _expire(s: _Scope, now: float):
+        # entries are in last-seen order, so expired ones are at the front
+        while s.entries:
+            value, (_, expires) = next(iter(s.entries.items()))
+            if expires > now:
+                break
+            del s.entries[value]
+            s.pattern = None
+
+    def forget(self, scope: Optional[str] = None):
+        """Drops everything learned in `scope`, or in all scopes."""
+        with self._lock:
+            if scope is None:
+                self._scopes.clear()
+            else:
+                self._scopes.pop(scope, None)
@@ -0,0 +1,177 @@
+# src/promptmask/maskmap.py
+
+import re
+from typing import Callable, Dict, Mapping, Optional
+
+class MaskMap(dict):
+    """
+    A mask map (original value -> mask) with its derived lookup structures:
+    the inverse map, single-pass regex matchers for masking and unmasking, and the longest mask length.
+    They are built lazily once and reused for the whole request (mask, unmask, stream unmask).
+
+    It is still a `dict`, so it serializes to JSON and compares equal to plain dicts;
+    any mutation invalidates the compiled state.
+    """
+    __slots__ = ("_inverse", "_mask_re", "_unmask_re", "_max_mask_len")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._invalidate()
+
+    @classmethod
+    def coerce(cls, mask_map: Optional[Mapping[str, str]]) -> "MaskMap":
+        """Returns `mask_map` itself if it is already a MaskMap, else a compiled copy (plain dicts are accepted)."""
+        return mask_map if isinstance(mask_map, cls) else cls(mask_map or {})
+
+    def _invalidate(self):
+        self._inverse: Optional[Dict[str, str]] = None
+        self._mask_re: Optional["re.Pattern[str]"] = None
+        self._unmask_re: Optional["re.Pattern[str]"] = None
+        self._max_mask_len: Optional[int] = None
+
+    @staticmethod
+    def _alternation(keys) -> Optional["re.Pattern[str]"]:
+        keys = [k for k in keys if k]
+        if not keys:
+            return None
+        # longest first, so a value that contains another value wins
+        return re.compile("|".join(re.escape(k) for k in sorted(keys, key=len, reverse=True)))
+
+    @property
+    def inverse(self) -> Dict[str, str]:
+        """mask -> original value"""
+        if self._inverse is None:
+            self._inverse = {mask: original for original, mask in self.items()}
+        return self._inverse
+
+    @property
+    def max_mask_len(self) -> int:
+        if self._max_mask_len is None:
+            self._max_mask_len = max((len(mask) for mask in self.values()), default=0)
+        return self._max_mask_len
+
+    def mask(self, text: str) -> str:
+        """Replaces every original value in `text` with its mask, in a single pass."""
+        if self._mask_re is None:
+            self._mask_re = self._alternation(self.keys())
+        if self._mask_re is None or not text:
+            return text
+        return self._mask_re.sub(lambda m: self[m.group()], text)
+
+    def unmask(self, text: str) -> str:
+        """Replaces every mask in `text` with its original value, in a single pass."""
+        if self._unmask_re is None:
+            self._unmask_re = self._alternation(self.values())
+        if self._unmask_re is None or not text:
+            return text
+        inverse = self.inverse
+        return self._unmask_re.sub(lambda m: inverse[m.group()], text)
+
+    # --- mutation keeps the compiled state consistent ---
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._invalidate()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._invalidate()
+
+    def __ior__(self, other):
+        result = super().__ior__(other)
+        self._invalidate()
+        return result
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._invalidate()
+
+    def setdefault(self, key, default=None):
+        result = super().setdefault(key, default)
+        self._invalidate()
+        return result
+
+    def pop(self, *args):
+        result = super().pop(*args)
+        self._invalidate()
+        return result
+
+    def popitem(self):
+        result = super().popitem()
+        self._invalidate()
+        return result
+
+    def clear(self):
+        super().clear()
+        self._invalidate()
+
+    def copy(self) -> "MaskMap":
+        return MaskMap(self)
+
+    def __reduce__(self):
+        return (MaskMap, (dict(self),))
+
+    def __repr__(self):
+        return f"MaskMap({dict.__repr__(self)})"
+
+class StreamUnmasker:
+    """
+    Incrementally unmasks streamed text whose masks may be split across chunks.
+    Text that might be the start of a mask is held back until the mask is complete, or until it grows
+    longer than the longest known mask, at which point it cannot be one and is released.
+
+    `resolve` optionally maps masks missing from the map to their original value (e.g. self-contained
+    encrypted masks); `max_hold` then bounds how long a pending mask may grow instead of the map.
+    """
+    __slots__ = ("mask_map", "left", "right", "resolve", "max_hold", "_buffer")
+
+    def __init__(self, mask_map: Mapping[str, str], left: str, right: str,
+                 resolve: Optional[Callable[[str], Optional[str]]] = None, max_hold: int = 0):
+        self.mask_map = MaskMap.coerce(mask_map)
+        self.left, self.right = left, right
+        self.resolve, self.max_hold = resolve, max_hold
+        self._buffer = ""
+
+    def feed(self, chunk: str) -> str:
+        """Adds a chunk and returns the text that is safe to emit now."""
+        buf = self._buffer + chunk
+        out = []
+        inverse, left, right = self.mask_map.inverse, self.left, self.right
+        max_len = max(self.mask_map.max_mask_len, self.max_hold)
+        while True:
+            start_pos = buf.find(left)
+            if start_pos == -1:
+                keep = self._partial_left_len(buf) # e.g. "$" may be the start of a split "${"
+                out.append(buf[:len(buf) - keep])
+                buf = buf[len(buf) - keep:]
+                break
+
+            end_pos = buf.find(right, start_pos + len(left))
+            if end_pos == -1:
+                out.append(buf[:start_pos])
+                buf = buf[start_pos:]
+                if max_len and len(buf) > max_len: # too long to be a known mask
+                    out.append(buf[:len(left)])
+                    buf = buf[len(left):]
+                    continue
+                break
+
+            full_mask = buf[start_pos : end_pos + len(right)]
+            original = inverse.get(full_mask)
+            if original is None and self.resolve:
+                original = self.resolve(full_mask)
+            out.append(buf[:start_pos] + (full_mask if original is None else original))
+            buf = buf[end_pos + len(right):]
+        self._buffer = buf
+        return "".join(out)
+
+    def _partial_left_len(self, buf: str) -> int:
+        for k in range(min(len(self.left) - 1, len(buf)), 0, -1):
+            if buf.endswith(self.left[:k]):
+                return k
+        return 0
+
+    def flush(self) -> str:
+        """Returns whatever is still held back; call once the stream has ended."""
+        rest, self._buffer = self._buffer, ""
+        return rest
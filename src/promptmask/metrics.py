@@ -0,0 +1,79 @@
+# src/promptmask/metrics.py
+
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+
+def _key(name: str, labels: Optional[Dict[str, str]] = None) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+class RollingWindow:
+    """Keeps the most recent `size` observations to derive quantiles cheaply."""
+    def __init__(self, size: int = 512):
+        self._values = deque(maxlen=size)
+
+    def add(self, value: float):
+        self._values.append(value)
+
+    def __len__(self):
+        return len(self._values)
+
+    def quantile(self, q: float) -> float:
+        if not self._values:
+            return 0.0
+        ordered = sorted(self._values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class Metrics:
+    """
+    A tiny thread-safe, in-process metrics registry: counters, gauges and summaries.
+    Served as JSON by the web API at `/v1/metrics`.
+    """
+    def __init__(self, window: int = 512):
+        self._lock = threading.Lock()
+        self._window = window
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self._summaries: Dict[str, dict] = {}
+
+    def inc(self, name: str, value: float = 1.0, labels: Optional[Dict[str, str]] = None):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, labels: Optional[Dict[str, str]] = None):
+        key = _key(name, labels)
+        with self._lock:
+            s = self._summaries.get(key)
+            if s is None:
+                s = self._summaries[key] = {"count": 0, "sum": 0.0, "max": 0.0, "window": RollingWindow(self._window)}
+            s["count"] += 1
+            s["sum"] += value
+            s["max"] = max(s["max"], value)
+            s["window"].add(value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            summaries = {
+                key: {
+                    "count": s["count"], "sum": s["sum"], "max": s["max"],
+                    "p50": s["window"].quantile(0.5), "p95": s["window"].quantile(0.95), "p99": s["window"].quantile(0.99),
+                } for key, s in self._summaries.items()
+            }
+            return {"counters": dict(self.counters), "gauges": dict(self.gauges), "summaries": summaries}
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self._summaries.clear()
+
+# process-wide registry
+metrics = Metrics()
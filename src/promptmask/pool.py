@@ -0,0 +1,241 @@
+# src/promptmask/pool.py
+
+import copy
+import time
+import random
+import asyncio
+import threading
+import statistics
+from contextlib import contextmanager
+from typing import Optional, Sequence, Tuple
+
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, InternalServerError
+
+from .metrics import metrics, RollingWindow
+from .utils import logger
+
+EJECT_AFTER_FAILURES = 3
+EJECT_COOLDOWN = 30.0 # seconds before an ejected endpoint is retried without an active probe
+
+class Endpoint:
+    """One local LLM server (OpenAI-compatible) with its clients and live load/health statistics."""
+    def __init__(self, base: str, key: str, model: str, timeout: float, weight: float = 1.0):
+        self.base, self.key, self.model, self.timeout = base, key, model, timeout
+        self.weight = max(float(weight), 0.001)
+        self.client = OpenAI(base_url=base, api_key=key, timeout=timeout)
+        self.async_client = AsyncOpenAI(base_url=base, api_key=key, timeout=timeout)
+        self.configured_model = model # as written in the config, before auto-detection
+        self.outstanding = 0
+        self.ewma_latency: Optional[float] = None
+        self.failures = 0
+        self.ejected_until = 0.0 # monotonic time; 0 = healthy
+        self.ejected_for = "" # "failure" or "latency"
+        self.unsupported = set() # optional request features the server rejected, e.g. "json_schema"
+        self._lock = threading.Lock()
+
+    @property
+    def signature(self) -> Tuple:
+        """Connection settings; endpoints with equal signatures can share clients and connection pools."""
+        return (self.base, self.key, self.timeout)
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    @property
+    def load(self) -> float:
+        return (self.outstanding + 1) / self.weight
+
+    def eject(self, reason: str, cooldown: float = EJECT_COOLDOWN, kind: str = "failure"):
+        """`kind` is "failure" (errors, failed probes) or "latency" (too slow compared to its peers)."""
+        if self.available:
+            logger.warning(f"Ejecting local LLM endpoint {self.base}: {reason}")
+            self.ejected_for = kind
+        elif kind == "failure":
+            self.ejected_for = kind # a failure outranks slowness: a passing probe may then restore it
+        self.ejected_until = time.monotonic() + cooldown
+        self._publish()
+
+    def restore(self):
+        if self.ejected_until:
+            logger.info(f"Local LLM endpoint {self.base} is healthy again.")
+        self.ejected_until, self.failures, self.ewma_latency = 0.0, 0, None
+        self.ejected_for = ""
+        self._publish()
+
+    def reconfigured(self, model: str, configured_model: str, weight: float) -> "Endpoint":
+        """
+        A copy with new settings that shares the clients and starts from the current health statistics.
+        The original is left as is for the snapshot still using it, so a reload that fails later changes nothing.
+        """
+        ep = copy.copy(self)
+        ep.model, ep.configured_model, ep.weight = model, configured_model, weight
+        ep.outstanding = 0 # calls in flight finish on the original
+        ep.unsupported = set(self.unsupported)
+        ep._lock = threading.Lock()
+        return ep
+
+    def _publish(self):
+        labels = {"endpoint": self.base}
+        metrics.set_gauge("llm_endpoint_outstanding", self.outstanding, labels)
+        metrics.set_gauge("llm_endpoint_healthy", 1 if self.available else 0, labels)
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            if ok:
+                self.failures = 0
+                self.ewma_latency = latency if self.ewma_latency is None else 0.8 * self.ewma_latency + 0.2 * latency
+            else:
+                self.failures += 1
+        metrics.observe("llm_endpoint_seconds", latency, {"endpoint": self.base})
+        if self.failures >= EJECT_AFTER_FAILURES:
+            self.eject(f"{self.failures} consecutive failures")
+
+    def __repr__(self):
+        return f"Endpoint({self.base!r}, model={self.model!r}, weight={self.weight})"
+
+class EndpointPool:
+    """
+    Spreads masking calls over several local LLM endpoints.
+
+    Balancing is "p2c" (power of two choices: sample two endpoints by weight, take the less loaded)
+    or "least_outstanding". Endpoints are ejected after repeated failures or when their latency is far
+    above the pool's median. Failed ones come back after a successful health probe or a cooldown,
+    slow ones only after the cooldown.
+    """
+    def __init__(self, endpoints: Sequence[Endpoint], balancer: str = "p2c", eject_latency_factor: float = 3.0):
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint.")
+        self.endpoints = list(endpoints)
+        self.balancer = balancer
+        self.eject_latency_factor = eject_latency_factor
+
+    @classmethod
+    def from_config(cls, llm_api: dict, prev: Optional["EndpointPool"] = None) -> "EndpointPool":
+        """
+        Builds a pool from `llm_api` (its `endpoints` list, or the single `base`/`model`/`key`).
+        Endpoints whose connection settings match one in `prev` reuse its clients and statistics:
+        the same object if its model and weight are unchanged, else a copy (`prev` is never modified).
+        """
+        specs = llm_api.get("endpoints") or [{}]
+        reusable = {ep.signature: ep for ep in prev.endpoints} if prev else {}
+        endpoints = []
+        for spec in specs:
+            base, key = spec.get("base", llm_api["base"]), spec.get("key", llm_api["key"])
+            timeout, model = spec.get("timeout", llm_api["timeout"]), spec.get("model", llm_api.get("model", ""))
+            weight = spec.get("weight", 1.0)
+            old = reusable.pop((base, key, timeout), None)
+            if old:
+                weight = max(float(weight), 0.001)
+                resolved = model or (old.model if old.configured_model == model else "")
+                if (old.model, old.configured_model, old.weight) != (resolved, model, weight):
+                    old = old.reconfigured(resolved, model, weight)
+                endpoints.append(old)
+            else:
+                endpoints.append(Endpoint(base, key, model, timeout, weight))
+        return cls(endpoints, llm_api.get("balancer", "p2c"), llm_api.get("eject_latency_factor", 3.0))
+
+    @property
+    def primary(self) -> Endpoint:
+        return self.endpoints[0]
+
+    def pick(self, exclude: Sequence[Endpoint] = ()) -> Endpoint:
+        now = time.monotonic()
+        for ep in self.endpoints:
+            if ep.ejected_until and now >= ep.ejected_until:
+                ep.restore() # cooldown over: give it a fresh chance
+        candidates = [ep for ep in self.endpoints if ep.available and ep not in exclude]
+        if not candidates: # everything ejected: best effort rather than failing outright
+            candidates = [ep for ep in self.endpoints if ep not in exclude] or self.endpoints
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.balancer == "least_outstanding":
+            return min(candidates, key=lambda ep: ep.load)
+        a, b = random.choices(candidates, weights=[ep.weight for ep in candidates], k=2)
+        return a if a.load <= b.load else b
+
+    @contextmanager
+    def track(self, ep: Endpoint):
+        """Counts the call as outstanding on `ep` and records its latency and outcome."""
+        with ep._lock:
+            ep.outstanding += 1
+        ep._publish()
+        start, ok, cancelled = time.perf_counter(), True, False
+        try:
+            yield ep
+        except asyncio.CancelledError:
+            cancelled = True # the caller gave up; says nothing about the endpoint
+            raise
+        except (APIConnectionError, InternalServerError): # includes timeouts
+            ok = False
+            raise
+        finally:
+            with ep._lock:
+                ep.outstanding -= 1
+            if cancelled:
+                ep._publish()
+            else:
+                ep.record(time.perf_counter() - start, ok)
+                if ok:
+                    self._eject_slow()
+
+    def _eject_slow(self):
+        measured = [ep for ep in self.endpoints if ep.available and ep.ewma_latency is not None]
+        if len(measured) < 3: # need a meaningful median and must keep at least one peer
+            return
+        median = statistics.median(ep.ewma_latency for ep in measured)
+        for ep in measured:
+            if ep.ewma_latency > median * self.eject_latency_factor:
+                ep.eject(f"latency {ep.ewma_latency:.2f}s is over {self.eject_latency_factor}x the pool median {median:.2f}s", kind="latency")
+
+    async def probe(self, timeout: float = 5.0):
+        """
+        Actively checks every endpoint with a cheap `/models` request. A passing probe restores endpoints
+        ejected for failures; it says nothing about generation speed, so latency-ejected ones wait out their cooldown.
+        """
+        async def check(ep: Endpoint):
+            try:
+                await asyncio.wait_for(ep.async_client.models.list(), timeout)
+                if not ep.available and ep.ejected_for != "latency":
+                    ep.restore()
+            except Exception as e:
+                ep.eject(f"health probe failed: {type(e).__name__}")
+        await asyncio.gather(*(check(ep) for ep in self.endpoints))
+
+
+class HedgePolicy:
+    """
+    Decides when to send a duplicate ("hedged") masking request to a second endpoint.
+
+    The hedge delay is the `percentile` of recently observed masking latencies, so only calls that
+    are already slower than usual get hedged. A token bucket caps hedges at `budget` (a fraction)
+    of all calls so that a slow pool is not flooded with duplicates.
+    """
+    MIN_SAMPLES = 20
+
+    def __init__(self, percentile: float = 0.95, budget: float = 0.1, burst: float = 10.0):
+        self.percentile, self.budget, self.burst = percentile, budget, burst
+        self._latencies = RollingWindow(256)
+        self._tokens = burst
+
+    def configure(self, percentile: float, budget: float):
+        self.percentile, self.budget = percentile, budget
+
+    def observe(self, latency: float):
+        self._latencies.add(latency)
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there is not enough history."""
+        if len(self._latencies) < self.MIN_SAMPLES:
+            return None
+        return self._latencies.quantile(self.percentile)
+
+    def on_request(self):
+        self._tokens = min(self.burst, self._tokens + self.budget)
+
+    def try_acquire(self) -> bool:
+        if self._tokens >= 1.0 - 1e-9: # tolerate float drift from fractional refills
+            self._tokens -= 1.0
+            return True
+        metrics.inc("hedge_budget_exhausted_total")
+        return False
@@ -0,0 +1,46 @@
+# src/promptmask/prefilter.py
+
+"""
+A cheap "probably no sensitive data" gate in front of the local LLM.
+Many chat turns ("thanks, now summarize", "continue") come back from the model with an empty mask map
+after a full few-shot prompt. Text that passes every check below is treated as clean without asking it.
+The checks are deliberately conservative: anything that looks like it could name a person, place or
+identifier (digits, symbols, capitalized words mid-sentence, non-ASCII letters) goes to the model.
+"""
+import re
+
+from .rules import find_entities
+
+# letters, whitespace and sentence punctuation only: no digits, @, /, :, _, $, etc.
+_PLAIN_RE = re.compile(r"[A-Za-z\s.,!?;'\"()-]*")
+_WORD_RE = re.compile(r"[A-Za-z']+")
+_SENTENCE_END = (".", "!", "?")
+# capitalized at the start of a sentence, these are not names ("Alice is sick." still goes to the model)
+_SENTENCE_STARTERS = frozenset("""
+    a an the i it its it's we you he she they this that that's these those there here
+    what what's why how when where who which is are was were do does did can could would should
+    and but or so not no yes ok okay sure please thanks thank now then also just great good sounds
+    continue go make write explain give tell show try fix summarize translate let's
+""".split())
+
+def is_benign(text: str, max_chars: int = 64, max_words: int = 12, allow_capitalized: bool = False) -> bool:
+    """
+    True if `text` clearly holds nothing to mask: short, plain ASCII words and punctuation, no rule
+    detector match, and (unless `allow_capitalized`) no capitalized word except "I" and common words starting a sentence.
+    """
+    text = text.strip()
+    if not text or len(text) > max_chars or not _PLAIN_RE.fullmatch(text):
+        return False
+    words = _WORD_RE.findall(text)
+    if len(words) > max_words:
+        return False
+    if not allow_capitalized:
+        sentence_start = True
+        for token in text.split():
+            word = token.strip("\"'()-")
+            if (word and word[0].isupper() and word != "I" and not word.startswith("I'")
+                    and not (sentence_start and word.lower().rstrip(".,!?;") in _SENTENCE_STARTERS)):
+                return False # probably a name
+            if word:
+                sentence_start = token.rstrip("\"')").endswith(_SENTENCE_END)
+    return not find_entities(text)
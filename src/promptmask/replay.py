@@ -0,0 +1,105 @@
+# src/promptmask/replay.py
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .backends import DetectionError, Entity, MaskBackend, build_mask_prompt, parse_mask_response
+from .metrics import metrics
+from .utils import logger
+
+MODES = ("off", "record", "replay")
+
+def fingerprint(messages: List[Dict[str, str]]) -> str:
+    """Identifies a masking prompt (system prompt, examples and input text), whatever model answers it."""
+    return hashlib.sha256(json.dumps(messages, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+class Cassette:
+    """
+    Recorded local-LLM responses in a JSON Lines file, one `{"key", "response", "latency"}` per prompt.
+    Recording appends as it goes, so an interrupted run keeps what it recorded; later lines win.
+    """
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._entries: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        row = json.loads(line)
+                        self._entries[row["key"]] = (row["response"], row.get("latency", 0.0))
+            logger.info(f"Loaded {len(self._entries)} recorded responses from {self.path}")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        return self._entries.get(key)
+
+    def put(self, key: str, response: str, latency: float):
+        with self._lock:
+            self._entries[key] = (response, latency)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "response": response, "latency": round(latency, 6)}, ensure_ascii=False) + "\n")
+
+class ReplayBackend:
+    """
+    Records the raw responses of an LLM backend (`backend.replay = "record"`), or serves recorded
+    responses without any model (`"replay"`), for offline and reproducible benchmarks and tests.
+    Responses are still parsed on every call, so changes to parsing and mask mapping are exercised.
+    With `backend.replay_latency`, a replayed call takes as long as the recorded one did.
+    A prompt that was never recorded fails detection as `{"err": "ReplayMiss"}`.
+    """
+    def __init__(self, config: dict, inner: Optional[MaskBackend], prev: Optional["ReplayBackend"] = None):
+        backend_cfg = config["backend"]
+        self.config, self.inner = config, inner
+        self.mode = backend_cfg.get("replay", "off")
+        self.simulate_latency = backend_cfg.get("replay_latency", False)
+        path = backend_cfg.get("replay_file", "promptmask.replay.jsonl")
+        reuse = isinstance(prev, ReplayBackend) and prev.cassette.path == Path(path)
+        self.cassette = prev.cassette if reuse else Cassette(path)
+        self.signature = inner.signature if inner is not None else ("replay", str(self.cassette.path))
+
+    def _replayed(self, messages: List[Dict[str, str]]) -> Tuple[str, float]:
+        hit = self.cassette.get(fingerprint(messages))
+        if hit is None:
+            metrics.inc("replay_misses_total")
+            logger.warning(f"No recorded response for this prompt in {self.cassette.path}")
+            raise DetectionError("ReplayMiss")
+        metrics.inc("replay_hits_total")
+        return hit
+
+    def detect(self, text: str) -> List[Entity]:
+        messages = build_mask_prompt(text, self.config)
+        if self.mode == "replay":
+            response, latency = self._replayed(messages)
+            if self.simulate_latency:
+                time.sleep(latency)
+        else:
+            start = time.perf_counter()
+            response = self.inner.complete(messages)
+            self.cassette.put(fingerprint(messages), response, time.perf_counter() - start)
+        return parse_mask_response(response, self.config)
+
+    async def adetect(self, text: str) -> List[Entity]:
+        messages = build_mask_prompt(text, self.config)
+        if self.mode == "replay":
+            response, latency = self._replayed(messages)
+            if self.simulate_latency:
+                await asyncio.sleep(latency)
+        else:
+            start = time.perf_counter()
+            response = await self.inner.acomplete(messages)
+            latency = time.perf_counter() - start
+            # the file append would block the event loop
+            await asyncio.get_running_loop().run_in_executor(None, self.cassette.put, fingerprint(messages), response, latency)
+        return parse_mask_response(response, self.config)
+
+    async def warm_up(self):
+        if self.inner is not None:
+            await self.inner.warm_up()
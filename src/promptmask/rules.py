@@ -0,0 +1,49 @@
+# src/promptmask/rules.py
+
+"""
+Regex detectors for common, well-structured sensitive data.
+They are much less thorough than the local LLM (no names, addresses, free-form secrets),
+but run in microseconds, so they serve as a degraded fallback when the LLM is unavailable or too slow.
+"""
+import re
+from typing import Dict, List, Tuple
+
+# Order matters: earlier rules win when matches overlap.
+RULES: List[Tuple[str, "re.Pattern[str]"]] = [
+    ("CREDENTIAL_URL", re.compile(r"\b[a-zA-Z][a-zA-Z0-9+.-]*://[^\s/:@]+:[^\s/@]+@[^\s'\"<>]+")),
+    ("EMAIL", re.compile(r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b")),
+    ("API_KEY", re.compile(
+        r"\b(?:sk|pk|rk)-[A-Za-z0-9_-]{6,}"
+        r"|\bgh[pousr]_[A-Za-z0-9]{20,}"
+        r"|\bAKIA[0-9A-Z]{16}\b"
+        r"|\bxox[abprs]-[A-Za-z0-9-]{10,}"
+        r"|\beyJ[\w-]{8,}\.[\w-]{8,}\.[\w-]{8,}"
+    )),
+    ("CREDIT_CARD_NUMBER", re.compile(r"\b(?:\d{4}[ -]?){3}\d{4}\b")),
+    ("IP_ADDRESS", re.compile(r"\b(?:(?:25[0-5]|2[0-4]\d|1?\d?\d)\.){3}(?:25[0-5]|2[0-4]\d|1?\d?\d)\b")),
+    ("PHONE_NUMBER", re.compile(r"(?<![\w+])(?:\+\d{1,3}[ .-]?)?(?:\(\d{1,4}\)[ .-]?)?\d{3,4}[ .-]?\d{3,4}(?:[ .-]?\d{2,4})?(?!\w)")),
+]
+
+def find_entities(text: str) -> List[Tuple[str, str]]:
+    """Returns non-overlapping (label, value) matches in order of appearance."""
+    taken: List[Tuple[int, int]] = []
+    found: List[Tuple[int, str, str]] = []
+    for label, pattern in RULES:
+        for m in pattern.finditer(text):
+            start, end = m.span()
+            if any(start < t_end and t_start < end for t_start, t_end in taken):
+                continue
+            taken.append((start, end))
+            found.append((start, label, m.group()))
+    return [(label, value) for _, label, value in sorted(found)]
+
+def rule_based_mask_map(text: str, mask_left: str = "${", mask_right: str = "}") -> Dict[str, str]:
+    """Builds a mask map (original -> mask) such as {"a@b.com": "${EMAIL_1}"} from the regex rules."""
+    mask_map: Dict[str, str] = {}
+    counters: Dict[str, int] = {}
+    for label, value in find_entities(text):
+        if value in mask_map:
+            continue
+        counters[label] = counters.get(label, 0) + 1
+        mask_map[value] = f"{mask_left}{label}_{counters[label]}{mask_right}"
+    return mask_map
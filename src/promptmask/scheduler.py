@@ -0,0 +1,234 @@
+# src/promptmask/scheduler.py
+
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from typing import Optional, Tuple, Type
+
+from .metrics import metrics
+from .utils import logger
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+class QueueFullError(RuntimeError):
+    """Raised when the local LLM is saturated and a masking request cannot be admitted."""
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class AdaptiveLimit:
+    """
+    AIMD concurrency limit driven by observed latency.
+
+    The no-load latency is tracked as a slowly-forgetting minimum. While the smoothed latency stays
+    within `tolerance` times that baseline and the limit is actually being used, the limit grows
+    additively (+1 per `limit` completions). When latency inflates or a call times out, it shrinks
+    multiplicatively, at most once per `limit` completions so a single burst is not punished repeatedly.
+    """
+    def __init__(self, min_limit: int = 1, max_limit: int = 64, tolerance: float = 2.0, backoff: float = 0.75, smoothing: float = 0.2):
+        self.min_limit, self.max_limit = min_limit, max_limit
+        self.tolerance, self.backoff, self.smoothing = tolerance, backoff, smoothing
+        self.reset()
+
+    def reset(self):
+        """Forget the learned latency profile, e.g. after the model changed."""
+        self.limit = float(self.min_limit)
+        self._baseline: Optional[float] = None
+        self._ewma: Optional[float] = None
+        self._cooldown = 0
+
+    def _decrease(self):
+        if self._cooldown > 0:
+            return
+        self.limit = max(float(self.min_limit), self.limit * self.backoff)
+        self._cooldown = int(self.limit) + 1
+
+    def on_sample(self, latency: float, inflight: int, timed_out: bool = False):
+        self._cooldown -= 1
+        if timed_out:
+            self._decrease()
+            return
+        if self._baseline is None or latency < self._baseline:
+            self._baseline = latency
+        else:
+            self._baseline += (latency - self._baseline) * 0.01 # drift up slowly so a stale minimum expires
+        self._ewma = latency if self._ewma is None else self._ewma + self.smoothing * (latency - self._ewma)
+
+        if self._ewma > self._baseline * self.tolerance:
+            self._decrease()
+        elif inflight >= int(self.limit): # only probe upward when the current limit is saturated
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+
+class MaskScheduler:
+    """
+    Admission control in front of the local masking LLM.
+
+    At most `max_concurrency` calls run at once; further callers wait in a bounded
+    priority queue (interactive before batch, FIFO within a class). Callers are rejected
+    with `QueueFullError` when the queue is full or they have waited longer than `max_queue_wait`,
+    so overload surfaces as a fast error rather than a pile of timeouts.
+    """
+    def __init__(self, max_concurrency: int = 0, max_queue: int = 0, max_queue_wait: float = 0,
+                 timeout_errors: Tuple[Type[BaseException], ...] = (asyncio.TimeoutError,)):
+        self._active = 0
+        self._waiters = [] # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self.timeout_errors = timeout_errors
+        self.adaptive: Optional[AdaptiveLimit] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None # the loop of the queued callers' futures
+        self.configure(max_concurrency, max_queue, max_queue_wait)
+
+    def _on_loop(self, fn, *args):
+        """
+        Runs `fn` on the scheduler's event loop: now if called from it (or before any caller queued),
+        else handed over thread-safely, e.g. for a config reload running in a worker thread.
+        """
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is not loop:
+                loop.call_soon_threadsafe(fn, *args)
+                return
+        fn(*args)
+
+    def configure(self, max_concurrency: int = 0, max_queue: int = 0, max_queue_wait: float = 0,
+                  adaptive: bool = False, min_concurrency: int = 1, latency_tolerance: float = 2.0):
+        """
+        Updates the limits in place; queued callers and the learned adaptive limit are kept.
+        With `adaptive`, the limit floats between `min_concurrency` and `max_concurrency` (64 if unlimited).
+        Safe to call from any thread: the change is applied on the event loop.
+        """
+        self._on_loop(self._configure, max_concurrency, max_queue, max_queue_wait, adaptive, min_concurrency, latency_tolerance)
+
+    def _configure(self, max_concurrency: int, max_queue: int, max_queue_wait: float,
+                   adaptive: bool, min_concurrency: int, latency_tolerance: float):
+        self.max_concurrency = max_concurrency # 0: unlimited
+        self.max_queue = max_queue # 0: unbounded
+        self.max_queue_wait = max_queue_wait # 0: wait forever
+        if adaptive:
+            max_limit = max_concurrency or 64
+            if self.adaptive is None:
+                self.adaptive = AdaptiveLimit(min_concurrency, max_limit, latency_tolerance)
+            else:
+                self.adaptive.min_limit, self.adaptive.max_limit = min_concurrency, max_limit
+                self.adaptive.tolerance = latency_tolerance
+                self.adaptive.limit = min(max(self.adaptive.limit, min_concurrency), max_limit)
+        else:
+            self.adaptive = None
+        self._wake()
+
+    def reset(self):
+        """Restart adaptive probing from scratch, e.g. when the local model changed. Safe to call from any thread."""
+        self._on_loop(self._reset)
+
+    def _reset(self):
+        if self.adaptive:
+            self.adaptive.reset()
+            self._publish()
+
+    @property
+    def limit(self) -> float:
+        if self.adaptive:
+            return max(1, int(self.adaptive.limit))
+        return self.max_concurrency or float("inf")
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _publish(self):
+        metrics.set_gauge("scheduler_active", self._active)
+        metrics.set_gauge("scheduler_queued", len(self._waiters))
+        metrics.set_gauge("scheduler_limit", self.limit if self.limit != float("inf") else 0)
+
+    def _wake(self):
+        while self._waiters and self._active < self.limit:
+            _, _, fut = heapq.heappop(self._waiters)
+            if fut.done():
+                continue
+            self._active += 1
+            fut.set_result(None)
+        self._publish()
+
+    def _discard(self, fut: asyncio.Future):
+        for i, item in enumerate(self._waiters):
+            if item[2] is fut:
+                self._waiters.pop(i)
+                heapq.heapify(self._waiters)
+                break
+
+    async def acquire(self, priority: str = "interactive"):
+        prio_label = {"priority": priority}
+        if self._active < self.limit and not self._waiters:
+            self._active += 1
+            metrics.observe("scheduler_queue_wait_seconds", 0.0, prio_label)
+            self._publish()
+            return
+        if self.max_queue and len(self._waiters) >= self.max_queue:
+            metrics.inc("scheduler_rejected_total", labels={"reason": "queue_full"})
+            raise QueueFullError(f"Masking queue is full ({self.max_queue} waiting).")
+
+        self._loop = asyncio.get_running_loop()
+        fut = self._loop.create_future()
+        heapq.heappush(self._waiters, (PRIORITIES.get(priority, len(PRIORITIES)), next(self._seq), fut))
+        self._publish()
+        start = time.perf_counter()
+        try:
+            if self.max_queue_wait:
+                await asyncio.wait_for(asyncio.shield(fut), self.max_queue_wait)
+            else:
+                await fut
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled(): # granted right at the deadline
+                return
+            fut.cancel()
+            self._discard(fut)
+            self._publish()
+            metrics.inc("scheduler_rejected_total", labels={"reason": "queue_timeout"})
+            logger.warning(f"Masking request waited {self.max_queue_wait}s in queue, rejecting.")
+            raise QueueFullError(f"Masking queue wait exceeded {self.max_queue_wait}s.")
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release() # slot was handed over just before cancellation
+            else:
+                fut.cancel()
+                self._discard(fut)
+                self._publish()
+            raise
+        finally:
+            metrics.observe("scheduler_queue_wait_seconds", time.perf_counter() - start, prio_label)
+
+    def release(self):
+        self._active -= 1
+        self._wake()
+
+    def record(self, latency: float, timed_out: bool = False):
+        """Feeds one completed call into the latency metrics and the adaptive limit."""
+        metrics.observe("scheduler_call_seconds", latency)
+        if timed_out:
+            metrics.inc("scheduler_timeouts_total")
+        if self.adaptive:
+            self.adaptive.on_sample(latency, self._active, timed_out)
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive"):
+        await self.acquire(priority)
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            yield
+        except self.timeout_errors:
+            timed_out = True
+            raise
+        finally:
+            self.record(time.perf_counter() - start, timed_out)
+            self.release()
@@ -0,0 +1,102 @@
+# src/promptmask/tokens.py
+
+import base64
+import binascii
+import re
+from typing import Optional
+
+from .maskmap import MaskMap
+from .utils import logger
+
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESSIV
+except ImportError: # optional: pip install promptmask[crypto]
+    AESSIV = None
+
+MAX_TOKEN_LEN = 512 # longer values keep a plain mask, so streamed text is never held back indefinitely
+
+class MaskTokenCipher:
+    """
+    Self-contained ("encrypted") masks: `${USER_EMAIL_k7qx...}` carries the original value,
+    encrypted and authenticated with AES-SIV under a shared key, so any instance holding the key
+    can unmask it without the mask map. AES-SIV is deterministic: the same value under the same
+    label always yields the same mask, which keeps masks stable across turns and replicas.
+
+    The ciphertext is lowercase base32, which never contains `_` or uppercase letters,
+    so it parses unambiguously from the uppercase mask label in front of it.
+    """
+    def __init__(self, key: bytes, left: str, right: str):
+        if AESSIV is None:
+            raise ImportError("Encrypted mask tokens require the 'cryptography' package: pip install promptmask[crypto]")
+        if len(key) not in (32, 48, 64):
+            raise ValueError(f"mask_token.key must decode to 32, 48 or 64 bytes, got {len(key)}.")
+        self._key = key
+        self._aead = AESSIV(key)
+        self.left, self.right = left, right
+        # 16-byte SIV tag + at least one byte of value -> at least 28 base32 characters
+        self._token_re = re.compile(re.escape(left) + r"([A-Z0-9_]+?)_([a-z2-7]{28,})" + re.escape(right))
+
+    def __reduce__(self):
+        # rebuilt from the key, e.g. in a worker process (see `promptmask.web.offload`)
+        return type(self), (self._key, self.left, self.right)
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["MaskTokenCipher"]:
+        """Returns a cipher when `mask_token.mode` is "encrypted", else None."""
+        token_cfg = config.get("mask_token", {})
+        if token_cfg.get("mode", "plain") != "encrypted":
+            return None
+        raw_key = token_cfg.get("key", "")
+        if not raw_key:
+            raise ValueError("mask_token.mode is 'encrypted' but no key is set (mask_token.key or PROMPTMASK_TOKEN_KEY).")
+        try:
+            padded = raw_key.replace("-", "+").replace("_", "/") + "=" * (-len(raw_key) % 4) # standard or urlsafe
+            key = base64.b64decode(padded, validate=True)
+        except binascii.Error as e:
+            raise ValueError(f"mask_token.key is not valid base64: {e}") from e
+        wrapper = config["mask_wrapper"]
+        return cls(key, wrapper["left"], wrapper["right"])
+
+    @staticmethod
+    def _label(mask_name: str) -> str:
+        return re.sub(r"[^A-Z0-9_]", "_", mask_name.upper()).strip("_") or "MASKED"
+
+    def encrypt(self, label: str, value: str) -> str:
+        """Returns the self-contained mask for `value`; the label is authenticated along with it."""
+        label = self._label(label)
+        ciphertext = self._aead.encrypt(value.encode("utf-8"), [label.encode("ascii")])
+        encoded = base64.b32encode(ciphertext).decode("ascii").rstrip("=").lower()
+        return f"{self.left}{label}_{encoded}{self.right}"
+
+    def decrypt(self, token: str) -> Optional[str]:
+        """Returns the original value of a self-contained mask, or None if it is not one (or was tampered with)."""
+        m = self._token_re.fullmatch(token)
+        return self._decrypt_match(m) if m else None
+
+    def _decrypt_match(self, m: "re.Match[str]") -> Optional[str]:
+        label, encoded = m.groups()
+        try:
+            ciphertext = base64.b32decode(encoded.upper() + "=" * (-len(encoded) % 8))
+            return self._aead.decrypt(ciphertext, [label.encode("ascii")]).decode("utf-8")
+        except (binascii.Error, InvalidTag, UnicodeDecodeError):
+            return None
+
+    def seal(self, mask_map: MaskMap) -> MaskMap:
+        """Rewrites every mask of `mask_map` into a self-contained one, keeping its name as the label."""
+        sealed = {}
+        strip = len(self.left), len(self.right)
+        for original, mask in mask_map.items():
+            name = mask[strip[0]:len(mask) - strip[1]] if mask.startswith(self.left) and mask.endswith(self.right) else mask
+            token = self.encrypt(name, original)
+            if len(token) > MAX_TOKEN_LEN:
+                logger.debug(f"Value too long for a self-contained mask ({len(token)} chars), keeping {mask}.")
+                token = mask
+            sealed[original] = token
+        return MaskMap(sealed)
+
+    def unmask(self, text: str) -> str:
+        """Replaces every self-contained mask in `text` that decrypts under this key with its original value."""
+        if not text or self.left not in text:
+            return text
+        return self._token_re.sub(lambda m: self._decrypt_match(m) or m.group(), text)
@@ -0,0 +1,70 @@
+# src/promptmask/web/cache.py
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from ..metrics import metrics
+
+CACHE_HEADER = "X-PromptMask-Cache" # "hit" or "miss" on cacheable gateway responses
+
+def is_deterministic(request_data: dict) -> bool:
+    """Whether the upstream should answer this chat request the same way every time: one greedy, non-streamed choice."""
+    return (not request_data.get("stream", False)
+            and request_data.get("temperature") == 0
+            and request_data.get("n", 1) == 1)
+
+class ResponseCache:
+    """
+    Caches masked upstream responses by a hash of a namespace and the masked request body (which
+    includes the model). After masking, requests that differed only in their sensitive data are often
+    byte-identical; a cached masked response is then unmasked with each caller's own mask map.
+    Entries expire `ttl` seconds after they were stored; at most `max_entries` are kept, least recently used evicted first.
+    """
+    def __init__(self, ttl: float = 300.0, max_entries: int = 1000):
+        self.ttl, self.max_entries = ttl, max_entries
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict() # key -> (masked response JSON, expires)
+        self._lock = threading.Lock()
+
+    def configure(self, ttl: float, max_entries: int):
+        with self._lock:
+            self.ttl, self.max_entries = ttl, max_entries
+            self._evict()
+
+    @staticmethod
+    def key(namespace: str, masked_request: dict) -> str:
+        """`namespace` separates what must not share responses, e.g. upstreams and profiles."""
+        body = json.dumps(masked_request, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(f"{namespace}\n{body}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """The cached masked response JSON, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        metrics.inc("response_cache_hits_total" if entry is not None else "response_cache_misses_total")
+        return entry[0] if entry is not None else None
+
+    def put(self, key: str, masked_response: bytes):
+        """Stores the upstream's response body as received: it is parsed (and unmasked) per caller on use."""
+        with self._lock:
+            self._entries[key] = (masked_response, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        metrics.set_gauge("response_cache_entries", len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            metrics.set_gauge("response_cache_entries", 0)
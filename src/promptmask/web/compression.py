@@ -0,0 +1,109 @@
+# src/promptmask/web/compression.py
+
+import gzip
+from typing import List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError: # gzip only
+    brotli = None
+
+from ..metrics import metrics
+
+# Already compressed, or streamed: event streams must reach the client event by event.
+SKIP_TYPES = ("text/event-stream", "image/", "audio/", "video/", "application/zip", "application/gzip")
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """The preferred encoding, "br" or "gzip", that `Accept-Encoding` allows (q > 0), else None."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name.strip()] = q
+    wildcard = accepted.get("*", 0.0)
+    candidates = [name for name in (("br", "gzip") if brotli else ("gzip",)) if accepted.get(name, wildcard) > 0]
+    return max(candidates, key=lambda name: accepted.get(name, wildcard), default=None) # ties keep br first
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    """Module-level so that large bodies can be compressed in the offload pool."""
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+class CompressionMiddleware:
+    """
+    Compresses complete (non-streamed) responses with brotli or gzip, as negotiated by `Accept-Encoding`,
+    according to `[web.compression]`. Pure ASGI: streamed responses, whose first body message announces
+    more to come, pass through untouched so SSE is not delayed. Bodies at least `web.offload.threshold_bytes`
+    long are compressed in the offload pool.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        state = scope["app"].state if "app" in scope else None
+        prompt_masker = getattr(state, "prompt_masker", None)
+        web_cfg = prompt_masker.config.get("web", {}) if prompt_masker else {}
+        cfg = web_cfg.get("compression", {})
+        headers = dict((k.lower(), v) for k, v in scope["headers"])
+        encoding = negotiate(headers.get(b"accept-encoding", b"").decode("latin-1")) if cfg.get("enabled", True) else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            # the first body message decides
+            body = message.get("body", b"")
+            response_headers: List[Tuple[bytes, bytes]] = list(start_message.get("headers", []))
+            names = {k.lower(): v for k, v in response_headers}
+            content_type = names.get(b"content-type", b"").decode("latin-1")
+            if (message.get("more_body", False) or b"content-encoding" in names
+                    or len(body) < cfg.get("min_size", 1024) or content_type.startswith(SKIP_TYPES)):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            level = cfg.get("brotli_quality", 4) if encoding == "br" else cfg.get("gzip_level", 6)
+            offloader = getattr(state, "offloader", None)
+            if offloader is not None:
+                compressed = await offloader.run(web_cfg, len(body), compress, body, encoding, level)
+            else:
+                compressed = compress(body, encoding, level)
+            if len(compressed) >= len(body):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+            metrics.inc("response_compression_saved_bytes_total", len(body) - len(compressed), {"encoding": encoding})
+            response_headers = [(k, v) for k, v in response_headers if k.lower() not in (b"content-length", b"vary")]
+            vary = names.get(b"vary")
+            response_headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(compressed)).encode()),
+                (b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"),
+            ]
+            await send({**start_message, "headers": response_headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
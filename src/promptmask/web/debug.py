@@ -0,0 +1,178 @@
+# src/promptmask/web/debug.py
+
+import asyncio
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+
+from ..core import PromptMask
+
+router = APIRouter(prefix="/v1/debug", tags=["Debug"])
+
+MAX_CAPTURE_SECONDS = 120.0
+MAX_SNAPSHOTS = 8 # tracemalloc snapshots kept for diffing
+
+def require_debug_token(request: Request):
+    """
+    Debug endpoints are off unless `web.debug.enabled`, and need `Authorization: Bearer <web.debug.token>`
+    (or the PROMPTMASK_DEBUG_TOKEN environment variable). They look like missing routes when disabled.
+    """
+    debug_cfg = request.app.state.prompt_masker.config.get("web", {}).get("debug", {})
+    if not debug_cfg.get("enabled"):
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = debug_cfg.get("token", "")
+    if not token:
+        raise HTTPException(status_code=403, detail="Debug endpoints need web.debug.token (or PROMPTMASK_DEBUG_TOKEN) to be set.")
+    scheme, _, given = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(given.encode(), token.encode()):
+        raise HTTPException(status_code=401, detail="Invalid debug token.", headers={"WWW-Authenticate": "Bearer"})
+
+class _Captures:
+    """One profile capture at a time (profilers are per-process), and the kept tracemalloc snapshots."""
+    def __init__(self):
+        self.profiling = False
+        self.snapshots: List[Tuple[int, float, tracemalloc.Snapshot]] = [] # (id, taken at, snapshot)
+        self.next_id = 1
+
+_captures = _Captures()
+
+def _sample_stacks(thread_id: int, seconds: float, interval: float) -> Counter:
+    """Samples the stack of one thread (the event loop) into collapsed-stack counts."""
+    counts: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        if stack:
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return counts
+
+@router.post("/profile", response_class=PlainTextResponse, dependencies=[Depends(require_debug_token)])
+async def profile(
+    seconds: float = Query(10.0, gt=0, le=MAX_CAPTURE_SECONDS),
+    format: str = Query("pstats", pattern="^(pstats|collapsed)$"),
+    sort: str = Query("cumulative", description="pstats sort key, e.g. cumulative, tottime, ncalls"),
+    limit: int = Query(50, gt=0, le=1000),
+    interval_ms: float = Query(5.0, gt=0, le=1000, description="collapsed: sampling interval"),
+):
+    """
+    Profiles the event loop thread, where the gateway does its work, for `seconds` while live traffic runs.
+    `pstats`: deterministic cProfile statistics, top `limit` by `sort`.
+    `collapsed`: sampled stacks in the collapsed format read by flamegraph.pl and speedscope.
+    Work in worker threads (sync masking calls, llama.cpp) is not covered.
+    """
+    if _captures.profiling:
+        raise HTTPException(status_code=409, detail="A profile capture is already running.")
+    _captures.profiling = True
+    try:
+        if format == "collapsed":
+            counts = await asyncio.get_running_loop().run_in_executor(
+                None, _sample_stacks, threading.get_ident(), seconds, interval_ms / 1000)
+            return "\n".join(f"{stack} {n}" for stack, n in counts.most_common()) + "\n"
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e: # another profiler (e.g. a debugger) is active
+            raise HTTPException(status_code=409, detail=str(e))
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+        out = io.StringIO()
+        try:
+            pstats.Stats(profiler, stream=out).sort_stats(sort).print_stats(limit)
+        except KeyError:
+            raise HTTPException(status_code=400, detail=f"Unknown pstats sort key {sort!r}.")
+        return out.getvalue()
+    finally:
+        _captures.profiling = False
+
+def _stats(stats: list, limit: int) -> List[Dict]:
+    rows = []
+    for stat in stats[:limit]:
+        frame = stat.traceback[0]
+        row = {"file": frame.filename, "line": frame.lineno, "size_kib": round(stat.size / 1024, 1), "count": stat.count}
+        if hasattr(stat, "size_diff"):
+            row.update(size_diff_kib=round(stat.size_diff / 1024, 1), count_diff=stat.count_diff)
+        rows.append(row)
+    return rows
+
+@router.post("/tracemalloc/snapshot", dependencies=[Depends(require_debug_token)])
+async def tracemalloc_snapshot(
+    frames: int = Query(1, ge=1, le=64, description="stack depth recorded per allocation when tracing starts"),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    limit: int = Query(30, gt=0, le=500),
+    compare_to: Optional[int] = Query(None, description="snapshot id to diff against; default the previous one"),
+):
+    """
+    Takes a tracemalloc snapshot (starting tracing on first use) and returns the top allocation sites,
+    plus the growth since an earlier snapshot, e.g. to chase stream buffers that keep growing.
+    Tracing slows allocations down; stop it with DELETE /v1/debug/tracemalloc when done.
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    snap_id, _captures.next_id = _captures.next_id, _captures.next_id + 1
+    base = next((s for s in _captures.snapshots if s[0] == compare_to), None) if compare_to else \
+        (_captures.snapshots[-1] if _captures.snapshots else None)
+    if compare_to and base is None:
+        raise HTTPException(status_code=404, detail=f"No kept snapshot {compare_to}; kept: {[s[0] for s in _captures.snapshots]}.")
+    _captures.snapshots = (_captures.snapshots + [(snap_id, time.time(), snapshot)])[-MAX_SNAPSHOTS:]
+
+    current, peak = tracemalloc.get_traced_memory()
+    result = {
+        "id": snap_id,
+        "traced_kib": round(current / 1024, 1),
+        "peak_kib": round(peak / 1024, 1),
+        "top": _stats(snapshot.statistics(group_by), limit),
+    }
+    if base is not None:
+        result["compared_to"] = base[0]
+        result["growth"] = _stats(snapshot.compare_to(base[2], group_by), limit)
+    return result
+
+@router.delete("/tracemalloc", dependencies=[Depends(require_debug_token)])
+async def tracemalloc_stop():
+    """Stops tracing and drops the kept snapshots."""
+    tracemalloc.stop()
+    _captures.snapshots.clear()
+    return {"status": "stopped"}
+
+@router.get("/tasks", dependencies=[Depends(require_debug_token)])
+async def tasks(request: Request):
+    """asyncio task counts by coroutine, and the masking and upstream requests in flight."""
+    by_coro = Counter()
+    for task in asyncio.all_tasks():
+        coro = task.get_coro()
+        by_coro[getattr(coro, "__qualname__", type(coro).__name__)] += 1
+    prompt_masker: PromptMask = request.app.state.prompt_masker
+    scheduler = prompt_masker._scheduler
+    upstreams = getattr(request.app.state, "upstreams", None)
+    return {
+        "tasks": sum(by_coro.values()),
+        "tasks_by_coroutine": dict(by_coro.most_common()),
+        "masking": {"active": scheduler.active, "queued": scheduler.queued,
+                    "limit": scheduler.limit if scheduler.limit != float("inf") else None},
+        "upstreams": {u.name: u.inflight for u in upstreams.upstreams(prompt_masker.config.get("web", {})).values()} if upstreams else {},
+        "threads": threading.active_count(),
+    }
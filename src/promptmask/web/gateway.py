@@ -2,22 +2,221 @@
 
 import httpx
 import json
+import anyio
 from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
 import asyncio
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
 
 from ..core import PromptMask
+from ..metrics import metrics
 from ..utils import logger
+from . import offload
+from .cache import CACHE_HEADER, ResponseCache, is_deterministic
+from .offload import Offloader
+from .upstreams import Upstream
 
 router = APIRouter(prefix="/gateway")
 
+T = TypeVar("T")
+DISCONNECT_POLL_INTERVAL = 0.1 # seconds
+CLIENT_CLOSED_REQUEST = 499 # nginx convention; the client never sees it
+DEADLINE_HEADER = "X-PromptMask-Deadline" # request budget in seconds, masking + upstream
+FALLBACK_HEADER = "X-PromptMask-Fallback" # set on responses whose masking was degraded
+SCOPE_HEADER = "X-PromptMask-Scope" # tenant/session whose learned values the gazetteer may reuse
+PROFILE_HEADER = "X-PromptMask-Profile" # named config profile, see `PromptMask.profile`
+PROFILE_PREFIX = "/p/" # /p/<profile>/... selects a profile for clients that can only set a base URL
+
+async def await_or_disconnect(request: Request, aw: Awaitable[T], poll_interval: float = DISCONNECT_POLL_INTERVAL) -> T:
+    """
+    Awaits `aw` while watching for the client to disconnect.
+    On disconnect the work is cancelled, which closes its HTTP connection to the local LLM or
+    upstream, so the server can abort generation instead of finishing a response nobody reads.
+    """
+    task = asyncio.ensure_future(aw)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info("Client disconnected, cancelling in-flight gateway work.")
+                metrics.inc("gateway_client_disconnects_total")
+                raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request.")
+    finally:
+        if not task.done():
+            task.cancel()
+            with anyio.CancelScope(shield=True):
+                await asyncio.gather(task, return_exceptions=True)
+
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse that always closes its body iterator and runs `on_close`
+    (e.g. the upstream response's `aclose`), including when the client disconnects mid-stream.
+    """
+    def __init__(self, *args, on_close: Optional[Callable[[], Awaitable[None]]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                if hasattr(self.body_iterator, "aclose"):
+                    await self.body_iterator.aclose()
+                if self._on_close:
+                    await self._on_close()
+
+class ProfilePathMiddleware:
+    """Maps `/p/<profile>/<path>` to `/<path>` with the profile header set (pure ASGI, so streaming is untouched)."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(PROFILE_PREFIX):
+            name, _, rest = scope["path"][len(PROFILE_PREFIX):].partition("/")
+            header = PROFILE_HEADER.lower().encode()
+            headers = [(k, v) for k, v in scope["headers"] if k.lower() != header] + [(header, name.encode())]
+            scope = {**scope, "path": "/" + rest, "raw_path": ("/" + rest).encode(), "headers": headers}
+        await self.app(scope, receive, send)
+
+def request_masker(request: Request) -> PromptMask:
+    """The PromptMask for this request: the profile selected by header or path prefix, else the default one."""
+    name = request.headers.get(PROFILE_HEADER)
+    try:
+        return request.app.state.prompt_masker.profile(name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown PromptMask profile '{name}'.")
+
+def request_deadline(request: Request, web_cfg: dict) -> Optional[float]:
+    """The request's total budget in seconds from the deadline header, else `web.request_deadline` (0 = none)."""
+    raw = request.headers.get(DEADLINE_HEADER)
+    if raw:
+        try:
+            deadline = float(raw)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid {DEADLINE_HEADER} header, expected seconds: {raw!r}")
+        if deadline > 0:
+            return deadline
+    return web_cfg.get("request_deadline") or None
+
+async def mask_with_fallback(request: Request, prompt_masker: PromptMask, messages: List[Dict[str, str]],
+                             web_cfg: dict, timeout: Optional[float]) -> Tuple[List[Dict[str, str]], Dict[str, str], Optional[str]]:
+    """
+    Masks messages with the local LLM within `timeout` seconds.
+    If masking overruns its share of the deadline or fails, degrade to the `web.mask_fallback` strategy
+    rather than failing the whole request. Returns (masked_messages, mask_map, fallback_used).
+    """
+    start = time.perf_counter()
+    reason = None
+    try:
+        mask_map = await await_or_disconnect(
+            request, asyncio.wait_for(prompt_masker.async_detect_messages(
+                messages, priority="interactive", scope=request.headers.get(SCOPE_HEADER)), timeout)
+        )
+        if "err" in mask_map:
+            reason = "error"
+    except asyncio.TimeoutError:
+        reason = "timeout"
+    if reason is None:
+        masked_messages = messages
+        if mask_map:
+            size = sum(len(m.get("content") or "") for m in messages)
+            masked_messages = await offloader(request).run(web_cfg, size, offload.mask_messages, messages, mask_map)
+        metrics.observe("gateway_mask_seconds", time.perf_counter() - start)
+        return masked_messages, mask_map, None
+    metrics.observe("gateway_mask_seconds", time.perf_counter() - start)
+
+    strategy = web_cfg.get("mask_fallback", "rules")
+    metrics.inc("gateway_mask_fallback_total", labels={"reason": reason, "strategy": strategy})
+    if strategy != "rules":
+        # Never forward unmasked data: without a fallback the request has to fail.
+        raise HTTPException(status_code=502 if reason == "error" else 504, detail=f"Masking failed ({reason}) and no fallback is configured.")
+    logger.warning(f"Masking {reason}, falling back to rule-based redaction.")
+    masked_messages, mask_map = prompt_masker.rule_mask_messages(messages)
+    return masked_messages, mask_map, strategy
+
 async def unmask_sse_stream(response: httpx.Response, mask_map: dict, prompt_masker: PromptMask):
     """
     unmask SSE in realtime
     """
-    buffer, content_buffer = "", "" # SSE chunk / accumulate delta content
-    inverted_map = {mask: original for original, mask in mask_map.items()}
-    left_wrapper, right_wrapper = prompt_masker.config["mask_wrapper"]["left"], prompt_masker.config["mask_wrapper"]["right"]
+    try:
+        async for chunk in _unmask_sse_lines(response, mask_map, prompt_masker):
+            yield chunk
+    finally:
+        await response.aclose() # release the upstream connection even if the consumer stopped early
+
+async def coalesce_stream(stream: AsyncIterator[str], flush_interval: float, flush_bytes: int) -> AsyncIterator[str]:
+    """
+    Batches the chunks of `stream` into fewer, larger writes (one send per batch instead of one per token).
+    The first chunk goes out at once; later ones are held at most `flush_interval` seconds, or until
+    `flush_bytes` are buffered, so streaming still looks live. A `flush_interval` of 0 passes chunks through.
+    """
+    if flush_interval <= 0:
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            if hasattr(stream, "aclose"):
+                await stream.aclose()
+        return
+
+    loop = asyncio.get_running_loop()
+    iterator = stream.__aiter__()
+    pending: Optional[asyncio.Future] = None
+    buffer: List[str] = []
+    size, flush_at, first = 0, 0.0, True
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            if buffer:
+                done, _ = await asyncio.wait({pending}, timeout=max(0.0, flush_at - loop.time()))
+                if not done: # the window closed while upstream was quiet
+                    yield "".join(buffer)
+                    buffer, size = [], 0
+                    continue
+            try:
+                chunk = await pending
+            except StopAsyncIteration:
+                break
+            finally:
+                if pending.done():
+                    pending = None
+            if first:
+                first = False
+                yield chunk
+                continue
+            if not buffer:
+                flush_at = loop.time() + flush_interval
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= flush_bytes:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
+            with anyio.CancelScope(shield=True):
+                await asyncio.gather(pending, return_exceptions=True)
+        if hasattr(stream, "aclose"):
+            with anyio.CancelScope(shield=True):
+                await stream.aclose()
+
+def _tail_event(last_chunk: dict, rest: str) -> str:
+    """An SSE event carrying text the unmasker still held back, shaped like the stream's last chunk."""
+    chunk = {k: last_chunk[k] for k in ("id", "object", "created", "model") if k in last_chunk}
+    chunk["choices"] = [{"index": 0, "delta": {"content": rest}, "finish_reason": None}]
+    return f"data: {json.dumps(chunk)}\n\n"
+
+async def _unmask_sse_lines(response: httpx.Response, mask_map: dict, prompt_masker: PromptMask):
+    buffer = "" # SSE chunk
+    unmasker = prompt_masker._stream_unmasker(mask_map) # accumulates delta content across chunks
+    last_chunk: dict = {}
     
     async for line in response.aiter_lines():
         if not line.strip():
@@ -31,43 +230,24 @@ async def unmask_sse_stream(response: httpx.Response, mask_map: dict, prompt_mas
 
                 if json_str == "[DONE]":
                     # logger.debug(f"data: [DONE]\n\n")
+                    if rest := unmasker.flush(): # the stream ended without a finish_reason
+                        yield _tail_event(last_chunk, rest)
                     buffer = ""
                     continue
                 
                 chunk_data = json.loads(json_str)
-                output_content_this_chunk = ""
+                last_chunk = chunk_data
+                choice = (chunk_data.get("choices") or [{}])[0]
                 
                 # Unmask a delta content chunk
-                if (delta := chunk_data.get("choices", [{}])[0].get("delta")) and (content := delta.get("content")): #py38
+                if (delta := choice.get("delta")) and (content := delta.get("content")): #py38
                     delta["original_content"] = content # Keep original content
-                    content_buffer += content
-                    
-                    while True:
-                        start_pos = content_buffer.find(left_wrapper)
-                        if start_pos == -1:
-                            # No more masks, flush buffer and break
-                            output_content_this_chunk += content_buffer
-                            content_buffer = ""
-                            break
-                        
-                        end_pos = content_buffer.find(right_wrapper, start_pos+len(left_wrapper))
-                        if end_pos == -1:
-                            # Found a partial mask, flush text before it and keep the partial mask in buffer
-                            output_content_this_chunk += content_buffer[:start_pos]
-                            content_buffer = content_buffer[start_pos:]
-                            break
-
-                        # Found a complete mask
-                        text_before_mask = content_buffer[:start_pos]
-                        full_mask = content_buffer[start_pos : end_pos + len(right_wrapper)]
-                        
-                        unmasked_value = inverted_map.get(full_mask, full_mask)
-                        
-                        output_content_this_chunk += text_before_mask + unmasked_value
-                        content_buffer = content_buffer[end_pos + len(right_wrapper):]
-
-                    delta["content"] = output_content_this_chunk
-
+                    delta["content"] = unmasker.feed(content)
+                    if choice.get("finish_reason"): # last content arrives with the finish_reason
+                        delta["content"] += unmasker.flush()
+                    yield f"data: {json.dumps(chunk_data)}\n\n"
+                elif choice.get("finish_reason") and isinstance(choice.get("delta"), dict) and (rest := unmasker.flush()):
+                    choice["delta"]["content"] = rest # release text held back as a possible mask
                     yield f"data: {json.dumps(chunk_data)}\n\n"
                 else:
                      yield f"{buffer}\n"
@@ -78,69 +258,242 @@ async def unmask_sse_stream(response: httpx.Response, mask_map: dict, prompt_mas
         else: # e.g.: event, id, retry
             yield f"{buffer}\n"
             buffer = ""
+    if rest := unmasker.flush(): # cut off without [DONE]
+        yield _tail_event(last_chunk, rest)
+
+
+HEADERS_BLACKLIST = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers', 'transfer-encoding', 'upgrade', 'host', 'content-length', 'content-encoding'}
+
+def cleanup_headers(headers) -> Dict[str, str]:
+    """Drops hop-by-hop headers and PromptMask's own control headers."""
+    return {k: v for k, v in headers.items() if k.lower() not in HEADERS_BLACKLIST and not k.lower().startswith("x-promptmask-")}
 
+def upstream_headers(request: Request, upstream: Upstream) -> Dict[str, str]:
+    """The client's headers to forward to `upstream`."""
+    headers = cleanup_headers(request.headers)
+    if upstream.key: # the upstream's own credentials replace the client's
+        headers = {k: v for k, v in headers.items() if k.lower() != "authorization"}
+        headers["Authorization"] = f"Bearer {upstream.key}"
+    return headers
+
+CREDENTIAL_HEADERS = ("authorization", "api-key", "x-api-key")
+
+def cache_namespace(request: Request, upstream: Upstream, forwarded_headers: Dict[str, str]) -> str:
+    """
+    What cached responses must not be shared across: the upstream, the profile and, when the client's own
+    credentials are forwarded (no upstream `key`), those credentials, so a hit never skips the upstream's auth check.
+    """
+    namespace = f"{upstream.name}\n{request.headers.get(PROFILE_HEADER, '')}"
+    if not upstream.key:
+        credentials = sorted((k.lower(), v) for k, v in forwarded_headers.items() if k.lower() in CREDENTIAL_HEADERS)
+        namespace += f"\n{credentials}" # only ever stored hashed, see ResponseCache.key
+    return namespace
+
+def offloader(request: Request) -> Offloader:
+    return request.app.state.offloader
+
+async def read_json(request: Request, web_cfg: dict):
+    """The request's JSON body, parsed in the offload pool when it is large."""
+    body = await request.body()
+    try:
+        return await offloader(request).run(web_cfg, len(body), offload.loads, body)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body.")
+
+async def unmask_response(request: Request, data: bytes, mask_map: Dict[str, str], prompt_masker: PromptMask,
+                          web_cfg: dict, headers: Dict[str, str]) -> Response:
+    """Unmasks the message of a (non-streamed) chat completion given as raw JSON, in the offload pool when it is large."""
+    body = await offloader(request).run(web_cfg, len(data), offload.unmask_completion,
+                                        data, mask_map, prompt_masker._snapshot.tokens)
+    return Response(body, media_type="application/json", headers=headers)
 
 @router.post("/v1/chat/completions")
 async def chat_completions_gateway(request: Request):
     """
     API gateway to mask and unmask OpenAI Chat Completions API
     """
-    prompt_masker: PromptMask = request.app.state.prompt_masker
-    client: httpx.AsyncClient = request.app.state.httpx_client
+    prompt_masker = request_masker(request)
+
+    config = prompt_masker.config # pin one config snapshot for this request
+    web_cfg = config.get("web", {})
+
+    request_data = await read_json(request, web_cfg)
 
-    upstream_base_url = prompt_masker.config.get("web", {}).get("upstream_oai_api_base")
-    if not upstream_base_url:
+    upstream: Optional[Upstream] = request.app.state.upstreams.route(web_cfg, request_data.get("model"))
+    if upstream is None:
         raise HTTPException(
             status_code=501,
-            detail="Upstream OpenAI API base URL ('upstream_oai_api_base') is not configured in PromptMask config."
+            detail="No upstream for this model: configure 'upstream_oai_api_base' or a matching [web.upstreams] entry in PromptMask config."
         )
+    client = upstream.client
 
-    try:
-        request_data = await request.json()
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=400, detail="Invalid JSON body.")
+    started = time.monotonic()
+    deadline = request_deadline(request, web_cfg)
+    mask_timeout = deadline * web_cfg.get("mask_deadline_share", 0.4) if deadline else None
 
     messages = request_data.get("messages", [])
-    masked_messages, mask_map = await prompt_masker.async_mask_messages(messages)
+    masked_messages, mask_map, fallback = await mask_with_fallback(request, prompt_masker, messages, web_cfg, mask_timeout)
     request_data["messages"] = masked_messages
+    extra_headers = {FALLBACK_HEADER: fallback} if fallback else {}
+
+    # The rest of the budget bounds each upstream phase (connect, each read), not the whole stream.
+    upstream_timeout = max(0.1, deadline - (time.monotonic() - started)) if deadline else httpx.USE_CLIENT_DEFAULT
 
     is_stream = request_data.get("stream", False)
-    upstream_url = f"{upstream_base_url.rstrip('/')}/chat/completions"
+    upstream_url = upstream.url("chat/completions")
+
+    headers_to_forward = upstream_headers(request, upstream)
 
-    headers_blacklist={'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers', 'transfer-encoding', 'upgrade', 'host', 'content-length', 'content-encoding'}
-    cleanup_headers = lambda mydict: {k:v for k,v in mydict.items() if k.lower() not in headers_blacklist}
-    headers_to_forward = cleanup_headers(request.headers)
+    cache_key = None
+    cache_cfg = web_cfg.get("response_cache", {})
+    if cache_cfg.get("enabled") and is_deterministic(request_data):
+        cache: ResponseCache = request.app.state.response_cache
+        cache.configure(cache_cfg.get("ttl", 300.0), cache_cfg.get("max_entries", 1000))
+        cache_key = cache.key(cache_namespace(request, upstream, headers_to_forward), request_data)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return await unmask_response(request, cached, mask_map, prompt_masker, web_cfg, {**extra_headers, CACHE_HEADER: "hit"})
+        extra_headers[CACHE_HEADER] = "miss"
 
+    upstream.acquire()
+    status, released_by_stream = None, False
     try:
         if is_stream:
             upstream_req = client.build_request(
-                "POST", upstream_url, json=request_data, headers=headers_to_forward, timeout=None
+                "POST", upstream_url, json=request_data, headers=headers_to_forward, timeout=upstream_timeout
             )
-            upstream_resp = await client.send(upstream_req, stream=True)
+            upstream_resp = await await_or_disconnect(request, client.send(upstream_req, stream=True))
+            status = upstream_resp.status_code
+            if upstream_resp.is_error:
+                await upstream_resp.aread() # load the error body (and release the connection) for the handler below
             upstream_resp.raise_for_status()
 
-            return StreamingResponse(
-                unmask_sse_stream(upstream_resp, mask_map, prompt_masker),
+            async def close_stream():
+                try:
+                    await upstream_resp.aclose()
+                finally:
+                    await upstream.release(status)
+
+            sse_cfg = web_cfg.get("sse", {})
+            response = ClosingStreamingResponse(
+                coalesce_stream(unmask_sse_stream(upstream_resp, mask_map, prompt_masker),
+                                sse_cfg.get("flush_interval", 0.01), sse_cfg.get("flush_bytes", 16384)),
                 media_type="text/event-stream",
-                headers=cleanup_headers(dict(upstream_resp.headers))
+                headers={**cleanup_headers(dict(upstream_resp.headers)), **extra_headers},
+                on_close=close_stream,
             )
+            released_by_stream = True
+            return response
         else: # non-stream
-            upstream_resp = await client.post(upstream_url, json=request_data, headers=headers_to_forward)
+            upstream_resp = await await_or_disconnect(
+                request, client.post(upstream_url, json=request_data, headers=headers_to_forward, timeout=upstream_timeout)
+            )
+            status = upstream_resp.status_code
             upstream_resp.raise_for_status()
             
             # 3. Unmask resp
-            response_data = upstream_resp.json()
-            if response_data.get("choices"):
-                content = response_data["choices"][0].get("message", {}).get("content", "")
-                if content:
-                    unmasked_content = prompt_masker.unmask_str(content, mask_map)
-                    response_data["choices"][0]["message"]["content"] = unmasked_content
-            
-            return response_data
+            if cache_key is not None:
+                cache.put(cache_key, upstream_resp.content) # still masked: shared by every caller with this masked request
+            return await unmask_response(request, upstream_resp.content, mask_map, prompt_masker, web_cfg, extra_headers)
             
+    except HTTPException:
+        raise
+    except httpx.TimeoutException as e:
+        logger.error(f"Upstream API timed out within the request deadline: {e}")
+        raise HTTPException(status_code=504, detail="Upstream API timed out within the request deadline.")
+    except httpx.HTTPStatusError as e:
+        logger.error(f"Upstream API error: {e.response.status_code} - {e.response.text}")
+        raise HTTPException(status_code=e.response.status_code, detail=e.response.json())
+    except Exception as e:
+        logger.error(f"Gateway error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not released_by_stream:
+            await upstream.release(status)
+
+async def mask_inputs_with_fallback(request: Request, prompt_masker: PromptMask, inputs: List[str],
+                                    web_cfg: dict, timeout: Optional[float]) -> Tuple[List[str], Optional[str]]:
+    """
+    Masks a batch of texts with the local LLM, `web.embeddings_mask_concurrency` at a time, within `timeout` seconds.
+    Duplicate inputs are masked once. Inputs whose masking failed, or all of them on timeout,
+    degrade to the `web.mask_fallback` strategy. Returns (masked_inputs, fallback_used).
+    """
+    start = time.perf_counter()
+    results = None
+    try:
+        results = await await_or_disconnect(
+            request, asyncio.wait_for(prompt_masker.amask_batch(
+                inputs, web_cfg.get("embeddings_mask_concurrency", 8), priority="batch",
+                scope=request.headers.get(SCOPE_HEADER)), timeout)
+        )
+        failed = [i for i, (_, mask_map) in enumerate(results) if "err" in mask_map]
+        reason = "error" if failed else None
+    except asyncio.TimeoutError:
+        failed, reason = list(range(len(inputs))), "timeout"
+    metrics.observe("gateway_embeddings_mask_seconds", time.perf_counter() - start)
+    masked = [masked_text for masked_text, _ in results] if results else list(inputs)
+    if reason is None:
+        return masked, None
+
+    strategy = web_cfg.get("mask_fallback", "rules")
+    metrics.inc("gateway_mask_fallback_total", labels={"reason": reason, "strategy": strategy})
+    if strategy != "rules":
+        raise HTTPException(status_code=502 if reason == "error" else 504, detail=f"Masking failed ({reason}) and no fallback is configured.")
+    logger.warning(f"Masking {reason} for {len(failed)} of {len(inputs)} inputs, falling back to rule-based redaction.")
+    for i in failed:
+        masked[i] = prompt_masker.rule_mask_str(inputs[i])[0]
+    return masked, strategy
+
+@router.post("/v1/embeddings")
+async def embeddings_gateway(request: Request):
+    """
+    API gateway to mask the input of the OpenAI Embeddings API. The response holds only vectors: nothing to unmask.
+    """
+    prompt_masker = request_masker(request)
+    web_cfg = prompt_masker.config.get("web", {})
+
+    request_data = await read_json(request, web_cfg)
+    inputs = request_data.get("input")
+    single = isinstance(inputs, str)
+    if single:
+        inputs = [inputs]
+    if not isinstance(inputs, list) or not all(isinstance(x, str) for x in inputs):
+        # token arrays cannot be inspected, so they cannot be masked
+        raise HTTPException(status_code=400, detail="'input' must be a string or an array of strings.")
+
+    upstream: Optional[Upstream] = request.app.state.upstreams.route(web_cfg, request_data.get("model"))
+    if upstream is None:
+        raise HTTPException(
+            status_code=501,
+            detail="No upstream for this model: configure 'upstream_oai_api_base' or a matching [web.upstreams] entry in PromptMask config."
+        )
+
+    started = time.monotonic()
+    deadline = request_deadline(request, web_cfg)
+    mask_timeout = deadline * web_cfg.get("mask_deadline_share", 0.4) if deadline else None
+    masked_inputs, fallback = await mask_inputs_with_fallback(request, prompt_masker, inputs, web_cfg, mask_timeout)
+    request_data["input"] = masked_inputs[0] if single else masked_inputs
+    upstream_timeout = max(0.1, deadline - (time.monotonic() - started)) if deadline else httpx.USE_CLIENT_DEFAULT
+
+    upstream.acquire()
+    status = None
+    try:
+        upstream_resp = await await_or_disconnect(request, upstream.client.post(
+            upstream.url("embeddings"), json=request_data, headers=upstream_headers(request, upstream), timeout=upstream_timeout))
+        status = upstream_resp.status_code
+        upstream_resp.raise_for_status()
+        # vectors only: forwarded as received, nothing to parse
+        return Response(upstream_resp.content, media_type="application/json", headers={FALLBACK_HEADER: fallback} if fallback else {})
+    except HTTPException:
+        raise
+    except httpx.TimeoutException as e:
+        logger.error(f"Upstream API timed out within the request deadline: {e}")
+        raise HTTPException(status_code=504, detail="Upstream API timed out within the request deadline.")
     except httpx.HTTPStatusError as e:
         logger.error(f"Upstream API error: {e.response.status_code} - {e.response.text}")
         raise HTTPException(status_code=e.response.status_code, detail=e.response.json())
     except Exception as e:
         logger.error(f"Gateway error: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await upstream.release(status)
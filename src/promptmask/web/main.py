@@ -2,37 +2,56 @@
 
 import uvicorn
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-import httpx
 
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 from pathlib import Path
+import asyncio
 import json
 
 import importlib.resources as pkg_resources
 
 from ..core import PromptMask
+from ..maskmap import MaskMap
 from .models import (
     MaskRequest, MaskResponse, UnmaskRequest, UnmaskResponse,
     MessagesRequest, MessagesResponse, UnmaskMessagesRequest, UnmaskMessagesResponse
 )
-from ..config import USER_CONFIG_FILENAME
+from ..config import USER_CONFIG_FILENAME, redact_secrets, restore_secrets
+from ..metrics import metrics
+from ..scheduler import QueueFullError
 from ..utils import tomllib, logger
 
-from .gateway import router as gateway_router
+from .gateway import router as gateway_router, request_masker, offloader, ProfilePathMiddleware, SCOPE_HEADER
+from . import offload
+from .cache import ResponseCache
+from .compression import CompressionMiddleware
+from .offload import Offloader, monitor_loop_lag
+from .upstreams import UpstreamRouter
+from .debug import router as debug_router
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting up PromptMask Web API...")
     # reusable singleton
     app.state.prompt_masker = PromptMask()
-    app.state.httpx_client = httpx.AsyncClient()
-    logger.info("PromptMask instance and httpx client created.")
+    await app.state.prompt_masker.start()
+    app.state.upstreams = UpstreamRouter() # one pooled client per upstream, built from the web config
+    app.state.response_cache = ResponseCache() # sized by web.response_cache on use
+    app.state.offloader = Offloader() # worker pool for very large payloads, started on first use
+    lag_monitor = asyncio.create_task(monitor_loop_lag(
+        app.state.prompt_masker.config.get("web", {}).get("offload", {}).get("lag_interval", 0.1)))
+    logger.info("PromptMask instance and upstream router created.")
     yield # defer before close
     logger.info("Shutting down PromptMask Web API...")
-    await app.state.httpx_client.aclose()
-    logger.info("Httpx client closed.")
+    lag_monitor.cancel()
+    with suppress(asyncio.CancelledError):
+        await lag_monitor
+    app.state.offloader.shutdown()
+    await app.state.upstreams.aclose()
+    await app.state.prompt_masker.aclose()
+    logger.info("Upstream clients closed.")
 
 app = FastAPI(
     title="PromptMask Web API",
@@ -46,7 +65,19 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 ) # All are allowed since the server is assumed to be on a local network
+app.add_middleware(ProfilePathMiddleware)
+app.add_middleware(CompressionMiddleware) # negotiated br/gzip for non-streamed responses, see [web.compression]
 app.include_router(gateway_router)
+app.include_router(debug_router)
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    """The local LLM is saturated: fail fast so clients can back off and retry."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Local masking LLM is overloaded: {exc}"},
+        headers={"Retry-After": str(int(max(1, exc.retry_after)))},
+    )
 
 @app.get("/", response_class=FileResponse, include_in_schema=False)
 async def serve_index():
@@ -72,10 +103,22 @@ async def health_check():
     """Check if the Web API is running."""
     return {"status": "ok"}
 
+@app.get("/v1/ready", tags=["General"])
+async def readiness_check(request: Request):
+    """Check if the local masking model is warmed up and ready for traffic (503 while warming up)."""
+    if not request.app.state.prompt_masker.ready:
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {"status": "ready"}
+
+@app.get("/v1/metrics", tags=["General"])
+async def get_metrics():
+    """In-process counters, gauges and latency summaries."""
+    return metrics.snapshot()
+
 @app.get("/v1/config", tags=["Configuration"])
 async def get_config(request: Request):
-    """Retrieve the current running configuration."""
-    return request.app.state.prompt_masker.config
+    """Retrieve the current running configuration, with secrets redacted."""
+    return redact_secrets(request.app.state.prompt_masker.config)
 
 @app.post("/v1/config", tags=["Configuration"])
 async def set_config(config: dict, request: Request):
@@ -88,7 +131,12 @@ async def set_config(config: dict, request: Request):
     try:
         if isinstance(config, str):
             config = json.loads(config)
-            
+        saved = {}
+        if user_config_path.exists():
+            with open(user_config_path, "rb") as f:
+                saved = tomllib.load(f)
+        config = restore_secrets(config, saved) # never write redacted placeholders or environment secrets
+
         import tomli_w
         with open(user_config_path, "wb") as f:
             tomli_w.dump(config, f)
@@ -105,35 +153,41 @@ async def set_config(config: dict, request: Request):
 @app.post("/v1/mask", response_model=MaskResponse, tags=["Masking"])
 async def mask_text(req_body: MaskRequest, request: Request):
     """Mask sensitive data in a single string."""
-    prompt_masker: PromptMask = request.app.state.prompt_masker
-    masked_text, mask_map = await prompt_masker.async_mask_str(req_body.text)
+    prompt_masker = request_masker(request)
+    mask_map = await prompt_masker.async_detect(req_body.text, priority="batch", scope=request.headers.get(SCOPE_HEADER))
     if "err" in mask_map:
         raise HTTPException(status_code=500, detail=f"Failed to get mask map from local LLM: {mask_map['err']}")
+    masked_text = await offloader(request).run(prompt_masker.config.get("web", {}), len(req_body.text),
+                                               offload.mask_text, req_body.text, mask_map)
     return MaskResponse(masked_text=masked_text, mask_map=mask_map)
 
 @app.post("/v1/unmask", response_model=UnmaskResponse, tags=["Masking"])
 async def unmask_text(req_body: UnmaskRequest, request: Request):
-    """Unmask a string using a provided mask map."""
-    prompt_masker: PromptMask = request.app.state.prompt_masker
-    unmasked_text = prompt_masker.unmask_str(req_body.masked_text, req_body.mask_map)
+    """Unmask a string using a provided mask map (optional for self-contained encrypted masks)."""
+    prompt_masker = request_masker(request)
+    unmasked_text = await offloader(request).run(prompt_masker.config.get("web", {}), len(req_body.masked_text), offload.unmask_text,
+                                                 req_body.masked_text, MaskMap.coerce(req_body.mask_map), prompt_masker._snapshot.tokens)
     return UnmaskResponse(text=unmasked_text)
 
 @app.post("/v1/mask_messages", response_model=MessagesResponse, tags=["Masking"])
 async def mask_chat_messages(req_body: MessagesRequest, request: Request):
     """Mask sensitive data in a list of chat messages."""
-    prompt_masker: PromptMask = request.app.state.prompt_masker
+    prompt_masker = request_masker(request)
     messages_dict = [msg.model_dump() for msg in req_body.messages]
-    masked_messages, mask_map = await prompt_masker.async_mask_messages(messages_dict)
+    mask_map = await prompt_masker.async_detect_messages(messages_dict, priority="batch", scope=request.headers.get(SCOPE_HEADER))
     if "err" in mask_map:
         raise HTTPException(status_code=500, detail=f"Failed to get mask map from local LLM: {mask_map['err']}")
+    masked_messages = await offloader(request).run(prompt_masker.config.get("web", {}), sum(len(m["content"] or "") for m in messages_dict),
+                                                   offload.mask_messages, messages_dict, mask_map)
     return MessagesResponse(masked_messages=masked_messages, mask_map=mask_map)
 
 @app.post("/v1/unmask_messages", response_model=UnmaskMessagesResponse, tags=["Masking"])
 async def unmask_chat_messages(req_body: UnmaskMessagesRequest, request: Request):
     """Unmask a list of chat messages using a provided mask map."""
-    prompt_masker: PromptMask = request.app.state.prompt_masker
+    prompt_masker = request_masker(request)
     messages_dict = [msg.model_dump() for msg in req_body.masked_messages]
-    unmasked_messages = prompt_masker.unmask_messages(messages_dict, req_body.mask_map)
+    unmasked_messages = await offloader(request).run(prompt_masker.config.get("web", {}), sum(len(m["content"] or "") for m in messages_dict),
+                                                     offload.unmask_messages, messages_dict, MaskMap.coerce(req_body.mask_map), prompt_masker._snapshot.tokens)
     return UnmaskMessagesResponse(messages=unmasked_messages)
 
 def run_server():
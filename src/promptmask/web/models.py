@@ -1,7 +1,7 @@
 # src/promptmask/web/models.py
 
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 class MaskRequest(BaseModel):
     text: str
@@ -12,7 +12,7 @@ class MaskResponse(BaseModel):
 
 class UnmaskRequest(BaseModel):
     masked_text: str
-    mask_map: Dict[str, str]
+    mask_map: Optional[Dict[str, str]] = None # may be omitted for self-contained (encrypted) masks
 
 class UnmaskResponse(BaseModel):
     text: str
@@ -30,7 +30,7 @@ class MessagesResponse(BaseModel):
 
 class UnmaskMessagesRequest(BaseModel):
     masked_messages: List[Message]
-    mask_map: Dict[str, str]
+    mask_map: Optional[Dict[str, str]] = None
 
 class UnmaskMessagesResponse(BaseModel):
     messages: List[Message]
\ No newline at end of file
@@ -0,0 +1,106 @@
+# src/promptmask/web/offload.py
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..maskmap import MaskMap
+from ..metrics import metrics
+from ..tokens import MaskTokenCipher
+from ..utils import logger
+
+MODES = ("off", "thread", "process")
+
+# --- CPU-heavy steps, as module-level functions so that a process pool can pickle them ---
+# Pass the request's compiled MaskMap: inline it is used as is, and it pickles to worker processes.
+
+def mask_text(text: str, mask_map: Dict[str, str]) -> str:
+    return MaskMap.coerce(mask_map).mask(text)
+
+def mask_messages(messages: List[Dict[str, str]], mask_map: Dict[str, str]) -> List[Dict[str, str]]:
+    """Masks the 'content' of non-system messages, like `PromptMask.mask_messages`."""
+    compiled = MaskMap.coerce(mask_map)
+    return [{**m, "content": compiled.mask(m["content"])} if m.get("content") and m.get("role") != "system" else m
+            for m in messages]
+
+def unmask_text(text: str, mask_map: Dict[str, str], tokens: Optional[MaskTokenCipher] = None) -> str:
+    """Like `PromptMask.unmask_str`: the map's masks, then self-contained encrypted ones."""
+    text = MaskMap.coerce(mask_map).unmask(text)
+    return tokens.unmask(text) if tokens else text
+
+def unmask_messages(messages: List[Dict[str, str]], mask_map: Dict[str, str], tokens: Optional[MaskTokenCipher] = None) -> List[Dict[str, str]]:
+    mask_map = MaskMap.coerce(mask_map) # compiled once for all messages
+    return [{**m, "content": unmask_text(m["content"], mask_map, tokens)} if m.get("content") else m for m in messages]
+
+def unmask_completion(data: bytes, mask_map: Dict[str, str], tokens: Optional[MaskTokenCipher] = None) -> bytes:
+    """Parses a (non-streamed) chat completion, unmasks its message and serializes it again."""
+    response_data = json.loads(data)
+    if response_data.get("choices"):
+        message = response_data["choices"][0].get("message") or {}
+        if message.get("content"):
+            message["content"] = unmask_text(message["content"], mask_map, tokens)
+    return dumps(response_data)
+
+def loads(data: bytes) -> Any:
+    return json.loads(data)
+
+def dumps(obj: Any) -> bytes:
+    """Serializes like Starlette's JSONResponse."""
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+class Offloader:
+    """
+    Runs CPU-heavy steps on payloads of at least `web.offload.threshold_bytes` in a worker pool instead of
+    the event loop, so one multi-megabyte request does not stall every other in-flight stream.
+    "process" gives true parallelism (arguments and results are pickled across), "thread" only moves the
+    stall off the loop (the GIL is still shared), "off" runs everything inline. Smaller payloads always run
+    inline: for them the hand-off costs more than it saves.
+    """
+    def __init__(self):
+        self._executor: Optional[Executor] = None
+        self._key: Optional[Tuple[str, int]] = None
+
+    def _pool(self, mode: str, workers: int) -> Executor:
+        key = (mode, workers)
+        if self._key != key:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            workers = workers or min(4, os.cpu_count() or 1)
+            self._executor = ProcessPoolExecutor(workers) if mode == "process" else ThreadPoolExecutor(workers, "promptmask-offload")
+            self._key = key
+            logger.info(f"Offloading large payloads to a {mode} pool of {workers} workers.")
+        return self._executor
+
+    async def run(self, web_cfg: dict, size: int, fn: Callable, *args) -> Any:
+        """Calls `fn(*args)`, in the worker pool if the payload (`size` bytes or characters) is large enough."""
+        cfg = web_cfg.get("offload", {})
+        mode = cfg.get("mode", "process")
+        if mode not in MODES:
+            raise ValueError(f"Unknown web.offload.mode {mode!r}, expected one of {MODES}.")
+        if mode == "off" or size < cfg.get("threshold_bytes", 1_000_000):
+            return fn(*args)
+        start = time.perf_counter()
+        result = await asyncio.get_running_loop().run_in_executor(self._pool(mode, cfg.get("workers", 0)), fn, *args)
+        metrics.observe("offload_seconds", time.perf_counter() - start, {"mode": mode, "step": fn.__name__})
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self._executor, self._key = None, None
+
+async def monitor_loop_lag(interval: float = 0.1):
+    """
+    Measures how late the event loop wakes up from a sleep of `interval` seconds: the time every other
+    coroutine had to wait for whatever was running on the loop. Published as `event_loop_lag_seconds`.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        metrics.observe("event_loop_lag_seconds", lag)
+        metrics.set_gauge("event_loop_lag_last_seconds", round(lag, 6))
@@ -0,0 +1,138 @@
+# src/promptmask/web/upstreams.py
+
+import asyncio
+import fnmatch
+from typing import Dict, List, Optional
+
+import httpx
+
+from ..metrics import metrics
+from ..utils import logger
+
+DEFAULT_UPSTREAM = "default" # the upstream built from `web.upstream_oai_api_base`
+
+class Upstream:
+    """
+    One upstream OpenAI-compatible API with its own pooled HTTP client.
+    `inflight` counts requests holding a connection, including streams until they are closed.
+    """
+    def __init__(self, name: str, spec: dict, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.name = name
+        self.base = spec["base"].rstrip("/")
+        self.models: List[str] = list(spec.get("models", []))
+        self.key: str = spec.get("key", "")
+        self.signature = self.signature_of(spec)
+        _, http2, self.max_connections, max_keepalive, keepalive_expiry, connect, read, write, pool = self.signature
+        if http2:
+            try:
+                import h2 # noqa: F401
+            except ImportError:
+                logger.warning(f"Upstream '{name}': HTTP/2 needs the h2 package (pip install \"promptmask[web]\"), using HTTP/1.1.")
+                http2 = False
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=max_keepalive,
+                                keepalive_expiry=keepalive_expiry),
+            timeout=httpx.Timeout(connect=connect, read=read, write=write, pool=pool),
+            transport=transport,
+        )
+        self.inflight = 0
+        self.retired = False # replaced by a reload; closed once its last request finishes
+
+    @staticmethod
+    def signature_of(spec: dict) -> tuple:
+        """Connection settings; an upstream whose settings are unchanged keeps its client and connections."""
+        return (spec["base"].rstrip("/"), bool(spec.get("http2", False)), int(spec.get("max_connections", 100)),
+                spec.get("max_keepalive_connections", 20), spec.get("keepalive_expiry", 30.0), spec.get("connect_timeout", 5.0),
+                spec.get("read_timeout", 600.0), spec.get("write_timeout", 30.0), spec.get("pool_timeout", 10.0))
+
+    def matches(self, model: str) -> bool:
+        return any(fnmatch.fnmatchcase(model, pattern) for pattern in self.models)
+
+    def url(self, path: str) -> str:
+        return f"{self.base}/{path.lstrip('/')}"
+
+    def acquire(self):
+        self.inflight += 1
+        self._publish()
+
+    async def release(self, status: Optional[int] = None):
+        """Ends a request started with `acquire` (after its response, or stream, is closed)."""
+        self.inflight -= 1
+        if status is not None:
+            metrics.inc("upstream_requests_total", labels={"upstream": self.name, "status": str(status)})
+        self._publish()
+        if self.retired and self.inflight == 0:
+            await self.client.aclose()
+
+    def _publish(self):
+        labels = {"upstream": self.name}
+        metrics.set_gauge("upstream_inflight", self.inflight, labels)
+        metrics.set_gauge("upstream_pool_utilization", round(self.inflight / max(1, self.max_connections), 4), labels)
+        # best effort: httpcore's pool is not public API
+        connections = getattr(getattr(getattr(self.client, "_transport", None), "_pool", None), "connections", None)
+        if connections is not None:
+            idle = sum(1 for c in connections if c.is_idle())
+            metrics.set_gauge("upstream_connections", len(connections) - idle, {**labels, "state": "active"})
+            metrics.set_gauge("upstream_connections", idle, {**labels, "state": "idle"})
+
+class UpstreamRouter:
+    """
+    Routes gateway requests to named upstreams by the request's `model` (glob patterns, first match wins),
+    else to the default upstream (`web.upstream_oai_api_base`).
+    The upstream set follows the web config: when a reload changes it, unchanged upstreams keep their
+    client and connections, and replaced ones are closed once their in-flight requests are done.
+    """
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self._transport = transport # for tests
+        self._web_cfg: Optional[dict] = None
+        self._specs_seen: Dict[str, dict] = {}
+        self._upstreams: Dict[str, Upstream] = {}
+
+    @staticmethod
+    def _specs(web_cfg: dict) -> Dict[str, dict]:
+        defaults = web_cfg.get("http_client", {})
+        specs = {name: {**defaults, **spec} for name, spec in web_cfg.get("upstreams", {}).items() if spec.get("base")}
+        if web_cfg.get("upstream_oai_api_base") and DEFAULT_UPSTREAM not in specs:
+            specs[DEFAULT_UPSTREAM] = {**defaults, "base": web_cfg["upstream_oai_api_base"]}
+        return specs
+
+    def upstreams(self, web_cfg: dict) -> Dict[str, Upstream]:
+        """The upstreams for `web_cfg`, rebuilt only when the web config changed."""
+        if web_cfg is self._web_cfg:
+            return self._upstreams
+        specs = self._specs(web_cfg)
+        if specs == self._specs_seen: # a reload that did not touch the upstreams
+            self._web_cfg = web_cfg
+            return self._upstreams
+        upstreams = {}
+        for name, spec in specs.items():
+            old = self._upstreams.get(name)
+            if old and old.signature == Upstream.signature_of(spec):
+                old.models, old.key = list(spec.get("models", [])), spec.get("key", "")
+                upstreams[name] = old
+            else:
+                upstreams[name] = Upstream(name, spec, self._transport)
+        for name, old in self._upstreams.items():
+            if upstreams.get(name) is not old:
+                self._retire(old)
+        self._web_cfg, self._specs_seen, self._upstreams = web_cfg, specs, upstreams
+        return upstreams
+
+    def route(self, web_cfg: dict, model: Optional[str]) -> Optional[Upstream]:
+        upstreams = self.upstreams(web_cfg)
+        if model:
+            for upstream in upstreams.values():
+                if upstream.matches(model):
+                    return upstream
+        return upstreams.get(DEFAULT_UPSTREAM)
+
+    @staticmethod
+    def _retire(upstream: Upstream):
+        upstream.retired = True
+        if upstream.inflight == 0:
+            asyncio.ensure_future(upstream.client.aclose())
+
+    async def aclose(self):
+        await asyncio.gather(*(u.client.aclose() for u in self._upstreams.values()), return_exceptions=True)
+        self._upstreams, self._specs_seen, self._web_cfg = {}, {}, None
@@ -0,0 +1,10 @@
+# tests/conftest.py
+
+import pytest
+
+# A config that never touches the network on construction (no model auto-detection).
+OFFLINE_CONFIG = {"llm_api": {"model": "test-model", "key": "test-key"}}
+
+@pytest.fixture
+def offline_config():
+    return {k: dict(v) for k, v in OFFLINE_CONFIG.items()}
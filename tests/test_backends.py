@@ -0,0 +1,92 @@
+# tests/test_backends.py
+
+import pytest
+
+from promptmask import PromptMask
+from promptmask.backends import FakeBackend, Entity, DetectionError, LlamaCppBackend, parse_mask_response
+
+
+def test_parse_mask_response_strips_wrapper_and_short_values(offline_config):
+    cfg = PromptMask(config=offline_config, backend=FakeBackend()).config
+    content = '<mask_mapping>{"${USER_EMAIL}":"a@b.co", "PHONE":"+1 555 0100", "${X}":"ab"}</mask_mapping>'
+    assert parse_mask_response(content, cfg) == [Entity("a@b.co", "USER_EMAIL"), Entity("+1 555 0100", "PHONE")]
+    with pytest.raises(DetectionError):
+        parse_mask_response("I cannot help with that.", cfg)
+
+
+def test_backend_entities_become_unique_masks(offline_config):
+    backend = FakeBackend({"Alice": "person", "Bob": "person", "bob@example.com": "EMAIL"})
+    pm = PromptMask(config=offline_config, backend=backend)
+    masked, mask_map = pm.mask_str("Alice, Bob <bob@example.com>")
+    assert mask_map == {"Alice": "${PERSON}", "Bob": "${PERSON_2}", "bob@example.com": "${EMAIL}"}
+    assert masked == "${PERSON}, ${PERSON_2} <${EMAIL}>"
+
+
+@pytest.mark.asyncio
+async def test_detection_errors_become_err_maps(offline_config):
+    pm = PromptMask(config=offline_config, backend=FakeBackend(error="JSONDecodeError"))
+    assert pm.mask_str("Alice")[1] == {"err": "JSONDecodeError"}
+    assert (await pm.async_mask_str("Alice"))[1] == {"err": "JSONDecodeError"}
+
+
+def test_backend_is_selected_by_config(offline_config):
+    with pytest.raises(ValueError):
+        PromptMask(config={**offline_config, "backend": {"name": "nope"}})
+    pm = PromptMask(config={**offline_config, "backend": {"name": "llama_cpp", "model_path": "m.gguf"}})
+    backend = pm._snapshot.backend
+    assert isinstance(backend, LlamaCppBackend)
+    pm._initialize_clients()
+    assert pm._snapshot.backend._lock is backend._lock # same model: the loaded model is kept
+
+
+@pytest.mark.asyncio
+async def test_structured_output_falls_back_when_the_server_rejects_it(offline_config):
+    import json
+    import httpx
+    from openai import AsyncOpenAI
+
+    sent = []
+    def handler(request: httpx.Request):
+        body = json.loads(request.content)
+        sent.append(body)
+        if "response_format" in body:
+            return httpx.Response(400, json={"error": {"message": "response_format is not supported"}})
+        return httpx.Response(200, json={
+            "id": "x", "object": "chat.completion", "created": 0, "model": "test-model",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": '{"${USER_NAME}": "Alice Smith"}'}}],
+        })
+
+    pm = PromptMask(config={**offline_config, "backend": {"structured_output": "json_schema"}})
+    ep = pm._snapshot.pool.primary
+    ep.async_client = AsyncOpenAI(base_url=ep.base, api_key="k", max_retries=0,
+                                  http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    assert (await pm.async_mask_str("I am Alice Smith"))[0] == "I am ${USER_NAME}"
+    await pm.async_mask_str("I am Alice Smith")
+    assert ["response_format" in body for body in sent] == [True, False, False] # rejected once, then not sent
+    assert sent[0]["response_format"]["json_schema"]["schema"]["additionalProperties"] == {"type": "string"}
+
+    with pytest.raises(ValueError):
+        PromptMask(config={**offline_config, "backend": {"structured_output": "regex"}})
+
+
+@pytest.mark.asyncio
+async def test_unrelated_bad_request_keeps_structured_output(offline_config):
+    import json
+    import httpx
+    from openai import AsyncOpenAI, BadRequestError
+
+    sent = []
+    def handler(request: httpx.Request):
+        sent.append(json.loads(request.content))
+        return httpx.Response(400, json={"error": {"message": "This model's maximum context length is 4096 tokens"}})
+
+    pm = PromptMask(config={**offline_config, "backend": {"structured_output": "json_schema"}})
+    ep = pm._snapshot.pool.primary
+    ep.async_client = AsyncOpenAI(base_url=ep.base, api_key="k", max_retries=0,
+                                  http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    for _ in range(2):
+        with pytest.raises(BadRequestError):
+            await pm.async_mask_str("I am Alice Smith")
+    assert ["response_format" in body for body in sent] == [True, False, True, False] # still sent after the failed retry
+    assert not ep.unsupported
@@ -0,0 +1,63 @@
+# tests/test_batch.py
+
+import pytest
+
+from promptmask import PromptMask
+from promptmask.backends import FakeBackend
+
+
+def test_mask_batch_keeps_order_and_dedupes(offline_config):
+    backend = FakeBackend({"Alice": "USER_NAME"})
+    pm = PromptMask(config=offline_config, backend=backend)
+
+    texts = ["Hi Alice", "Bye Alice", "Hi Alice", ""]
+    results = pm.mask_batch(texts, concurrency=2)
+
+    assert [r[0] for r in results] == ["Hi ${USER_NAME}", "Bye ${USER_NAME}", "Hi ${USER_NAME}", ""]
+    assert len(backend.calls) == 2 # duplicate and empty texts cost no extra call
+    assert results[0][1] is not results[2][1]
+
+
+@pytest.mark.asyncio
+async def test_amask_batch_bounds_concurrency(offline_config):
+    inflight, peak = 0, 0
+    class CountingBackend(FakeBackend):
+        async def adetect(self, text):
+            nonlocal inflight, peak
+            inflight += 1
+            peak = max(peak, inflight)
+            try:
+                return await super().adetect(text)
+            finally:
+                inflight -= 1
+    pm = PromptMask(config=offline_config, backend=CountingBackend({"Alice": "USER_NAME"}, delay=0.01))
+
+    texts = [f"Alice #{i}" for i in range(10)]
+    results = await pm.amask_batch(texts, concurrency=3)
+    assert [r[0] for r in results] == [f"${{USER_NAME}} #{i}" for i in range(10)]
+    assert peak == 3
+
+    seen = sorted([i async for i, _ in pm.amask_batch_as_completed(texts, concurrency=3)])
+    assert seen == list(range(10))
+
+
+@pytest.mark.asyncio
+async def test_amask_batch_retries_items_the_scheduler_rejects(offline_config):
+    from promptmask.scheduler import QueueFullError
+    config = {**offline_config, "scheduler": {"max_concurrency": 1, "max_queue": 2, "max_queue_wait": 0}}
+    pm = PromptMask(config=config, backend=FakeBackend({"Alice": "USER_NAME"}, delay=0.005))
+
+    texts = [f"Alice #{i}" for i in range(12)]
+    results = await pm.amask_batch(texts, concurrency=12) # far beyond the queue: some get rejected
+    assert [r[0] for r in results] == [f"${{USER_NAME}} #{i}" for i in range(12)]
+
+    with pytest.raises(QueueFullError):
+        await pm.amask_batch(texts, concurrency=12, priority="interactive")
+
+
+def test_mask_batch_takes_a_scope(offline_config):
+    backend = FakeBackend({"Alice Smith": "USER_NAME"})
+    pm = PromptMask(config={**offline_config, "gazetteer": {"enabled": True}}, backend=backend)
+    pm.mask_batch(["Alice Smith"], scope="t")
+    assert pm.mask_batch(["Alice Smith"], scope="t")[0][0] == "${USER_NAME}"
+    assert backend.calls == ["Alice Smith"] # the second batch recalled the value from scope "t"
@@ -0,0 +1,81 @@
+# tests/test_cli.py
+
+import json
+import pytest
+
+from promptmask import PromptMask
+from promptmask.backends import FakeBackend
+from promptmask.cli import mask_file, parse_json_path
+
+
+@pytest.fixture
+def pm(offline_config):
+    return PromptMask(config=offline_config, backend=FakeBackend({"Alice": "USER_NAME"}))
+
+
+def test_parse_json_path():
+    assert parse_json_path("$.messages[0].content") == ["messages", 0, "content"]
+    assert parse_json_path("data.items.2.body") == ["data", "items", 2, "body"]
+
+
+@pytest.mark.asyncio
+async def test_mask_file_jsonl_in_order_with_sidecar_map(pm, tmp_path):
+    src = tmp_path / "in.jsonl"
+    src.write_text("".join(json.dumps({"id": i, "msg": {"text": f"Alice {i}"}}) + "\n" for i in range(10)) + '{"id": 10}\n')
+    out = tmp_path / "out.jsonl"
+
+    stats = await mask_file(pm, str(src), str(out), field="$.msg.text", concurrency=3)
+
+    records = [json.loads(l) for l in out.read_text().splitlines()]
+    assert [r["id"] for r in records] == list(range(11))
+    assert records[3]["msg"]["text"] == "${USER_NAME} 3"
+    maps = [json.loads(l) for l in (tmp_path / "out.jsonl.map.jsonl").read_text().splitlines()]
+    assert maps[0] == {"line": 1, "mask_map": {"Alice": "${USER_NAME}"}}
+    assert stats["skipped"] == 1
+    assert not (tmp_path / "out.jsonl.ckpt").exists()
+
+
+@pytest.mark.asyncio
+async def test_mask_file_resumes_from_checkpoint(pm, tmp_path, monkeypatch):
+    import promptmask.cli as cli
+    monkeypatch.setattr(cli, "CHECKPOINT_EVERY", 2)
+    src, out = tmp_path / "in.txt", tmp_path / "out.txt"
+    lines = [f"Alice line {i}\n" for i in range(5)]
+
+    # Simulate a run that crashed after writing line 3 but checkpointing only 2 lines.
+    src.write_text("".join(lines[:2]))
+    await mask_file(pm, str(src), str(out))
+    (tmp_path / "out.txt.ckpt").write_text(json.dumps({
+        "lines": 2, "input_offset": len("".join(lines[:2]).encode()),
+        "output_offset": out.stat().st_size, "map_offset": (tmp_path / "out.txt.map.jsonl").stat().st_size,
+    }))
+    with open(out, "a") as f:
+        f.write("garbage from the crashed run\n")
+    src.write_text("".join(lines))
+
+    await mask_file(pm, str(src), str(out), resume=True)
+    assert out.read_text().splitlines() == [f"${{USER_NAME}} line {i}" for i in range(5)]
+    assert len((tmp_path / "out.txt.map.jsonl").read_text().splitlines()) == 5
+
+
+@pytest.mark.asyncio
+async def test_mask_file_skips_bad_lines_and_waits_out_rejections(pm, tmp_path):
+    from promptmask.scheduler import QueueFullError
+    src, out = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    src.write_bytes(b'{"t": "Alice 1"}\n{"t": "Alice 2\n\xff\xfe\n{"t": "Alice 3"}\n')
+
+    rejections = 2
+    real = pm.async_mask_str
+    async def flaky(text, priority="interactive", scope=None):
+        nonlocal rejections
+        if rejections:
+            rejections -= 1
+            raise QueueFullError("busy")
+        return await real(text, priority, scope)
+    pm.async_mask_str = flaky
+
+    stats = await mask_file(pm, str(src), str(out), field="$.t", concurrency=1)
+    assert [json.loads(l)["t"] for l in out.read_text().splitlines()] == ["${USER_NAME} 1", "${USER_NAME} 3"]
+    assert stats["invalid"] == 2 and stats["lines"] == 4
+    maps = [json.loads(l) for l in (tmp_path / "out.jsonl.map.jsonl").read_text().splitlines()]
+    assert [m["line"] for m in maps if "error" in m] == [2, 3]
@@ -0,0 +1,52 @@
+# tests/test_compression.py
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+
+from promptmask.web.compression import CompressionMiddleware, brotli, negotiate
+
+
+def test_negotiate_prefers_brotli_and_honours_q_values():
+    assert negotiate("gzip, deflate, br") == ("br" if brotli else "gzip")
+    assert negotiate("gzip;q=1.0, br;q=0.5") == "gzip"
+    assert negotiate("br;q=0, gzip") == "gzip"
+    assert negotiate("identity") is None
+    assert negotiate("") is None
+    assert negotiate("*") == ("br" if brotli else "gzip")
+
+
+@pytest.mark.asyncio
+async def test_middleware_compresses_complete_responses_only():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware)
+    body = "masked text " * 500
+
+    @app.get("/json")
+    async def whole():
+        return PlainTextResponse(body)
+
+    @app.get("/small")
+    async def small():
+        return PlainTextResponse("ok")
+
+    @app.get("/sse")
+    async def sse():
+        async def events():
+            yield "data: 1\n\n"
+            yield "data: 2\n\n" * 500
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    headers = {"Accept-Encoding": "gzip"}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        compressed = await client.get("/json", headers=headers)
+        plain = await client.get("/json", headers={"Accept-Encoding": "identity"})
+        small = await client.get("/small", headers=headers)
+        stream = await client.get("/sse", headers=headers)
+
+    assert compressed.headers["content-encoding"] == "gzip" and "Accept-Encoding" in compressed.headers["vary"]
+    assert int(compressed.headers["content-length"]) < len(body)
+    assert compressed.text == plain.text == body # httpx decodes
+    assert "content-encoding" not in plain.headers and "content-encoding" not in small.headers
+    assert "content-encoding" not in stream.headers and stream.text.startswith("data: 1")
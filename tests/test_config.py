@@ -0,0 +1,55 @@
+# tests/test_config.py
+
+import time
+
+from promptmask import PromptMask
+from promptmask.config import load_config, ConfigWatcher, USER_CONFIG_FILENAME
+
+
+def test_load_config_caches_by_mtime(tmp_path):
+    cfg_file = tmp_path / "custom.toml"
+    cfg_file.write_text('[sensitive]\ninclude = "emails"\n')
+    first = load_config(config_file=str(cfg_file))
+    assert first["sensitive"]["include"] == "emails"
+
+    # Cached copies must be independent of each other
+    first["sensitive"]["include"] = "mutated"
+    assert load_config(config_file=str(cfg_file))["sensitive"]["include"] == "emails"
+
+    cfg_file.write_text('[sensitive]\ninclude = "phone numbers"\n')
+    assert load_config(config_file=str(cfg_file))["sensitive"]["include"] == "phone numbers"
+
+
+def test_reload_swaps_snapshot_and_reuses_clients(tmp_path, monkeypatch, offline_config):
+    monkeypatch.chdir(tmp_path)
+    pm = PromptMask(config=offline_config)
+    old_snapshot = pm._snapshot
+
+    (tmp_path / USER_CONFIG_FILENAME).write_text('[mask_wrapper]\nleft = "__"\nright = "__"\n')
+    pm._initialize_clients()
+
+    assert pm._snapshot is not old_snapshot
+    assert old_snapshot.config["mask_wrapper"]["left"] == "${" # in-flight readers keep their view
+    assert pm.config["mask_wrapper"]["left"] == "__"
+    assert pm.async_client is old_snapshot.pool.primary.async_client # llm_api unchanged -> pool reused
+
+    (tmp_path / USER_CONFIG_FILENAME).write_text('[llm_api]\nbase = "http://127.0.0.1:1/v1"\n')
+    pm._initialize_clients()
+    assert pm.async_client is not old_snapshot.pool.primary.async_client
+
+
+def test_config_watcher_detects_change(tmp_path):
+    cfg_file = tmp_path / USER_CONFIG_FILENAME
+    cfg_file.write_text("")
+    calls = []
+    watcher = ConfigWatcher([cfg_file], lambda: calls.append(1), interval=0.05)
+    watcher.start()
+    try:
+        time.sleep(0.1)
+        cfg_file.write_text('[general]\nverbose = false\n')
+        deadline = time.time() + 2
+        while not calls and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        watcher.stop()
+    assert calls
@@ -0,0 +1,63 @@
+# tests/test_debug.py
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from promptmask import PromptMask
+from promptmask.backends import FakeBackend
+from promptmask.web.debug import router
+
+AUTH = {"Authorization": "Bearer s3cret"}
+
+def make_debug_app(offline_config, **debug):
+    app = FastAPI()
+    app.include_router(router)
+    app.state.prompt_masker = PromptMask(config={**offline_config, "web": {"debug": debug}}, backend=FakeBackend())
+    return app
+
+
+@pytest.mark.asyncio
+async def test_debug_endpoints_need_opt_in_and_token(offline_config):
+    for debug, headers, status in [({}, AUTH, 404), ({"enabled": True}, AUTH, 403),
+                                   ({"enabled": True, "token": "s3cret"}, {"Authorization": "Bearer nope"}, 401)]:
+        app = make_debug_app(offline_config, **debug)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            assert (await client.get("/v1/debug/tasks", headers=headers)).status_code == status
+
+
+@pytest.mark.asyncio
+async def test_debug_profile_tracemalloc_and_tasks(offline_config):
+    app = make_debug_app(offline_config, enabled=True, token="s3cret")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        tasks = (await client.get("/v1/debug/tasks", headers=AUTH)).json()
+        assert tasks["tasks"] >= 1 and tasks["masking"]["active"] == 0
+
+        resp = await client.post("/v1/debug/profile", params={"seconds": 0.1, "limit": 5}, headers=AUTH)
+        assert resp.status_code == 200 and "function calls" in resp.text
+        resp = await client.post("/v1/debug/profile", params={"seconds": 0.1, "format": "collapsed"}, headers=AUTH)
+        assert resp.status_code == 200 and resp.text.strip()
+
+        first = (await client.post("/v1/debug/tracemalloc/snapshot", headers=AUTH)).json()
+        kept = [bytearray(1024) for _ in range(256)] # ~256 KiB that the diff should show
+        second = (await client.post("/v1/debug/tracemalloc/snapshot", headers=AUTH)).json()
+        assert second["compared_to"] == first["id"]
+        assert any(row["size_diff_kib"] >= 200 for row in second["growth"])
+        assert (await client.delete("/v1/debug/tracemalloc", headers=AUTH)).status_code == 200
+        del kept
+
+
+def test_debug_token_is_redacted_and_not_saved_from_env(monkeypatch):
+    from promptmask.config import REDACTED, load_config, redact_secrets, restore_secrets
+    monkeypatch.setenv("PROMPTMASK_DEBUG_TOKEN", "from-env")
+    config = load_config()
+    assert config["web"]["debug"]["token"] == "from-env"
+    shown = redact_secrets(config)
+    assert shown["web"]["debug"]["token"] == REDACTED and config["web"]["debug"]["token"] == "from-env"
+
+    assert "token" not in restore_secrets(shown, {})["web"]["debug"] # a UI save round trip
+    assert "token" not in restore_secrets(config, {})["web"]["debug"] # the environment's value
+    saved = {"web": {"debug": {"token": "from-file"}}}
+    assert restore_secrets(shown, saved)["web"]["debug"]["token"] == "from-file"
+    shown["web"]["debug"]["token"] = "new"
+    assert restore_secrets(shown, saved)["web"]["debug"]["token"] == "new"
@@ -0,0 +1,32 @@
+# tests/test_examples.py
+
+import pytest
+
+from promptmask import PromptMask
+from promptmask.backends import FakeBackend, build_mask_prompt
+from promptmask.examples import select_examples
+
+
+def test_similar_profile_picks_the_closest_examples(offline_config):
+    cfg = PromptMask(config=offline_config, backend=FakeBackend()).config
+    examples = cfg["prompt"]["examples"]
+
+    code = 'import os\ntoken = "sk-123"\nresp = requests.get(url, headers={"Authorization": token})'
+    picked = select_examples(code, examples, "similar", top_k=1)
+    assert [ex["role"] for ex in picked] == ["user", "assistant"]
+    assert "import os,requests" in picked[0]["content"]
+
+    data = '[{"name": "Ann Lee", "email": "ann@x.io", "role": "admin"}]'
+    assert '"users"' in select_examples(data, examples, "similar", top_k=1)[0]["content"]
+
+    assert select_examples(code, examples, "zero_shot") == []
+    assert select_examples(code, examples, "all") == examples
+
+
+def test_example_profile_shapes_the_prompt(offline_config):
+    pm = PromptMask(config={**offline_config, "prompt": {"example_profile": "zero_shot"}}, backend=FakeBackend())
+    messages = build_mask_prompt("Hi, I am Alice", pm.config)
+    assert [m["role"] for m in messages] == ["system", "user"]
+
+    with pytest.raises(ValueError):
+        PromptMask(config={**offline_config, "prompt": {"example_profile": "some"}}, backend=FakeBackend())
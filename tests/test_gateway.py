@@ -0,0 +1,224 @@
+# tests/test_gateway.py
+
+import asyncio
+import json
+import pytest
+from fastapi import HTTPException
+
+from promptmask import PromptMask
+from promptmask.backends import FakeBackend
+from promptmask.web.gateway import unmask_sse_stream, await_or_disconnect, coalesce_stream, ClosingStreamingResponse
+
+
+class FakeUpstreamResponse:
+    """Mimics the parts of a streamed httpx.Response used by the gateway."""
+    def __init__(self, lines):
+        self._lines = lines
+        self.closed = False
+
+    async def aiter_lines(self):
+        for line in self._lines:
+            await asyncio.sleep(0)
+            yield line
+
+    async def aclose(self):
+        self.closed = True
+
+class FakeRequest:
+    def __init__(self, disconnect_after: float):
+        self._deadline = asyncio.get_running_loop().time() + disconnect_after
+
+    async def is_disconnected(self):
+        return asyncio.get_running_loop().time() >= self._deadline
+
+def sse(content, finish_reason=None):
+    return "data: " + json.dumps({"choices": [{"delta": {"content": content}, "finish_reason": finish_reason}]})
+
+
+@pytest.mark.asyncio
+async def test_unmask_sse_stream_closes_upstream_when_consumer_stops(offline_config):
+    pm = PromptMask(config=offline_config)
+    upstream = FakeUpstreamResponse([sse("Hi ${USER"), sse("_NAME}!"), sse(" more"), "data: [DONE]"])
+    stream = unmask_sse_stream(upstream, {"Alice": "${USER_NAME}"}, pm)
+
+    first = await stream.__anext__()
+    assert json.loads(first[5:])["choices"][0]["delta"]["content"] == "Hi "
+    second = await stream.__anext__()
+    assert "Alice!" in second
+    await stream.aclose() # client went away mid-stream
+    assert upstream.closed
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("ending", [
+    [sse("5$", finish_reason="stop"), "data: [DONE]"], # content and finish_reason in one chunk
+    [sse("5$"), "data: [DONE]"],                        # no finish_reason
+    [sse("5$")],                                        # cut off
+])
+async def test_unmask_sse_stream_releases_held_back_text_at_the_end(offline_config, ending):
+    pm = PromptMask(config=offline_config)
+    upstream = FakeUpstreamResponse([sse("Hello ${NAME}, that costs ")] + ending)
+    text = ""
+    async for event in unmask_sse_stream(upstream, {"Alice": "${NAME}"}, pm):
+        text += "".join(json.loads(e[5:])["choices"][0]["delta"].get("content", "")
+                        for e in event.split("\n\n") if e.startswith("data: {"))
+    assert text == "Hello Alice, that costs 5$"
+
+
+@pytest.mark.asyncio
+async def test_coalesce_stream_batches_bursts_but_not_the_first_event():
+    closed = []
+    async def events():
+        try:
+            for delay, chunk in ((0, "a"), (0, "b"), (0, "c"), (0.1, "d"), (0, "e")):
+                await asyncio.sleep(delay)
+                yield chunk
+        finally:
+            closed.append(True)
+
+    writes = [chunk async for chunk in coalesce_stream(events(), flush_interval=0.02, flush_bytes=1024)]
+    assert writes == ["a", "bc", "de"] # the pause flushed "bc" after the window instead of holding it
+    assert closed
+
+    small = [chunk async for chunk in coalesce_stream(events(), flush_interval=1, flush_bytes=2)]
+    assert small == ["a", "bc", "de"]
+    assert [chunk async for chunk in coalesce_stream(events(), 0, 0)] == list("abcde")
+
+
+@pytest.mark.asyncio
+async def test_await_or_disconnect_cancels_masking_work():
+    started, cancelled = asyncio.Event(), asyncio.Event()
+
+    async def slow_masking():
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(HTTPException) as exc_info:
+        await await_or_disconnect(FakeRequest(disconnect_after=0.05), slow_masking(), poll_interval=0.01)
+    assert exc_info.value.status_code == 499
+    assert started.is_set() and cancelled.is_set()
+
+
+@pytest.mark.asyncio
+async def test_closing_streaming_response_releases_upstream_on_disconnect(offline_config):
+    pm = PromptMask(config=offline_config)
+    upstream = FakeUpstreamResponse([sse("a"), sse("b"), sse("c")])
+    response = ClosingStreamingResponse(
+        unmask_sse_stream(upstream, {}, pm), media_type="text/event-stream", on_close=upstream.aclose
+    )
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+        if message["type"] == "http.response.body":
+            raise OSError("client disconnected")
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+    with pytest.raises(Exception):
+        await response(scope, receive, send)
+    assert upstream.closed
+
+
+def make_gateway_app(prompt_masker, upstream_handler):
+    """A bare app around the gateway router with an in-memory upstream."""
+    import httpx
+    from fastapi import FastAPI
+    from promptmask.web.gateway import router
+    from promptmask.web.cache import ResponseCache
+    from promptmask.web.offload import Offloader
+    from promptmask.web.upstreams import UpstreamRouter
+
+    app = FastAPI()
+    app.include_router(router)
+    app.state.prompt_masker = prompt_masker
+    app.state.upstreams = UpstreamRouter(transport=httpx.MockTransport(upstream_handler))
+    app.state.response_cache = ResponseCache()
+    app.state.offloader = Offloader()
+    return app
+
+
+@pytest.mark.asyncio
+async def test_gateway_falls_back_to_rules_when_masking_overruns_deadline(offline_config):
+    import httpx
+
+    pm = PromptMask(config=offline_config, backend=FakeBackend(delay=5))
+
+    seen = {}
+    def upstream(request):
+        seen["body"] = json.loads(request.content)
+        content = seen["body"]["messages"][0]["content"]
+        return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": "Re: " + content}}]})
+
+    app = make_gateway_app(pm, upstream)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        resp = await client.post(
+            "/gateway/v1/chat/completions",
+            json={"model": "m", "messages": [{"role": "user", "content": "mail me at jane@example.com"}]},
+            headers={"X-PromptMask-Deadline": "0.2"},
+        )
+
+    assert resp.status_code == 200
+    assert resp.headers["X-PromptMask-Fallback"] == "rules"
+    assert "jane@example.com" not in seen["body"]["messages"][0]["content"] # never leaves unmasked
+    assert resp.json()["choices"][0]["message"]["content"] == "Re: mail me at jane@example.com"
+
+
+@pytest.mark.asyncio
+async def test_gateway_caches_masked_responses_across_callers(offline_config):
+    import httpx
+
+    backend = FakeBackend({"Alice Smith": "USER_NAME", "Bob Jones": "USER_NAME"})
+    pm = PromptMask(config={**offline_config, "web": {"response_cache": {"enabled": True}}}, backend=backend)
+    calls = []
+    def upstream(request):
+        content = json.loads(request.content)["messages"][0]["content"]
+        calls.append(content)
+        return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": "Dear " + content}}]})
+
+    app = make_gateway_app(pm, upstream)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        async def ask(name, **params):
+            return await client.post("/gateway/v1/chat/completions", json={
+                "model": "m", "messages": [{"role": "user", "content": name}], **params})
+
+        first, second = await ask("Alice Smith", temperature=0), await ask("Bob Jones", temperature=0)
+        sampled = await ask("Bob Jones", temperature=0.7)
+        # with the client's own credentials forwarded, another key never shares a cached answer
+        other_key = await client.post("/gateway/v1/chat/completions", headers={"Authorization": "Bearer other"}, json={
+            "model": "m", "messages": [{"role": "user", "content": "Bob Jones"}], "temperature": 0})
+
+    assert calls == ["${USER_NAME}", "${USER_NAME}", "${USER_NAME}"] # the second deterministic request was served from the cache
+    assert other_key.headers["X-PromptMask-Cache"] == "miss"
+    assert (first.headers["X-PromptMask-Cache"], second.headers["X-PromptMask-Cache"]) == ("miss", "hit")
+    assert second.json()["choices"][0]["message"]["content"] == "Dear Bob Jones"
+    assert "X-PromptMask-Cache" not in sampled.headers
+
+
+@pytest.mark.asyncio
+async def test_embeddings_gateway_masks_every_input_in_one_upstream_call(offline_config):
+    import httpx
+
+    backend = FakeBackend({"Alice Smith": "USER_NAME"})
+    pm = PromptMask(config=offline_config, backend=backend)
+    bodies = []
+    def upstream(request):
+        bodies.append(json.loads(request.content))
+        return httpx.Response(200, json={"data": [{"embedding": [0.1], "index": i} for i in range(len(bodies[-1]["input"]))]})
+
+    app = make_gateway_app(pm, upstream)
+    inputs = ["Alice Smith called", "no PII here", "Alice Smith called"]
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        resp = await client.post("/gateway/v1/embeddings", json={"model": "e", "input": inputs})
+        bad = await client.post("/gateway/v1/embeddings", json={"model": "e", "input": [[1, 2, 3]]})
+
+    assert resp.status_code == 200 and len(resp.json()["data"]) == 3
+    assert bodies == [{"model": "e", "input": ["${USER_NAME} called", "no PII here", "${USER_NAME} called"]}]
+    assert sorted(backend.calls) == ["Alice Smith called", "no PII here"] # duplicates masked once
+    assert bad.status_code == 400
@@ -0,0 +1,45 @@
+# tests/test_gazetteer.py
+
+import time
+
+from promptmask import PromptMask
+from promptmask.backends import Entity, FakeBackend
+from promptmask.gazetteer import Gazetteer, trie_regex
+
+
+def test_trie_regex_prefers_longest_whole_word():
+    pattern = trie_regex(["Chan", "Chan Ho Yin", "sk-abc123", "Li"])
+    text = "Chan Ho Yin, Chan, Lin and key sk-abc123."
+    assert [m.group() for m in pattern.finditer(text)] == ["Chan Ho Yin", "Chan", "sk-abc123"]
+
+
+def test_gazetteer_scopes_ttl_and_size_limit():
+    gaz = Gazetteer(ttl=60, max_entries=2)
+    gaz.learn("a", [Entity("Alice Smith", "NAME"), Entity("Bob Jones", "NAME_2")])
+    assert gaz.find("a", "hi Alice Smith") == [Entity("Alice Smith", "NAME")]
+    assert gaz.find("b", "hi Alice Smith") == []
+
+    gaz.learn("a", [Entity("Carol King", "NAME_3")]) # evicts Bob, the least recently seen
+    assert gaz.find("a", "Bob Jones and Carol King") == [Entity("Carol King", "NAME_3")]
+
+    gaz.ttl = 0.01
+    gaz.learn("a", [Entity("Carol King", "NAME_3")])
+    time.sleep(0.02)
+    assert gaz.find("a", "Carol King") == []
+
+
+def test_known_values_skip_the_model_and_keep_their_masks(offline_config):
+    backend = FakeBackend({"Chan Ho Yin": "USER_NAME", "203.0.113.45": "IP_ADDRESS"})
+    pm = PromptMask(config={**offline_config, "gazetteer": {"enabled": True}}, backend=backend)
+
+    _, first = pm.mask_str("Chan Ho Yin logged in", scope="tenant-1")
+    masked, second = pm.mask_str("Chan Ho Yin:", scope="tenant-1")
+    assert len(backend.calls) == 1 # nothing but a known value: no model call
+    assert masked == "${USER_NAME}:" and second == first
+
+    masked, _ = pm.mask_str("Chan Ho Yin from 203.0.113.45", scope="tenant-1")
+    assert backend.calls[-1] == "${USER_NAME} from 203.0.113.45" # the model only needs the rest
+    assert masked == "${USER_NAME} from ${IP_ADDRESS}"
+
+    pm.mask_str("Chan Ho Yin:", scope="tenant-2")
+    assert backend.calls[-1] == "Chan Ho Yin:" # other scopes learn on their own
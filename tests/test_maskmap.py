@@ -0,0 +1,65 @@
+# tests/test_maskmap.py
+
+import json
+import pickle
+
+import pytest
+
+from promptmask.maskmap import MaskMap, StreamUnmasker
+
+
+def test_mask_map_is_a_compatible_dict():
+    mm = MaskMap({"Alice": "${NAME}", "alice@example.com": "${EMAIL}"})
+    assert mm == {"Alice": "${NAME}", "alice@example.com": "${EMAIL}"}
+    assert json.loads(json.dumps(mm)) == dict(mm)
+    assert pickle.loads(pickle.dumps(mm)).unmask("${NAME}") == "Alice"
+    assert MaskMap.coerce(mm) is mm
+
+
+def test_mask_and_unmask_single_pass_longest_first():
+    mm = MaskMap({"Alice": "${NAME}", "alice@example.com": "${EMAIL}", "NAME": "${WORD}"})
+    masked = mm.mask("Alice <alice@example.com> NAME")
+    assert masked == "${NAME} <${EMAIL}> ${WORD}" # inserted masks are never re-masked
+    assert mm.unmask(masked) == "Alice <alice@example.com> NAME"
+
+
+def test_mutation_invalidates_compiled_state():
+    mm = MaskMap({"Alice": "${NAME}"})
+    assert mm.unmask("${NAME}") == "Alice"
+    mm["Bob"] = "${NAME_2}"
+    assert mm.inverse["${NAME_2}"] == "Bob"
+    assert mm.mask("Bob") == "${NAME_2}"
+    assert mm.max_mask_len == len("${NAME_2}")
+
+
+def test_stream_unmasker_handles_split_and_non_mask_wrappers():
+    unmasker = StreamUnmasker({"Alice": "${NAME}"}, "${", "}")
+    pieces = ["Hi $", "{NA", "ME}! cost: ${", "price_in_dollars_and_more", " ok"]
+    out = "".join(unmasker.feed(p) for p in pieces) + unmasker.flush()
+    assert out == "Hi Alice! cost: ${price_in_dollars_and_more ok"
+    # a long non-mask "${" is released before the stream ends
+    unmasker = StreamUnmasker({"Alice": "${NAME}"}, "${", "}")
+    assert unmasker.feed("${this is not a mask at all") == "${this is not a mask at all"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("finish_in_last", [True, False])
+async def test_sdk_stream_unmasking_releases_held_back_text(offline_config, finish_in_last):
+    from openai.types.chat import ChatCompletionChunk
+    from promptmask import PromptMask
+
+    def chunks():
+        for i, content in enumerate(["Hello ${NAME}, that costs ", "5$"]):
+            finish = "stop" if finish_in_last and i == 1 else None
+            yield ChatCompletionChunk.model_validate({"id": "c", "object": "chat.completion.chunk", "created": 0, "model": "m",
+                "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": finish}]})
+
+    async def achunks():
+        for chunk in chunks():
+            yield chunk
+
+    pm = PromptMask(config=offline_config)
+    text = "".join(c.choices[0].delta.content or "" for c in pm.unmask_stream(chunks(), {"Alice": "${NAME}"}))
+    assert text == "Hello Alice, that costs 5$"
+    text = "".join([c.choices[0].delta.content or "" async for c in pm.async_unmask_stream(achunks(), {"Alice": "${NAME}"})])
+    assert text == "Hello Alice, that costs 5$"
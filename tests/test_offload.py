@@ -0,0 +1,94 @@
+# tests/test_offload.py
+
+import asyncio
+import json
+import os
+import time
+
+import httpx
+import pytest
+
+from promptmask import PromptMask
+from promptmask.backends import FakeBackend
+from promptmask.maskmap import MaskMap
+from promptmask.metrics import metrics
+from promptmask.tokens import MaskTokenCipher
+from promptmask.web import offload
+from promptmask.web.offload import Offloader, monitor_loop_lag
+
+from test_gateway import make_gateway_app
+
+MASK_MAP = {"Alice Smith": "${USER_NAME}"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["off", "thread", "process"])
+async def test_offloaded_results_match_inline(mode):
+    offloader = Offloader()
+    web_cfg = {"offload": {"mode": mode, "threshold_bytes": 10, "workers": 1}}
+    messages = [{"role": "system", "content": "Alice Smith"}, {"role": "user", "content": "Hi Alice Smith"}]
+    try:
+        masked = await offloader.run(web_cfg, 100, offload.mask_messages, messages, MASK_MAP)
+        unmasked = await offloader.run(web_cfg, 100, offload.unmask_messages, masked, MASK_MAP)
+    finally:
+        offloader.shutdown()
+    assert masked == offload.mask_messages(messages, MASK_MAP)
+    assert masked[0]["content"] == "Alice Smith" and masked[1]["content"] == "Hi ${USER_NAME}"
+    assert unmasked == messages
+
+
+@pytest.mark.asyncio
+async def test_cipher_survives_process_offload():
+    pytest.importorskip("cryptography")
+    cipher = MaskTokenCipher(os.urandom(32), "${", "}")
+    sealed = cipher.seal(MaskMap(MASK_MAP))
+    token = next(iter(sealed.values()))
+    offloader = Offloader()
+    try:
+        text = await offloader.run({"offload": {"mode": "process", "threshold_bytes": 0, "workers": 1}},
+                                   len(token), offload.unmask_text, f"Hi {token}", None, cipher)
+    finally:
+        offloader.shutdown()
+    assert text == "Hi Alice Smith"
+
+
+@pytest.mark.asyncio
+async def test_gateway_offloads_large_payloads(offline_config):
+    def upstream(request):
+        content = json.loads(request.content)["messages"][0]["content"]
+        return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": content}}]})
+
+    config = {**offline_config, "web": {**offline_config.get("web", {}), "offload": {"mode": "thread", "threshold_bytes": 1000}}}
+    pm = PromptMask(config=config, backend=FakeBackend({"Alice Smith": "USER_NAME"}))
+    app = make_gateway_app(pm, upstream)
+    big = "Alice Smith " + "x" * 5000
+    metrics.reset()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        resp = await client.post("/gateway/v1/chat/completions", json={"model": "m", "messages": [{"role": "user", "content": big}]})
+    app.state.offloader.shutdown()
+
+    assert resp.json()["choices"][0]["message"]["content"] == big
+    steps = {key for key in metrics.snapshot()["summaries"] if key.startswith("offload_seconds")}
+    assert any("mask_messages" in key for key in steps) and any("unmask_completion" in key for key in steps)
+
+
+@pytest.mark.asyncio
+async def test_loop_lag_monitor_records_blocking():
+    metrics.reset()
+    task = asyncio.create_task(monitor_loop_lag(0.01))
+    await asyncio.sleep(0.02)
+    time.sleep(0.1) # blocks the loop
+    await asyncio.sleep(0.03)
+    task.cancel()
+    snapshot = metrics.snapshot()
+    assert snapshot["gauges"]["event_loop_lag_last_seconds"] >= 0
+    assert snapshot["summaries"]["event_loop_lag_seconds"]["max"] >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_inline_steps_reuse_the_compiled_mask_map(monkeypatch):
+    compiled = MaskMap(MASK_MAP)
+    compiled.mask("warm up") # compiles its pattern
+    monkeypatch.setattr(MaskMap, "_invalidate", lambda self: pytest.fail("MaskMap rebuilt"))
+    masked = await Offloader().run({}, 10, offload.mask_text, "Hi Alice Smith", compiled)
+    assert masked == "Hi ${USER_NAME}"
@@ -0,0 +1,139 @@
+# tests/test_pool.py
+
+import time
+import pytest
+
+from promptmask import PromptMask
+from promptmask.backends import build_mask_prompt, for_model
+from promptmask.pool import Endpoint, EndpointPool, HedgePolicy, EJECT_AFTER_FAILURES
+
+
+def make_pool(n=3, **kwargs):
+    return EndpointPool([Endpoint(f"http://box{i}/v1", "k", "m", 5.0) for i in range(n)], **kwargs)
+
+
+def test_pool_prefers_less_loaded_endpoints():
+    pool = make_pool(balancer="least_outstanding")
+    busy = pool.endpoints[0]
+    busy.outstanding = 5
+    assert all(pool.pick() is not busy for _ in range(20))
+
+    p2c = make_pool(n=2)
+    p2c.endpoints[0].outstanding = 5
+    picks = [p2c.pick() for _ in range(200)]
+    assert picks.count(p2c.endpoints[1]) > picks.count(p2c.endpoints[0])
+
+
+def test_pool_ejects_failing_and_slow_endpoints_and_restores_them():
+    pool = make_pool()
+    flaky = pool.endpoints[0]
+    for _ in range(EJECT_AFTER_FAILURES):
+        flaky.record(0.1, ok=False)
+    assert not flaky.available
+    assert all(pool.pick() is not flaky for _ in range(20))
+
+    flaky.restore()
+    assert flaky.available
+
+    for ep, latency in zip(pool.endpoints, (0.1, 0.1, 5.0)):
+        ep.ewma_latency = latency
+    pool._eject_slow()
+    assert not pool.endpoints[2].available and pool.endpoints[0].available
+
+    pool.endpoints[2].ejected_until = time.monotonic() - 1 # cooldown elapsed
+    pool.pick()
+    assert pool.endpoints[2].available and pool.endpoints[2].ewma_latency is None
+
+
+@pytest.mark.asyncio
+async def test_probe_restores_failed_but_not_slow_endpoints():
+    pool = make_pool()
+    for ep in pool.endpoints:
+        async def models_ok():
+            return []
+        ep.async_client = type("Client", (), {"models": type("Models", (), {"list": staticmethod(models_ok)})})()
+    failed, slow = pool.endpoints[0], pool.endpoints[2]
+    for ep, latency in zip(pool.endpoints, (0.1, 0.1, 5.0)):
+        ep.ewma_latency = latency
+    pool._eject_slow()
+    failed.eject("down")
+    assert not slow.available
+
+    await pool.probe()
+    assert failed.available
+    assert not slow.available and slow.ewma_latency == 5.0 # /models answering says nothing about generation speed
+
+
+def test_pool_from_config_reuses_clients(offline_config):
+    offline_config["llm_api"]["endpoints"] = [{"base": "http://box1/v1"}, {"base": "http://box2/v1", "model": "other", "weight": 2}]
+    pm = PromptMask(config=offline_config)
+    pool = pm._snapshot.pool
+    assert [ep.model for ep in pool.endpoints] == ["test-model", "other"]
+
+    pm._initialize_clients()
+    assert pm._snapshot.pool.endpoints[1] is pool.endpoints[1]
+
+
+def test_failed_reload_leaves_the_running_pool_unchanged(offline_config):
+    offline_config["llm_api"]["endpoints"] = [{"base": "http://box1/v1"}, {"base": "http://box2/v1", "model": "other"}]
+    pm = PromptMask(config=offline_config)
+    snapshot = pm._snapshot
+    box2 = snapshot.pool.endpoints[1]
+
+    changed = {**offline_config, "llm_api": {**offline_config["llm_api"], "endpoints": [
+        {"base": "http://box1/v1"}, {"base": "http://box2/v1", "model": "newer", "weight": 5}]}}
+    pm._init_config_override = {**changed, "prompt": {"example_profile": "nope"}} # fails after the pool is built
+    with pytest.raises(ValueError):
+        pm._initialize_clients()
+    assert pm._snapshot is snapshot
+    assert (box2.model, box2.configured_model, box2.weight) == ("other", "other", 1.0)
+
+    pm._init_config_override = changed
+    pm._initialize_clients()
+    reloaded = pm._snapshot.pool.endpoints
+    assert reloaded[0] is snapshot.pool.endpoints[0] # unchanged: same endpoint
+    assert reloaded[1].client is box2.client and (reloaded[1].model, reloaded[1].weight) == ("newer", 5.0)
+    assert box2.model == "other" # in-flight calls of the old snapshot keep their model
+
+
+def test_model_specific_prompt_is_applied_per_endpoint(offline_config):
+    pm = PromptMask(config=offline_config)
+    messages = build_mask_prompt("hello", pm.config)
+    assert for_model(messages, "llama3", pm.config) is messages
+    assert for_model(messages, "qwen3:4b", pm.config)[0]["content"].startswith("/no_think")
+
+
+@pytest.mark.asyncio
+async def test_hedged_call_takes_fastest_endpoint_and_cancels_loser(offline_config):
+    import asyncio
+
+    offline_config["llm_api"].update(hedge=True, balancer="least_outstanding",
+                                     endpoints=[{"base": "http://slow/v1"}, {"base": "http://fast/v1"}])
+    pm = PromptMask(config=offline_config)
+    for _ in range(HedgePolicy.MIN_SAMPLES):
+        pm._hedge.observe(0.01)
+    cancelled = []
+
+    async def fake_call(ep, messages):
+        if "slow" in ep.base:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(ep.base)
+                raise
+        return '<mask_mapping>{"${NAME}":"Alice"}</mask_mapping>'
+    pm._snapshot.backend.chat_on = fake_call
+
+    masked, mask_map = await asyncio.wait_for(pm.async_mask_str("Hi Alice"), 2)
+    assert masked == "Hi ${NAME}"
+    assert cancelled == ["http://slow/v1"]
+
+
+def test_hedge_budget_caps_duplicates():
+    policy = HedgePolicy(budget=0.1, burst=1.0)
+    policy._tokens = 0.0
+    granted = 0
+    for _ in range(100):
+        policy.on_request()
+        granted += policy.try_acquire()
+    assert granted == 10
@@ -0,0 +1,50 @@
+# tests/test_prefilter.py
+
+import pytest
+
+from promptmask import PromptMask
+from promptmask.backends import FakeBackend
+from promptmask.metrics import metrics
+from promptmask.prefilter import is_benign
+
+
+@pytest.mark.parametrize("text", [
+    "How are you?", "continue", "thanks, now summarize", "I don't get it. Why?", "Thanks! Make it shorter.",
+])
+def test_plain_chat_turns_are_benign(text):
+    assert is_benign(text)
+
+
+@pytest.mark.parametrize("text", [
+    "Call me at 555 1234",              # digits
+    "mail jane@example.com",            # symbols / rule match
+    "Ask Alice about it",               # capitalized mid-sentence: probably a name
+    "Alice is sick.",                   # a name starting a sentence
+    "thanks. Bob quit today.",
+    "Paris is nice.",
+    "请总结一下",                         # non-ASCII text is left to the model
+    "summarize " * 10,                  # too long
+    "",
+])
+def test_anything_identifying_goes_to_the_model(text):
+    assert not is_benign(text)
+
+
+def test_limits_and_capitalized_words_are_configurable():
+    assert is_benign("Ask Alice about it", allow_capitalized=True)
+    assert not is_benign("thanks, now summarize", max_words=2)
+
+
+def test_prefilter_skips_the_backend_when_enabled(offline_config):
+    backend = FakeBackend({"Alice Smith": "USER_NAME"})
+    pm = PromptMask(config={**offline_config, "prefilter": {"enabled": True}}, backend=backend)
+    metrics.reset()
+    assert pm.mask_str("thanks, now summarize") == ("thanks, now summarize", {})
+    assert pm.mask_str("Alice Smith says hi")[0] == "${USER_NAME} says hi"
+    assert backend.calls == ["Alice Smith says hi"]
+    counters = metrics.snapshot()["counters"]
+    assert counters["prefilter_checked_total"] == 2 and counters["prefilter_skipped_total"] == 1
+
+    off = PromptMask(config=offline_config, backend=FakeBackend())
+    off.mask_str("continue")
+    assert off._snapshot.backend.calls == ["continue"] # disabled by default
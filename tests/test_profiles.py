@@ -0,0 +1,63 @@
+# tests/test_profiles.py
+
+import json
+
+import httpx
+import pytest
+
+from promptmask import PromptMask
+from promptmask.backends import FakeBackend, OpenAIBackend, build_mask_prompt
+
+from test_gateway import make_gateway_app
+
+PROFILES = {"legal": {"sensitive": {"include": "case numbers"}, "mask_wrapper": {"left": "__", "right": "__"}}}
+
+
+def test_profiles_share_clients_but_not_prompts(offline_config):
+    pm = PromptMask(config={**offline_config, "profiles": PROFILES})
+    legal = pm.profile("legal")
+    assert pm.profile(None) is pm
+    with pytest.raises(KeyError):
+        pm.profile("nope")
+
+    base_snap, legal_snap = pm._snapshot, legal._snapshot
+    assert isinstance(legal_snap.backend, OpenAIBackend) and legal_snap.pool is base_snap.pool
+    assert legal.config["web"] is pm.config["web"] # shared sections are not copied
+    assert "case numbers" in build_mask_prompt("x", legal.config)[0]["content"]
+    assert "case numbers" not in build_mask_prompt("x", pm.config)[0]["content"]
+    assert build_mask_prompt("x", legal.config)[0] is build_mask_prompt("y", legal.config)[0] # compiled once
+
+    with pytest.raises(ValueError):
+        PromptMask(config={**offline_config, "profiles": {"bad": {"llm_api": {"model": "other"}}}})
+
+
+def test_profile_gazetteer_namespaces_are_separate(offline_config):
+    backend = FakeBackend({"Alice Smith": "USER_NAME"})
+    pm = PromptMask(config={**offline_config, "profiles": PROFILES, "gazetteer": {"enabled": True}}, backend=backend)
+    assert pm.profile("legal").mask_str("Alice Smith", scope="t")[0] == "__USER_NAME__"
+    pm.mask_str("Alice Smith", scope="t")
+    assert backend.calls == ["Alice Smith", "Alice Smith"] # the default profile learned nothing from "legal"
+
+
+@pytest.mark.asyncio
+async def test_gateway_selects_profile_by_header_or_path(offline_config):
+    sent = []
+    def upstream(request):
+        sent.append(json.loads(request.content)["messages"][0]["content"])
+        return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": sent[-1]}}]})
+
+    from promptmask.web.gateway import ProfilePathMiddleware
+    pm = PromptMask(config={**offline_config, "profiles": PROFILES}, backend=FakeBackend({"Alice Smith": "USER_NAME"}))
+    app = make_gateway_app(pm, upstream)
+    app.add_middleware(ProfilePathMiddleware)
+    body = {"model": "m", "messages": [{"role": "user", "content": "Alice Smith"}]}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        by_path = await client.post("/p/legal/gateway/v1/chat/completions", json=body)
+        by_header = await client.post("/gateway/v1/chat/completions", json=body, headers={"X-PromptMask-Profile": "legal"})
+        default = await client.post("/gateway/v1/chat/completions", json=body)
+        unknown = await client.post("/p/nope/gateway/v1/chat/completions", json=body)
+
+    assert sent == ["__USER_NAME__", "__USER_NAME__", "${USER_NAME}"]
+    assert by_path.json()["choices"][0]["message"]["content"] == "Alice Smith"
+    assert by_header.status_code == default.status_code == 200
+    assert unknown.status_code == 404
@@ -0,0 +1,46 @@
+# tests/test_replay.py
+
+import time
+
+import pytest
+
+from promptmask import PromptMask
+from promptmask.replay import ReplayBackend
+
+
+class CannedLLM:
+    """Answers every masking prompt with the same raw response."""
+    signature = ("canned",)
+
+    def __init__(self, response):
+        self.response, self.calls = response, 0
+
+    def complete(self, messages):
+        self.calls += 1
+        time.sleep(0.05)
+        return self.response
+
+    async def acomplete(self, messages):
+        return self.complete(messages)
+
+    async def warm_up(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_recorded_responses_replay_without_a_model(offline_config, tmp_path):
+    cfg = {**offline_config, "backend": {"replay": "record", "replay_file": str(tmp_path / "rec.jsonl")}}
+    llm = CannedLLM('<mask_mapping>{"${USER_NAME}": "Alice Smith"}</mask_mapping>')
+    recorder = PromptMask(config=cfg, backend=ReplayBackend(PromptMask(config=cfg, backend=llm).config, llm))
+    recorded = recorder.mask_str("Hi, I am Alice Smith")
+    assert recorded == ("Hi, I am ${USER_NAME}", {"Alice Smith": "${USER_NAME}"})
+    assert await recorder.async_mask_str("Alice Smith here") == ("${USER_NAME} here", {"Alice Smith": "${USER_NAME}"})
+
+    cfg["backend"] = {**cfg["backend"], "replay": "replay", "replay_latency": True}
+    replayer = PromptMask(config=cfg)
+    assert isinstance(replayer._snapshot.backend, ReplayBackend) and replayer._snapshot.backend.inner is None
+    start = time.perf_counter()
+    assert replayer.mask_str("Hi, I am Alice Smith") == recorded
+    assert time.perf_counter() - start >= 0.04 # the recorded latency is simulated
+    assert llm.calls == 2
+    assert replayer.mask_str("never recorded")[1] == {"err": "ReplayMiss"}
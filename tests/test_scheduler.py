@@ -0,0 +1,97 @@
+# tests/test_scheduler.py
+
+import asyncio
+import pytest
+
+from promptmask.scheduler import MaskScheduler, QueueFullError
+
+
+@pytest.mark.asyncio
+async def test_scheduler_limits_concurrency_and_prioritizes_interactive():
+    sched = MaskScheduler(max_concurrency=1, max_queue=10)
+    order = []
+
+    async def job(name, priority, hold=0.01):
+        async with sched.slot(priority):
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    first = asyncio.create_task(job("first", "batch", hold=0.05))
+    await asyncio.sleep(0) # let it take the only slot
+    queued = [asyncio.create_task(job("batch", "batch")), asyncio.create_task(job("interactive", "interactive"))]
+    await asyncio.sleep(0)
+    assert sched.active == 1 and sched.queued == 2
+
+    await asyncio.gather(first, *queued)
+    assert order == ["first", "interactive", "batch"]
+    assert sched.active == 0 and sched.queued == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_rejects_fast_when_queue_full():
+    sched = MaskScheduler(max_concurrency=1, max_queue=1)
+    await sched.acquire()
+    waiter = asyncio.create_task(sched.acquire())
+    await asyncio.sleep(0)
+    with pytest.raises(QueueFullError):
+        await sched.acquire()
+
+    waiter.cancel() # cancelled waiters leave the queue
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert sched.queued == 0
+    sched.release()
+    assert sched.active == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_rejects_after_max_queue_wait():
+    sched = MaskScheduler(max_concurrency=1, max_queue=5, max_queue_wait=0.02)
+    await sched.acquire()
+    with pytest.raises(QueueFullError):
+        await sched.acquire()
+    assert sched.queued == 0
+
+
+def test_adaptive_limit_grows_when_latency_is_flat_and_backs_off_on_timeout():
+    sched = MaskScheduler(max_concurrency=8)
+    sched.configure(max_concurrency=8, adaptive=True, min_concurrency=1)
+    assert sched.limit == 1
+
+    for _ in range(50):
+        sched.adaptive.on_sample(0.1, inflight=sched.limit)
+    grown = sched.limit
+    assert 1 < grown <= 8
+
+    sched.adaptive.on_sample(15.0, inflight=grown, timed_out=True)
+    assert sched.limit < grown
+
+    sched.reset()
+    assert sched.limit == 1
+
+
+def test_adaptive_limit_backs_off_when_latency_inflates():
+    sched = MaskScheduler()
+    sched.configure(max_concurrency=16, adaptive=True, min_concurrency=2)
+    for _ in range(100):
+        sched.adaptive.on_sample(0.1, inflight=sched.limit)
+    peak = sched.adaptive.limit
+    for _ in range(20):
+        sched.adaptive.on_sample(1.0, inflight=sched.limit)
+    assert 2 <= sched.adaptive.limit < peak
+
+
+@pytest.mark.asyncio
+async def test_scheduler_reconfigure_from_another_thread_wakes_waiters_on_the_loop():
+    loop = asyncio.get_running_loop()
+    loop.set_debug(True) # makes cross-thread future access raise
+    sched = MaskScheduler(max_concurrency=1)
+    await sched.acquire()
+    waiter = asyncio.create_task(sched.acquire())
+    await asyncio.sleep(0)
+    assert sched.queued == 1
+
+    await loop.run_in_executor(None, sched.configure, 2) # like a config reload
+    await asyncio.wait_for(waiter, 1)
+    assert sched.active == 2 and sched.queued == 0
+    loop.set_debug(False)
@@ -0,0 +1,78 @@
+# tests/test_tokens.py
+
+import base64
+import os
+
+import pytest
+
+pytest.importorskip("cryptography")
+
+from promptmask import PromptMask
+from promptmask.backends import FakeBackend
+from promptmask.tokens import MaskTokenCipher
+
+ENTITIES = {"alice@example.com": "USER_EMAIL", "Alice": "USER_2_NAME"}
+
+
+@pytest.fixture
+def encrypted_config(offline_config):
+    key = base64.b64encode(os.urandom(64)).decode()
+    return {**offline_config, "mask_token": {"mode": "encrypted", "key": key}}
+
+
+def test_tokens_round_trip_and_reject_tampering():
+    cipher = MaskTokenCipher(os.urandom(32), "${", "}")
+    token = cipher.encrypt("USER_2_NAME", "Zoë")
+    assert token.startswith("${USER_2_NAME_") and token.endswith("}")
+    assert cipher.encrypt("USER_2_NAME", "Zoë") == token # deterministic, stable across turns
+    assert cipher.decrypt(token) == "Zoë"
+
+    relabeled = token.replace("USER_2_NAME", "USER_3_NAME") # the label is authenticated
+    assert cipher.decrypt(relabeled) is None
+    assert MaskTokenCipher(os.urandom(32), "${", "}").decrypt(token) is None # other key
+    assert cipher.unmask(f"hi {relabeled} / {token}") == f"hi {relabeled} / Zoë"
+
+
+def test_any_instance_with_the_key_unmasks_without_the_map(encrypted_config):
+    masker = PromptMask(config=encrypted_config, backend=FakeBackend(ENTITIES))
+    masked, mask_map = masker.mask_str("Alice <alice@example.com>")
+    assert "alice" not in masked.lower()
+
+    replica = PromptMask(config=encrypted_config)
+    reply = f"Hello {mask_map['Alice']}, we wrote to {mask_map['alice@example.com']}."
+    assert replica.unmask_str(reply) == "Hello Alice, we wrote to alice@example.com."
+
+    unmasker = replica._stream_unmasker(None)
+    streamed = "".join(unmasker.feed(reply[i:i + 5]) for i in range(0, len(reply), 5)) + unmasker.flush()
+    assert streamed == "Hello Alice, we wrote to alice@example.com."
+
+
+def test_plain_mode_is_unchanged(offline_config):
+    masker = PromptMask(config=offline_config, backend=FakeBackend(ENTITIES))
+    masked, mask_map = masker.mask_str("Alice <alice@example.com>")
+    assert masked == "${USER_2_NAME} <${USER_EMAIL}>"
+    assert masker.unmask_str(masked) == masked # plain masks need the map
+    assert masker.unmask_str(masked, mask_map) == "Alice <alice@example.com>"
+
+
+def test_encrypted_mode_requires_a_key(offline_config):
+    with pytest.raises(ValueError):
+        PromptMask(config={**offline_config, "mask_token": {"mode": "encrypted"}})
+    with pytest.raises(ValueError):
+        MaskTokenCipher.from_config({"mask_token": {"mode": "encrypted", "key": base64.b64encode(b"short").decode()},
+                                     "mask_wrapper": {"left": "${", "right": "}"}})
+
+
+def test_token_key_is_redacted_and_not_saved_from_env(monkeypatch):
+    from promptmask.config import REDACTED, load_config, redact_secrets, restore_secrets
+    key = base64.b64encode(os.urandom(32)).decode()
+    monkeypatch.setenv("PROMPTMASK_TOKEN_KEY", key)
+    config = load_config({"profiles": {"legal": {"mask_token": {"key": "profile-key"}}}})
+    shown = redact_secrets(config)
+    assert shown["mask_token"]["key"] == REDACTED
+    assert shown["profiles"]["legal"]["mask_token"]["key"] == REDACTED
+    assert key not in str(shown)
+
+    restored = restore_secrets(shown, {"profiles": {"legal": {"mask_token": {"key": "profile-key"}}}})
+    assert "key" not in restored["mask_token"]
+    assert restored["profiles"]["legal"]["mask_token"]["key"] == "profile-key"
@@ -0,0 +1,60 @@
+# tests/test_upstreams.py
+
+import httpx
+import pytest
+
+from promptmask import PromptMask
+from promptmask.backends import FakeBackend
+from promptmask.metrics import metrics
+from promptmask.web.upstreams import UpstreamRouter
+
+from test_gateway import make_gateway_app
+
+WEB_CFG = {
+    "upstream_oai_api_base": "http://default.test/v1",
+    "http_client": {"max_connections": 10},
+    "upstreams": {"claude": {"base": "http://claude.test/v1/", "models": ["claude-*"], "key": "upstream-key"}},
+}
+
+@pytest.mark.asyncio
+async def test_router_routes_by_model_glob_and_keeps_clients_across_reloads():
+    router = UpstreamRouter()
+    claude = router.route(WEB_CFG, "claude-3-haiku")
+    assert claude.name == "claude" and claude.url("chat/completions") == "http://claude.test/v1/chat/completions"
+    assert router.route(WEB_CFG, "gpt-4o").name == "default"
+    assert router.route(WEB_CFG, None).name == "default"
+
+    reloaded = {**WEB_CFG, "upstreams": {"claude": {**WEB_CFG["upstreams"]["claude"], "models": ["claude-3-*"]}}}
+    assert router.route(reloaded, "claude-3-opus") is claude # same connection settings: same pooled client
+    assert router.route(reloaded, "claude-2").name == "default"
+
+    resized = {**reloaded, "http_client": {"max_connections": 20}}
+    replaced = router.route(resized, "claude-3-opus")
+    assert replaced is not claude and replaced.max_connections == 20
+    assert claude.retired
+    await router.aclose()
+
+
+@pytest.mark.asyncio
+async def test_gateway_sends_to_the_routed_upstream_with_its_key(offline_config):
+    seen = []
+    def upstream(request):
+        seen.append((str(request.url), request.headers.get("authorization")))
+        return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": "ok"}}]})
+
+    pm = PromptMask(config={**offline_config, "web": WEB_CFG}, backend=FakeBackend())
+    app = make_gateway_app(pm, upstream)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        for model in ("claude-3-haiku", "gpt-4o"):
+            resp = await client.post("/gateway/v1/chat/completions", headers={"Authorization": "Bearer client-key"},
+                                     json={"model": model, "messages": [{"role": "user", "content": "hi"}]})
+            assert resp.status_code == 200
+
+    assert seen == [
+        ("http://claude.test/v1/chat/completions", "Bearer upstream-key"),
+        ("http://default.test/v1/chat/completions", "Bearer client-key"),
+    ]
+    gauges, counters = metrics.snapshot()["gauges"], metrics.snapshot()["counters"]
+    assert gauges['upstream_inflight{upstream="claude"}'] == 0
+    assert counters['upstream_requests_total{status="200",upstream="claude"}'] >= 1
+    await app.state.upstreams.aclose()
@@ -0,0 +1,54 @@
+# tests/test_warmup.py
+
+import json
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+from promptmask import PromptMask
+
+COMPLETION = {
+    "id": "x", "object": "chat.completion", "created": 0, "model": "test-model",
+    "choices": [{"index": 0, "finish_reason": "length", "message": {"role": "assistant", "content": "<"}}],
+}
+
+
+def mock_local_llm(pm: PromptMask, status: int = 200):
+    requests = []
+    def handler(request: httpx.Request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(status, json=COMPLETION if status == 200 else {"error": {"message": "loading"}})
+    for ep in pm._snapshot.pool.endpoints:
+        ep.async_client = AsyncOpenAI(base_url=ep.base, api_key="k", max_retries=0,
+                                      http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return requests
+
+
+@pytest.mark.asyncio
+async def test_ready_after_warm_up_until_the_prompt_changes(offline_config):
+    pm = PromptMask(config=offline_config)
+    requests = mock_local_llm(pm)
+    assert not pm.ready
+
+    await pm.warm_up()
+    assert pm.ready
+    assert requests[0]["max_tokens"] == 1
+    assert requests[0]["messages"][0]["role"] == "system" # the static prefix the server can cache
+
+    pm._init_config_override = {**offline_config, "sensitive": {"include": "only passwords"}}
+    pm._initialize_clients()
+    assert not pm.ready # a new prompt prefix is cold again
+
+
+@pytest.mark.asyncio
+async def test_failed_warm_up_keeps_readiness_failing(offline_config):
+    pm = PromptMask(config=offline_config)
+    mock_local_llm(pm, status=503)
+    with pytest.raises(Exception):
+        await pm.warm_up()
+    assert not pm.ready
+
+    pm._init_config_override = {**offline_config, "llm_api": {**offline_config["llm_api"], "warmup": False}}
+    pm._initialize_clients()
+    assert pm.ready